@@ -1,33 +1,76 @@
 # Used for imports
 
+import time
+_import_start = time.perf_counter()
+
 import asyncio
 import aiohttp
+import importlib
 import os
 import sys
 
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
-from pipecat.processors.aggregators.llm_response import (
-    LLMAssistantResponseAggregator, LLMUserResponseAggregator)
-from pipecat.processors.frameworks.langchain import LangchainProcessor
-from pipecat.services.elevenlabs import ElevenLabsTTSService
-from pipecat.services.deepgram import DeepgramSTTService 
-from pipecat.vad.silero import SileroVADAnalyzer
-from langchain_core.runnables.base import RunnableLambda
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from openai import AsyncOpenAI
 from langchain_core.runnables.utils import AddableDict
 import random
+from concurrent.futures import ThreadPoolExecutor
 
 
-from custom_classes.custom_wake_word import CustomWakeCheckFilter
-from custom_classes.custom_websocket_transport import WebsocketServerParams, CustomWebsocketServerTransport
+from custom_classes.custom_wake_word import CustomWakeCheckFilter, PorcupinePool
+from custom_classes.custom_keywords import KeywordFilter, KeywordRegistry
+from custom_classes.custom_websocket_transport import (
+    WebsocketServerParams, CustomWebsocketServerTransport, CustomWebsocketSessionServer)
+from custom_classes.custom_vad_scheduler import VADBatchScheduler
+from custom_classes.custom_metrics import LatencyProbe
+from utils.metrics import metrics, serve_metrics
+from pipecat.frames.frames import TextFrame, TranscriptionFrame
 
 
 from loguru import logger
 
 from dotenv import load_dotenv
 load_dotenv(override=True)
+
+# `from __init__ import *` only brings in the names above
+__all__ = [name for name in globals() if not name.startswith("_")]
+
+# Service modules (STT/TTS clients, Silero and onnxruntime, LangChain, OpenAI) are only imported
+# the first time one of their names is used, e.g. `from __init__ import ElevenLabsTTSService`
+# inside a function, so the process starts without paying for all of them.
+# utils/startup.py imports them in the background before the server opens its port
+LAZY_IMPORTS = {
+    "LLMAssistantResponseAggregator": "pipecat.processors.aggregators.llm_response",
+    "LLMUserResponseAggregator": "pipecat.processors.aggregators.llm_response",
+    "LangchainProcessor": "pipecat.processors.frameworks.langchain",
+    "ElevenLabsTTSService": "pipecat.services.elevenlabs",
+    "CachedElevenLabsTTSService": "custom_classes.custom_tts",
+    "DeepgramSTTService": "pipecat.services.deepgram",
+    "PooledDeepgramSTTService": "custom_classes.custom_stt",
+    "deepgram_connection_pool": "custom_classes.custom_stt",
+    "SileroVADAnalyzer": "pipecat.vad.silero",
+    "RunnableGenerator": "langchain_core.runnables.base",
+    "RunnableLambda": "langchain_core.runnables.base",
+    "RunnableWithMessageHistory": "langchain_core.runnables.history",
+    "ChatMessageHistory": "langchain_community.chat_message_histories",
+    "AsyncOpenAI": "openai",
+}
+
+# Seconds spent importing, "__init__" for the eager imports above and one entry per lazy module
+import_times: dict[str, float] = {"__init__": time.perf_counter() - _import_start}
+
+
+def __getattr__(name: str):
+    module_name = LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_times.setdefault(module_name, time.perf_counter() - start)
+
+    # Cache the name so the next lookup does not come through here
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,171 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""
+First-utterance latency of new sessions with and without reused backend connections.
+
+Starts two local stand-ins: a streaming STT websocket server that answers every utterance
+(`--utterance-secs` of audio) with a final transcript, and a TTS HTTP server that answers
+every request with audio. The STT handshake is delayed by `--connect-ms` to stand in for the
+DNS/TCP/TLS/websocket setup of a remote service. `--sessions` sessions start one after the
+other (`--interval-ms` apart). Each session sends its first utterance to STT right away and
+asks TTS for a reply once the transcript arrives:
+
+- fresh: every session opens its own STT websocket and its own aiohttp.ClientSession (what
+  happened before the pools)
+- pooled: STT websockets are leased from a WarmConnectionPool and every session shares the
+  HTTPSessionManager's session
+
+Reports the time from session start to the transcript and to the first TTS audio, the
+connections each server accepted, and the pool hits.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_connection_pool --sessions 20 --connect-ms 150
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+import websockets
+
+from aiohttp import web
+
+from utils.connections import HTTPSessionManager, WarmConnectionPool
+from utils.metrics import PipelineMetrics
+
+SAMPLE_RATE = 16000
+# 20ms of audio per message
+CHUNK_BYTES = SAMPLE_RATE // 50 * 2
+
+
+class StandInServers:
+    """Local STT websocket and TTS HTTP servers that count the connections they accept."""
+    def __init__(self, connect_ms: float, utterance_bytes: int):
+        self.connect_secs = connect_ms / 1000
+        self.utterance_bytes = utterance_bytes
+        self.stt_connections = 0
+        self.tts_connections: set[int] = set()
+
+    async def start(self):
+        self._stt = await websockets.serve(self._stt_handler, "localhost", 0, process_request=self._handshake)
+        self.stt_url = f"ws://localhost:{self._stt.sockets[0].getsockname()[1]}/v1/listen"
+
+        app = web.Application()
+        app.router.add_post("/v1/text-to-speech", self._tts_handler)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "localhost", 0)
+        await site.start()
+        self.tts_url = f"http://localhost:{site._server.sockets[0].getsockname()[1]}/v1/text-to-speech"
+
+    async def stop(self):
+        self._stt.close()
+        await self._stt.wait_closed()
+        await self._runner.cleanup()
+
+    async def _handshake(self, path, headers):
+        await asyncio.sleep(self.connect_secs)
+        self.stt_connections += 1
+
+    async def _stt_handler(self, websocket, path):
+        received = 0
+        async for message in websocket:
+            received += len(message)
+            if received >= self.utterance_bytes:
+                received = 0
+                await websocket.send(json.dumps({"is_final": True, "transcript": "what is the weather"}))
+
+    async def _tts_handler(self, request: web.Request) -> web.Response:
+        self.tts_connections.add(id(request.transport))
+        return web.Response(body=bytes(SAMPLE_RATE // 5 * 2), content_type="application/octet-stream")
+
+
+async def session(servers: StandInServers, pool: WarmConnectionPool | None, http: HTTPSessionManager | None) -> dict:
+    start = time.perf_counter()
+    websocket = await pool.lease() if pool else await websockets.connect(servers.stt_url)
+    http_session = http.get() if http else aiohttp.ClientSession()
+    try:
+        audio = bytes(CHUNK_BYTES)
+        for _ in range(servers.utterance_bytes // CHUNK_BYTES):
+            await websocket.send(audio)
+        json.loads(await websocket.recv())
+        transcript = time.perf_counter() - start
+
+        async with http_session.post(servers.tts_url, json={"text": "It is sunny."}) as response:
+            await response.content.read(1)
+        audio_out = time.perf_counter() - start
+    finally:
+        if pool:
+            await pool.release(websocket)
+        else:
+            await websocket.close()
+        if not http:
+            await http_session.close()
+    return {"transcript": transcript * 1000, "audio": audio_out * 1000}
+
+
+async def run(pooled: bool, args) -> dict:
+    servers = StandInServers(args.connect_ms, int(args.utterance_secs * SAMPLE_RATE) * 2)
+    await servers.start()
+
+    registry = PipelineMetrics()
+    pool = http = None
+    if pooled:
+        pool = WarmConnectionPool("stt", lambda: websockets.connect(servers.stt_url), lambda ws: ws.close(),
+                                  is_alive=lambda ws: ws.open, size=args.pool_size, settle_secs=0.1,
+                                  registry=registry)
+        http = HTTPSessionManager()
+        pool.start()
+        # Like the server does before opening its port
+        await http.warm([servers.tts_url.rsplit("/", 2)[0]])
+        while pool.idle < args.pool_size:
+            await asyncio.sleep(0.01)
+
+    results = []
+    for _ in range(args.sessions):
+        results.append(await session(servers, pool, http))
+        await asyncio.sleep(args.interval_ms / 1000)
+
+    if pooled:
+        await pool.close()
+        await http.close()
+    await servers.stop()
+    return {
+        "transcript": statistics.median(r["transcript"] for r in results),
+        "audio": statistics.median(r["audio"] for r in results),
+        "first_audio": results[0]["audio"],
+        "stt_connections": servers.stt_connections,
+        "tts_connections": len(servers.tts_connections),
+        "hits": registry.counter("stt_pool_hits"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--connect-ms", type=float, default=150, help="stand-in STT connection setup time")
+    parser.add_argument("--utterance-secs", type=float, default=1.0)
+    parser.add_argument("--interval-ms", type=float, default=200, help="time between sessions")
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions, {args.connect_ms}ms STT connection setup, pool of {args.pool_size}")
+    print(f"{'mode':>8}{'transcript p50':>16}{'tts audio p50':>15}{'first session':>15}"
+          f"{'stt conns':>11}{'tts conns':>11}{'pool hits':>11}")
+    for pooled in (False, True):
+        result = asyncio.run(run(pooled, args))
+        print(f"{'pooled' if pooled else 'fresh':>8}{result['transcript']:>14.1f}ms{result['audio']:>13.1f}ms"
+              f"{result['first_audio']:>13.1f}ms{result['stt_connections']:>11}{result['tts_connections']:>11}"
+              f"{result['hits']:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""
+Microbenchmark of how 512 sample frames are handed to Porcupine.
+
+Compares the previous path (format string + `struct.unpack` + `list` + 512 element slices)
+with int16 `memoryview` casts over the audio bytes, both followed by the C array conversion
+`Porcupine.process` does with a sequence (one Python int per sample, so the views alone do not
+make Porcupine cheaper), and with the path `porcupine_process` takes: the frame's bytes copied
+into the C array in one go. Each path is measured on its own ("split") and followed by the
+conversion ("to C array"), reporting frames/sec and the bytes allocated (tracemalloc peak) per frame.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_frame_views
+"""
+
+import argparse
+import ctypes
+import random
+import struct
+import time
+import tracemalloc
+
+FRAME_LENGTH = 512
+
+
+def legacy_frames(audio: bytes):
+    linear_audio = struct.unpack(str(len(audio) // 2) + 'h', audio)
+    linear_audio = list(linear_audio)
+    for i in range(0, len(linear_audio) - FRAME_LENGTH + 1, FRAME_LENGTH):
+        yield linear_audio[i:i + FRAME_LENGTH]
+
+
+def view_frames(audio: bytes):
+    view = memoryview(audio)
+    frame_bytes = FRAME_LENGTH * 2
+    for i in range(0, len(view) - frame_bytes + 1, frame_bytes):
+        yield view[i:i + frame_bytes].cast('h')
+
+
+def byte_frames(audio: bytes):
+    view = memoryview(audio)
+    frame_bytes = FRAME_LENGTH * 2
+    for i in range(0, len(view) - frame_bytes + 1, frame_bytes):
+        yield view[i:i + frame_bytes]
+
+
+def consume_len(pcm) -> int:
+    return len(pcm)
+
+
+def consume_sequence(pcm) -> int:
+    # Same conversion `pvporcupine.Porcupine.process` does before calling into the library
+    (ctypes.c_short * len(pcm))(*pcm)
+    return len(pcm)
+
+
+def consume_bytes(frame) -> int:
+    # What `porcupine_process` hands the library instead
+    (ctypes.c_short * FRAME_LENGTH).from_buffer_copy(frame)
+    return FRAME_LENGTH
+
+
+def measure(frames, consume, audio: bytes, iterations: int) -> tuple[float, float]:
+    frames_per_chunk = len(audio) // (FRAME_LENGTH * 2)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for pcm in frames(audio):
+            consume(pcm)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for pcm in frames(audio):
+        consume(pcm)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return iterations * frames_per_chunk / elapsed, peak / frames_per_chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=4, help="512 sample frames per audio chunk")
+    parser.add_argument("--iterations", type=int, default=5000, help="audio chunks per measurement")
+    args = parser.parse_args()
+
+    audio = struct.pack(str(args.frames * FRAME_LENGTH) + 'h',
+                        *(random.randint(-32768, 32767) for _ in range(args.frames * FRAME_LENGTH)))
+
+    paths = (("struct.unpack + list", legacy_frames, consume_sequence),
+             ("memoryview.cast('h')", view_frames, consume_sequence),
+             ("bytes, from_buffer_copy", byte_frames, consume_bytes))
+    print(f"{'path':<28}{'stage':<12}{'frames/sec':>14}{'bytes/frame':>14}")
+    for path_name, frames, convert in paths:
+        for stage, consume in (("split", consume_len), ("to C array", convert)):
+            fps, allocated = measure(frames, consume, audio, args.iterations)
+            print(f"{path_name:<28}{stage:<12}{fps:>14.0f}{allocated:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""
+Per-frame cost of the wake word filter's idle path over a long stream.
+
+Feeds 32ms (512 sample) frames through `CustomWakeCheckFilter.process_frame` as if the
+participant kept talking but never said the wake word: one speech segment is opened at the
+start, so every frame is buffered and handed to Porcupine (a FakePorcupine that never fires and,
+with the default `--porcupine-ms 0`, costs next to nothing, so the filter's own overhead shows).
+Reports the average cost per frame and the audio the participant's buffer retains for each
+minute of audio. Both should stay flat however long the session runs.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_idle_accumulator --minutes 30
+"""
+
+import argparse
+import asyncio
+import time
+
+from pipecat.frames.frames import AudioRawFrame
+from pipecat.processors.frame_processor import FrameDirection
+
+from benchmarks.fakes import FRAME_LENGTH, SAMPLE_RATE, FakePorcupinePool
+from custom_classes.custom_frames import ParticipantJoinedFrame, SpeechSegmentStartedFrame
+from custom_classes.custom_wake_word import CustomWakeCheckFilter
+
+FRAMES_PER_MINUTE = SAMPLE_RATE * 60 // FRAME_LENGTH
+PARTICIPANT = "bench"
+
+
+async def run(minutes: int, buffer_secs: float, porcupine_ms: float):
+    pool = FakePorcupinePool(1, porcupine_ms)
+    wake_filter = CustomWakeCheckFilter(20, PARTICIPANT, max_buffer_secs=buffer_secs, pool=pool)
+    await wake_filter.process_frame(ParticipantJoinedFrame(PARTICIPANT), FrameDirection.DOWNSTREAM)
+    await wake_filter.process_frame(SpeechSegmentStartedFrame(PARTICIPANT, time.time()), FrameDirection.DOWNSTREAM)
+    p = wake_filter._participant_states[PARTICIPANT]
+
+    audio = bytes(FRAME_LENGTH * 2)
+    for minute in range(minutes):
+        start = time.perf_counter()
+        for _ in range(FRAMES_PER_MINUTE):
+            await wake_filter.process_frame(AudioRawFrame(audio=audio, sample_rate=SAMPLE_RATE, num_channels=1),
+                                            FrameDirection.DOWNSTREAM)
+        elapsed = time.perf_counter() - start
+        print(f"  minute {minute + 1:>3}: {elapsed / FRAMES_PER_MINUTE * 1e6:10.1f} us/frame, "
+              f"{p.accumulator.retained / 1024:10.0f} KiB buffered, {p.handler.frames:>8} frames scanned")
+    pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, default=30, help="minutes of idle audio")
+    parser.add_argument("--buffer-secs", type=float, default=5.0, help="audio the filter retains per participant")
+    parser.add_argument("--porcupine-ms", type=float, default=0.0, help="simulated Porcupine cost per frame")
+    args = parser.parse_args()
+
+    print(f"CustomWakeCheckFilter idle path ({args.buffer_secs:g}s buffer, {args.porcupine_ms:g}ms per Porcupine call):")
+    asyncio.run(run(args.minutes, args.buffer_secs, args.porcupine_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""
+Session capacity with 1..N worker processes behind the Supervisor's session router.
+
+Every worker runs a CustomWebsocketSessionServer whose pipelines scan all incoming audio
+with a fake Porcupine that burns `--process-ms` of CPU per frame on the event loop (like the
+inline mode). Mock clients stream `?codec=pcm` audio frames through the router as fast as they
+can for `--seconds`, and the frames scanned by all workers are added up. The capacity is
+that throughput expressed in real-time streams (one 512 sample frame every 32ms), which
+should grow about linearly with the number of workers up to the number of cores.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_scale_out --workers 1 2 4 --clients 32
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+
+from pipecat.frames.frames import AudioRawFrame, Frame
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.task import PipelineParams, PipelineTask
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.transports.network.websocket_server import WebsocketServerParams
+
+import websockets
+
+from benchmarks.fakes import FRAME_LENGTH, SAMPLE_RATE, FakePorcupinePool
+from custom_classes.custom_frames import ParticipantJoinedFrame, SpeechSegmentStartedFrame
+from custom_classes.custom_serializer import PCMStreamSerializer
+from custom_classes.custom_wake_word import CustomWakeCheckFilter
+from custom_classes.custom_websocket_transport import CustomWebsocketSessionServer
+from utils.frame_queue import OverflowPolicy, QueueLimits
+from utils.metrics import metrics
+from utils.supervisor import Supervisor, WorkerLoad
+
+FRAME_SECS = FRAME_LENGTH / SAMPLE_RATE
+
+
+class AlwaysSpeaking(FrameProcessor):
+    """Opens a speech segment as soon as a participant joins, so every frame is scanned (no VAD)."""
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        await self.push_frame(frame, direction)
+        if isinstance(frame, ParticipantJoinedFrame):
+            await self.push_frame(SpeechSegmentStartedFrame(frame.participant_id, time.time()))
+
+
+def worker(index: int, host: str, port: int, load: WorkerLoad, max_sessions: int, process_ms: float, scanned):
+    async def report():
+        # Share this worker's scanned frame count with the benchmark process
+        while True:
+            scanned[index] = int(metrics.counter("porcupine_frames"))
+            await asyncio.sleep(0.1)
+
+    async def run():
+        pool = FakePorcupinePool(max_sessions, process_ms)
+
+        async def pipeline_factory(transport):
+            pipeline = Pipeline([
+                transport.input(),
+                AlwaysSpeaking(),
+                CustomWakeCheckFilter(20, pool=pool),
+                transport.output(),
+            ])
+            return PipelineTask(pipeline, PipelineParams())
+
+        server = CustomWebsocketSessionServer(
+            pipeline_factory,
+            host=host,
+            port=port,
+            params_factory=lambda: WebsocketServerParams(audio_in_enabled=True),
+            max_sessions=max_sessions,
+            # Clients send as fast as they can, backpressure keeps them at the worker's pace
+            queue_limits=QueueLimits(policy=OverflowPolicy.BACKPRESSURE),
+            on_sessions_changed=lambda sessions, capacity: load.report(index, sessions, capacity))
+        asyncio.get_running_loop().create_task(report())
+        await server.run()
+
+    asyncio.run(run())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+async def connect_client(port: int, participant_id: str, serializer: PCMStreamSerializer):
+    websocket = await websockets.connect(f"ws://localhost:{port}/?participant_id={participant_id}&codec=pcm")
+    await websocket.send(serializer.session_start())
+    return websocket
+
+
+async def stream_client(websocket, frame: bytes, seconds: float):
+    try:
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            await websocket.send(frame)
+    finally:
+        await websocket.close()
+
+
+async def run(workers: int, clients: int, process_ms: float, seconds: float) -> dict:
+    port = free_port()
+    scanned = multiprocessing.get_context("spawn").Array("q", workers)
+    supervisor = Supervisor(workers, worker, (clients, process_ms, scanned), port=port, worker_base_port=free_port())
+    supervisor_task = asyncio.get_running_loop().create_task(supervisor.run())
+    while not all(supervisor.router.alive):
+        await asyncio.sleep(0.1)
+
+    # Connect every client before any of them floods the workers, or the last handshakes starve
+    serializer = PCMStreamSerializer(SAMPLE_RATE, 1)
+    frame = serializer.serialize(AudioRawFrame(audio=bytes(FRAME_LENGTH * 2), sample_rate=SAMPLE_RATE, num_channels=1))
+    connections = await asyncio.gather(*(connect_client(port, f"load-{i}", serializer) for i in range(clients)))
+
+    # Warm up, then measure what the workers scan while every client keeps sending
+    clients_task = asyncio.gather(*(stream_client(websocket, frame, seconds + 1) for websocket in connections))
+    await asyncio.sleep(1)
+    before = sum(scanned)
+    start = time.perf_counter()
+    await clients_task
+    fps = (sum(scanned) - before) / (time.perf_counter() - start)
+
+    supervisor.stop()
+    await supervisor_task
+    return {"fps": fps, "streams": fps * FRAME_SECS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=32, help="simultaneous clients")
+    parser.add_argument("--process-ms", type=float, default=0.5, help="CPU per frame of the fake Porcupine")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores, {args.clients} clients, {args.process_ms}ms per frame")
+    print(f"{'workers':>8}{'frames/s':>12}{'realtime streams':>18}{'scaling':>10}")
+    baseline = None
+    for workers in args.workers:
+        result = asyncio.run(run(workers, args.clients, args.process_ms, args.seconds))
+        baseline = baseline or result["fps"]
+        print(f"{workers:>8}{result['fps']:>12.0f}{result['streams']:>18.1f}{result['fps'] / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""
+Time to first audio with the LangChain answer streamed sentence by sentence vs. returned whole.
+
+Sends `--questions` LLMMessagesFrames through LangchainProcessor and a fake TTS service (first
+audio `--tts-ttfb-ms` after each request) and measures the time from the question to the
+first audio frame and to the end of the answer. The chain is a fake LLM runnable that
+generates `--reply` word by word (`--first-token-ms`, then `--token-ms` per word):
+
+- whole: the answer is collected and returned in one piece (LLM_STREAMING=0)
+- streaming: the tokens go through the SentenceChunker and every sentence is handed to TTS
+  as soon as it is complete (the default)
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ttfa --questions 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from langchain_core.runnables import Runnable, RunnableGenerator, RunnableLambda
+from pipecat.frames.frames import AudioRawFrame, EndFrame, Frame, LLMFullResponseEndFrame, LLMMessagesFrame
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.task import PipelineParams, PipelineTask
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.processors.frameworks.langchain import LangchainProcessor
+
+from benchmarks.fakes import FakeTTSService, fake_llm
+from utils.sentence_chunker import sentence_stream
+
+DEFAULT_REPLY = ("Sure, I can help with that. The forecast for tomorrow is sunny with a high of 24 degrees. "
+                 "There is a light breeze from the west in the afternoon, so it is a good day to be outside. "
+                 "Let me know if you want the forecast for the rest of the week.")
+
+
+class AudioTimer(FrameProcessor):
+    """Records when the first audio frame and the end of each answer reach the end of the pipeline."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.first_audio: float | None = None
+        self.done = asyncio.Event()
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, AudioRawFrame) and self.first_audio is None:
+            self.first_audio = time.perf_counter()
+        elif isinstance(frame, LLMFullResponseEndFrame):
+            self.done.set()
+        await self.push_frame(frame, direction)
+
+
+def build_chain(streaming: bool, llm: Runnable) -> Runnable:
+    if not streaming:
+        return RunnableLambda(llm.ainvoke)
+
+    async def sentences(tokens):
+        async for sentence in sentence_stream(tokens):
+            yield sentence
+
+    return llm | RunnableGenerator(sentences)
+
+
+async def run(streaming: bool, args) -> dict:
+    llm = fake_llm(args.reply, args.first_token_ms, args.token_ms)
+    timer = AudioTimer()
+    pipeline = Pipeline([
+        LangchainProcessor(build_chain(streaming, llm)),
+        FakeTTSService(args.tts_ttfb_ms, aggregate_sentences=False),
+        timer,
+    ])
+    task = PipelineTask(pipeline, PipelineParams())
+    runner = asyncio.get_running_loop().create_task(task.run())
+
+    ttfa, total = [], []
+    for _ in range(args.questions):
+        timer.first_audio = None
+        timer.done.clear()
+        start = time.perf_counter()
+        await task.queue_frame(LLMMessagesFrame([{"role": "user", "content": "What is the weather tomorrow?"}]))
+        await timer.done.wait()
+        ttfa.append((timer.first_audio - start) * 1000)
+        total.append((time.perf_counter() - start) * 1000)
+
+    await task.queue_frame(EndFrame())
+    await runner
+    return {"ttfa": ttfa, "total": total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    parser.add_argument("--first-token-ms", type=float, default=400, help="fake LLM time to first token")
+    parser.add_argument("--token-ms", type=float, default=25, help="fake LLM time per following token")
+    parser.add_argument("--tts-ttfb-ms", type=float, default=150, help="fake TTS time to first audio")
+    args = parser.parse_args()
+
+    print(f"{len(args.reply.split())} word reply, {args.first_token_ms}ms to first token, "
+          f"{args.token_ms}ms per token, {args.tts_ttfb_ms}ms TTS time to first byte")
+    print(f"{'mode':>10}{'ttfa p50':>12}{'ttfa max':>12}{'answer done':>14}")
+    for streaming in (False, True):
+        result = asyncio.run(run(streaming, args))
+        print(f"{'streaming' if streaming else 'whole':>10}"
+              f"{statistics.median(result['ttfa']):>10.0f}ms{max(result['ttfa']):>10.0f}ms"
+              f"{statistics.median(result['total']):>12.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
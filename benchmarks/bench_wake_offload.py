@@ -0,0 +1,96 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""
+Event loop lag with Porcupine running inline vs. offloaded to worker threads.
+
+Runs N simultaneous real-time audio streams (one 512 sample frame every 32ms each) through
+their own `CustomWakeCheckFilter`, with a fake Porcupine handle that burns `--process-ms` of
+CPU per frame with the GIL released. Reports the event loop lag and the frames scanned per
+second for the inline mode and the executor-backed mode.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_wake_offload --streams 1 8 32 --workers 4
+"""
+
+import argparse
+import asyncio
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pipecat.frames.frames import AudioRawFrame
+from pipecat.processors.frame_processor import FrameDirection
+
+from benchmarks.fakes import FRAME_LENGTH, SAMPLE_RATE, FakePorcupinePool
+from custom_classes.custom_frames import SpeechSegmentStartedFrame
+from custom_classes.custom_wake_word import CustomWakeCheckFilter
+from utils.metrics import EventLoopLagMonitor
+
+FRAME_SECS = FRAME_LENGTH / SAMPLE_RATE
+
+
+async def stream(wake_filter: CustomWakeCheckFilter, seconds: float):
+    audio = bytes(FRAME_LENGTH * 2)
+    start = time.perf_counter()
+    sent = 0
+    while sent * FRAME_SECS < seconds:
+        await wake_filter.process_frame(AudioRawFrame(audio=audio, sample_rate=SAMPLE_RATE, num_channels=1),
+                                        FrameDirection.DOWNSTREAM)
+        sent += 1
+        # Pace the stream like a microphone would
+        delay = start + sent * FRAME_SECS - time.perf_counter()
+        await asyncio.sleep(max(0.0, delay))
+
+
+async def run(streams: int, workers: int, process_ms: float, seconds: float) -> dict:
+    pool = FakePorcupinePool(streams, process_ms)
+    executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+
+    filters = []
+    for i in range(streams):
+        wake_filter = CustomWakeCheckFilter(20, f"bench-{i}", pool=pool, executor=executor)
+        # Scan continuously, as if the participant never stopped speaking
+        await wake_filter.process_frame(SpeechSegmentStartedFrame(f"bench-{i}", time.time()),
+                                        FrameDirection.DOWNSTREAM)
+        filters.append(wake_filter)
+
+    monitor = EventLoopLagMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(stream(f, seconds) for f in filters))
+    for f in filters:
+        for p in f._participant_states.values():
+            if p.scan_task is not None:
+                await p.scan_task
+    elapsed = time.perf_counter() - start
+    await monitor.stop()
+
+    if executor:
+        executor.shutdown()
+    scanned = sum(p.handler.frames for f in filters for p in f._participant_states.values())
+    return {"lag": monitor.lag.summary(), "fps": scanned / elapsed, "realtime_fps": streams / FRAME_SECS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--workers", type=int, default=4, help="executor threads for the offloaded mode")
+    parser.add_argument("--process-ms", type=float, default=0.5, help="simulated Porcupine cost per frame")
+    parser.add_argument("--seconds", type=float, default=5.0, help="audio per stream")
+    args = parser.parse_args()
+
+    print(f"{'streams':>8}{'mode':>10}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}{'frames/s':>10}{'needed':>10}")
+    for streams in args.streams:
+        for mode, workers in (("inline", 0), ("offload", args.workers)):
+            result = asyncio.run(run(streams, workers, args.process_ms, args.seconds))
+            lag = result["lag"]
+            print(f"{streams:>8}{mode:>10}{lag['p50'] * 1000:>12.2f}{lag['p99'] * 1000:>12.2f}"
+                  f"{lag['max'] * 1000:>12.2f}{result['fps']:>10.0f}{result['realtime_fps']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""
+Offline evaluation of the wake word filter over labelled recordings.
+
+Replays 16kHz mono 16-bit WAV recordings through `CustomWakeCheckFilter` with real Porcupine
+handles (PICOVOICE_API_KEY and the keyword files in KEYWORD_DIR), once for every sensitivity
+profile at the fixed keepalive window and once with the WakeTuner adapting both. The clock is
+the audio position, so keepalive windows and stats behave as they would live, at any speed.
+Speech segments come from an energy detector (`--vad-dbfs`) instead of Silero.
+
+The labels file lists the recordings (paths relative to it) and when each spoken keyword ends:
+
+    {"recordings": [{"path": "kitchen.wav", "wake_words": [3.2, 17.9]}, ...]}
+
+A detection within `--tolerance` seconds of a labelled keyword end is a true accept, other
+detections are false accepts and labels without one are false rejects. The recordings are
+played in order as one participant (so the tuner learns across them). Reported per mode:
+false-accept rate (per hour and per detection), false-reject rate, and the downstream work
+the wakes cause: seconds of audio passed on to STT and LLM/TTS turns, with what each mode saves
+compared to the default profile.
+
+Run from the repository root:
+
+    python -m benchmarks.eval_wake labels.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import wave
+
+from pipecat.frames.frames import AudioRawFrame, Frame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from custom_classes.custom_frames import SpeechSegmentStartedFrame, SpeechSegmentStoppedFrame, WakeWordDetectedFrame
+from custom_classes.custom_keywords import KeywordRegistry, KeywordSet
+from custom_classes.custom_wake_word import CustomWakeCheckFilter, PorcupinePool
+from utils.energy_gate import EnergyGate
+from utils.wake_tuning import SENSITIVITY_PROFILES, WakeTuner
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 512
+FRAME_SECS = FRAME_LENGTH / SAMPLE_RATE
+PARTICIPANT = "eval"
+
+
+class FixedProfilePool(PorcupinePool):
+    """PorcupinePool that gives every participant the default keywords with the sensitivities moved by `offset`."""
+    def __init__(self, offset: float, registry: KeywordRegistry):
+        super().__init__(1, registry=registry)
+        self.offset = offset
+
+    def keyword_set(self, participant_id: str) -> KeywordSet:
+        lease = self._leases.get(participant_id)
+        return lease[0] if lease else self.default_keyword_set.adjusted(self.offset)
+
+
+class AudioClock:
+    """Seconds of audio fed so far, the filter's clock."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class WakeRecorder(FrameProcessor):
+    """Sits after the filter: records when it woke and how much audio it passed on (to STT)."""
+    def __init__(self, clock: AudioClock, **kwargs):
+        super().__init__(**kwargs)
+        self._clock = clock
+        self.detections: list[float] = []
+        self.audio_secs = 0.0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, WakeWordDetectedFrame):
+            self.detections.append(self._clock())
+        elif isinstance(frame, AudioRawFrame):
+            self.audio_secs += len(frame.audio) / (frame.sample_rate * 2)
+
+
+def read_recording(path: str) -> bytes:
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != SAMPLE_RATE or f.getnchannels() != 1 or f.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16kHz mono 16-bit PCM.")
+        return f.readframes(f.getnframes())
+
+
+def load_labels(path: str) -> list[tuple[bytes, list[float]]]:
+    with open(path) as f:
+        labels = json.load(f)
+    directory = os.path.dirname(os.path.abspath(path))
+    return [(read_recording(os.path.join(directory, recording["path"])), sorted(recording.get("wake_words", [])))
+            for recording in labels["recordings"]]
+
+
+async def replay(wake_filter: CustomWakeCheckFilter, clock: AudioClock, recordings, vad_dbfs: float,
+                 gap_secs: float) -> list[float]:
+    """Feed every recording (with speech segment frames), return the labelled keyword ends on the clock."""
+    frame_bytes = FRAME_LENGTH * 2
+    hangover = round(0.5 / FRAME_SECS)
+    labels = []
+    for audio, wake_words in recordings:
+        labels += [clock.now + t for t in wake_words]
+        vad = EnergyGate(vad_dbfs, hangover_frames=0)
+        in_speech, quiet = False, 0
+        for start in range(0, len(audio) - frame_bytes + 1, frame_bytes):
+            chunk = audio[start:start + frame_bytes]
+            if vad.is_speech(chunk):
+                quiet = 0
+                if not in_speech:
+                    in_speech = True
+                    await wake_filter.process_frame(SpeechSegmentStartedFrame(PARTICIPANT, clock.now),
+                                                    FrameDirection.DOWNSTREAM)
+            elif in_speech:
+                quiet += 1
+                if quiet >= hangover:
+                    in_speech = False
+                    await wake_filter.process_frame(SpeechSegmentStoppedFrame(PARTICIPANT, clock.now, clock.now),
+                                                    FrameDirection.DOWNSTREAM)
+            clock.now += FRAME_SECS
+            await wake_filter.process_frame(AudioRawFrame(audio=chunk, sample_rate=SAMPLE_RATE, num_channels=1),
+                                            FrameDirection.DOWNSTREAM)
+        if in_speech:
+            await wake_filter.process_frame(SpeechSegmentStoppedFrame(PARTICIPANT, clock.now, clock.now),
+                                            FrameDirection.DOWNSTREAM)
+        # Silence between recordings, so a keepalive window does not run into the next one
+        clock.now += gap_secs
+    return labels
+
+
+def score(detections: list[float], labels: list[float], tolerance: float) -> dict:
+    unmatched = list(labels)
+    true_accepts = 0
+    for detected in detections:
+        match = next((label for label in unmatched if label - 0.5 <= detected <= label + tolerance), None)
+        if match is not None:
+            unmatched.remove(match)
+            true_accepts += 1
+    return {"true_accepts": true_accepts, "false_accepts": len(detections) - true_accepts,
+            "false_rejects": len(unmatched)}
+
+
+async def run(recordings, registry: KeywordRegistry, offset: float | None, args) -> dict:
+    """Evaluate one sensitivity profile at the fixed keepalive (offset), or the tuner (None)."""
+    clock = AudioClock()
+    tuner = None
+    if offset is None:
+        tuner = WakeTuner(base_keepalive=args.keepalive)
+        pool = PorcupinePool(len(tuner.profiles), registry=registry)
+    else:
+        pool = FixedProfilePool(offset, registry)
+    wake_filter = CustomWakeCheckFilter(args.keepalive, PARTICIPANT, pool=pool, tuner=tuner, clock=clock)
+    recorder = WakeRecorder(clock)
+    wake_filter.link(recorder)
+
+    labels = await replay(wake_filter, clock, recordings, args.vad_dbfs, args.keepalive + 1)
+    pool.close()
+
+    result = score(recorder.detections, labels, args.tolerance)
+    result.update(labels=len(labels), detections=len(recorder.detections), stt_secs=recorder.audio_secs)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("labels", help="labels file (JSON)")
+    parser.add_argument("--keyword-dir", default=os.getenv("KEYWORD_DIR", "keyword_files"))
+    parser.add_argument("--keepalive", type=float, default=20, help="fixed keepalive window (seconds)")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="seconds a detection may trail the label")
+    parser.add_argument("--vad-dbfs", type=float, default=-45, help="level of the energy speech detector")
+    args = parser.parse_args()
+
+    recordings = load_labels(args.labels)
+    hours = sum(len(audio) for audio, _ in recordings) / (SAMPLE_RATE * 2 * 3600)
+    registry = KeywordRegistry(args.keyword_dir)
+    print(f"{len(recordings)} recordings, {hours * 60:.1f} minutes, "
+          f"{sum(len(labels) for _, labels in recordings)} labelled wake words")
+
+    modes = [(f"{offset:+.1f}", offset) for offset in SENSITIVITY_PROFILES] + [("adaptive", None)]
+    results = {name: asyncio.run(run(recordings, registry, offset, args)) for name, offset in modes}
+    baseline = results[f"{0.0:+.1f}"]
+
+    print(f"{'profile':>9}{'FA/hour':>9}{'FA/det':>8}{'FR':>7}{'STT secs':>10}{'turns':>7}"
+          f"{'STT saved':>11}{'turns saved':>13}")
+    for name, r in results.items():
+        fa_per_hour = r["false_accepts"] / hours if hours else 0.0
+        fa_share = r["false_accepts"] / r["detections"] if r["detections"] else 0.0
+        fr = r["false_rejects"] / r["labels"] if r["labels"] else 0.0
+        print(f"{name:>9}{fa_per_hour:>9.1f}{fa_share:>8.0%}{fr:>7.0%}{r['stt_secs']:>10.0f}{r['detections']:>7}"
+              f"{baseline['stt_secs'] - r['stt_secs']:>11.0f}{baseline['detections'] - r['detections']:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""
+Stand-ins for Porcupine, the LLM and the STT/TTS services used by the benchmarks, so they run
+without a Picovoice key, keyword files or network access.
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+
+from typing import AsyncGenerator
+
+from langchain_core.runnables import RunnableGenerator
+from pipecat.frames.frames import AudioRawFrame, Frame, TextFrame, TranscriptionFrame, UserStoppedSpeakingFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.services.ai_services import TTSService
+
+from custom_classes.custom_frames import ParticipantJoinedFrame
+from custom_classes.custom_wake_word import PorcupinePool
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 512
+
+
+class FakePorcupine:
+    """
+    Behaves like `pvporcupine.Porcupine.process`: converts the pcm to a C array and burns
+    about `process_ms` of CPU in a call that releases the GIL (like the native library does).
+    Fires keyword 0 on every frame listed in `trigger_frames` (counted per handle).
+    """
+    frame_length = FRAME_LENGTH
+    sample_rate = SAMPLE_RATE
+
+    def __init__(self, process_ms: float = 0.2, trigger_frames: set[int] = None):
+        self.process_ms = process_ms
+        self.trigger_frames = trigger_frames or set()
+        self.frames = 0
+        self._work = bytes(calibrate_work(process_ms))
+
+    def process(self, pcm) -> int:
+        if len(pcm) != self.frame_length:
+            raise ValueError("Invalid frame length.")
+        list(pcm)
+        if self._work:
+            hashlib.sha256(self._work).digest()
+        self.frames += 1
+        return 0 if self.frames in self.trigger_frames else -1
+
+    def delete(self):
+        pass
+
+
+_calibration: dict[float, int] = {}
+
+
+def calibrate_work(process_ms: float) -> int:
+    """Number of bytes sha256 needs to take about `process_ms` on this machine."""
+    if process_ms <= 0:
+        return 0
+    if process_ms not in _calibration:
+        probe = bytes(1 << 20)
+        start = time.perf_counter()
+        for _ in range(8):
+            hashlib.sha256(probe).digest()
+        per_byte = (time.perf_counter() - start) / (8 * len(probe))
+        _calibration[process_ms] = max(4096, int(process_ms / 1000 / per_byte))
+    return _calibration[process_ms]
+
+
+class FakePorcupinePool(PorcupinePool):
+    """PorcupinePool that hands out FakePorcupine handles."""
+    def __init__(self, size: int = 8, process_ms: float = 0.2, trigger_frames: set[int] = None):
+        super().__init__(size, "fake.ppn", "fake.ppn", "fake.ppn", picovoice_api_key="fake")
+        self._pico_handle.create_handler = lambda keyword_set=None: FakePorcupine(process_ms, trigger_frames)
+
+
+class StubSTTService(FrameProcessor):
+    """
+    Stands in for DeepgramSTTService: consumes audio and emits one TranscriptionFrame per
+    utterance (when the user stops speaking), without any network calls.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._audio_bytes = 0
+        self._participant_id = ""
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, AudioRawFrame):
+            self._audio_bytes += len(frame.audio)
+            return
+        if isinstance(frame, ParticipantJoinedFrame):
+            self._participant_id = frame.participant_id
+        await self.push_frame(frame, direction)
+        if isinstance(frame, UserStoppedSpeakingFrame) and self._audio_bytes:
+            text = f"{self._audio_bytes / (SAMPLE_RATE * 2):.2f} seconds of audio"
+            self._audio_bytes = 0
+            await self.push_frame(TranscriptionFrame(text, self._participant_id, str(time.time())))
+
+
+class StubTTSService(FrameProcessor):
+    """Stands in for ElevenLabsTTSService: answers every text frame with `reply_secs` of silence."""
+    def __init__(self, reply_secs: float = 0.5, **kwargs):
+        super().__init__(**kwargs)
+        self._reply = bytes(int(reply_secs * SAMPLE_RATE) * 2)
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, TextFrame):
+            await self.push_frame(AudioRawFrame(audio=self._reply, sample_rate=SAMPLE_RATE, num_channels=1))
+        await self.push_frame(frame, direction)
+
+
+class FakeTTSService(TTSService):
+    """
+    Stands in for ElevenLabsTTSService behind the real TTSService (sentence aggregation, TTS
+    started/stopped frames): the first audio arrives `ttfb_ms` after a request, then the rest
+    of the text's audio (`chars_per_sec` of speech) streams in 100ms chunks.
+    """
+    def __init__(self, ttfb_ms: float = 150, chars_per_sec: float = 15, **kwargs):
+        super().__init__(**kwargs)
+        self._ttfb = ttfb_ms / 1000
+        self._chars_per_sec = chars_per_sec
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        await asyncio.sleep(self._ttfb)
+        chunk = bytes(SAMPLE_RATE // 10 * 2)
+        for _ in range(max(1, round(len(text) / self._chars_per_sec * 10))):
+            yield AudioRawFrame(audio=chunk, sample_rate=SAMPLE_RATE, num_channels=1)
+
+
+def fake_llm(reply: str, first_token_ms: float = 400, token_ms: float = 25) -> RunnableGenerator:
+    """
+    Stands in for a streaming chat model: a runnable that answers any input with `reply`, one
+    word per token, the first after `first_token_ms` and then one every `token_ms`.
+    """
+    tokens = re.findall(r"\s*\S+", reply)
+
+    async def generate(inputs):
+        async for _ in inputs:
+            await asyncio.sleep(first_token_ms / 1000)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(token_ms / 1000)
+                yield token
+
+    return RunnableGenerator(generate)
@@ -0,0 +1,222 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""
+Offline replay benchmark for the front half of the pipeline (websocket input -> VAD ->
+wake word filter -> STT), without Deepgram, ElevenLabs or a browser.
+
+Recorded 16kHz mono 16-bit audio (.wav or raw .pcm) is streamed by local mock websocket
+clients that speak the lean `?codec=pcm` format the web client uses (`PCMStreamSerializer`), into a `CustomWebsocketSessionServer`
+whose pipelines use the real transport, Silero VAD and `CustomWakeCheckFilter`, with stub
+STT/TTS processors. Every combination of replay speed and number of simultaneous clients is
+run and reported as frames/sec, CPU per stream, memory growth and wake word detection latency.
+
+Detection latency needs a Picovoice key (PICOVOICE_API_KEY) and `--keyword-path`, plus
+`--keyword-end` (seconds into the recording where the keyword ends). Without a keyword file
+Porcupine is replaced by a fake that never fires (burning `--porcupine-ms` of CPU per frame),
+which still exercises the hot path.
+
+With `--energy-gate-dbfs`, every combination is also run with the energy gate in front of
+Porcupine, and the fraction of frames it skipped and the CPU saved per stream are reported.
+
+Run from the repository root:
+
+    python -m benchmarks.replay recording.wav --speeds 1 10 0 --clients 1 4 16 --energy-gate-dbfs -50
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import time
+import wave
+
+from pipecat.frames.frames import AudioRawFrame
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.task import PipelineParams, PipelineTask
+from pipecat.transports.network.websocket_server import WebsocketServerParams
+from pipecat.vad.silero import SileroVADAnalyzer
+
+import websockets
+
+from benchmarks.fakes import FRAME_LENGTH, SAMPLE_RATE, FakePorcupinePool, StubSTTService, StubTTSService
+from custom_classes.custom_serializer import PCMStreamSerializer
+from custom_classes.custom_vad_scheduler import VADBatchScheduler
+from custom_classes.custom_wake_word import CustomWakeCheckFilter, PorcupinePool
+from custom_classes.custom_websocket_transport import CustomWebsocketSessionServer
+from utils.metrics import metrics
+
+# Same chunk size the browser client sends
+CHUNK_BYTES = FRAME_LENGTH * 2
+
+
+def load_pcm(path: str) -> bytes:
+    if path.endswith(".wav"):
+        with wave.open(path, "rb") as wav:
+            if wav.getframerate() != SAMPLE_RATE or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                raise ValueError(f"{path} must be 16kHz mono 16-bit audio.")
+            return wav.readframes(wav.getnframes())
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+async def replay_client(port: int, participant_id: str, audio: bytes, speed: float,
+                        keyword_end: float | None) -> dict:
+    serializer = PCMStreamSerializer(SAMPLE_RATE, 1)
+    result = {"frames": 0, "received_bytes": 0, "detection_latency": None}
+    keyword_chunk = int(keyword_end * SAMPLE_RATE * 2) // CHUNK_BYTES if keyword_end is not None else None
+    keyword_sent_at = None
+
+    async with websockets.connect(f"ws://localhost:{port}/?participant_id={participant_id}&codec=pcm") as websocket:
+        # Announce the format once, like the web client, then send bare audio messages
+        await websocket.send(serializer.session_start())
+
+        async def receive():
+            async for message in websocket:
+                result["received_bytes"] += len(message)
+
+        receiver = asyncio.get_running_loop().create_task(receive())
+        start = time.perf_counter()
+        for i, offset in enumerate(range(0, len(audio) - CHUNK_BYTES + 1, CHUNK_BYTES)):
+            frame = AudioRawFrame(audio=audio[offset:offset + CHUNK_BYTES], sample_rate=SAMPLE_RATE, num_channels=1)
+            await websocket.send(serializer.serialize(frame))
+            result["frames"] += 1
+            if i == keyword_chunk:
+                keyword_sent_at = time.perf_counter()
+            # Pace like a microphone at `speed` times real time (0 sends as fast as possible)
+            if speed > 0:
+                delay = start + (i + 1) * CHUNK_BYTES / (SAMPLE_RATE * 2) / speed - time.perf_counter()
+                await asyncio.sleep(max(0.0, delay))
+            else:
+                await asyncio.sleep(0)
+
+        # Give the pipeline a moment to drain before reading the detection time
+        await asyncio.sleep(0.5)
+        woke_at = metrics.last_mark("wake", participant_id)
+        if keyword_sent_at is not None and woke_at is not None:
+            result["detection_latency"] = woke_at - keyword_sent_at
+        receiver.cancel()
+    return result
+
+
+async def run(audio: bytes, speed: float, clients: int, args, energy_gate_dbfs: float | None = None) -> dict:
+    port = free_port()
+    if args.keyword_path:
+        pool = PorcupinePool(clients, args.keyword_path, args.keyword_path, args.keyword_path)
+    else:
+        pool = FakePorcupinePool(clients, process_ms=args.porcupine_ms)
+    scheduler = VADBatchScheduler()
+    scanned_before = metrics.counter("porcupine_frames")
+    skipped_before = metrics.counter("porcupine_frames_skipped")
+
+    async def pipeline_factory(transport):
+        pipeline = Pipeline([
+            transport.input(),
+            CustomWakeCheckFilter(20, pool=pool, energy_gate_dbfs=energy_gate_dbfs),
+            StubSTTService(),
+            StubTTSService(),
+            transport.output(),
+        ])
+        return PipelineTask(pipeline, PipelineParams(allow_interruptions=True))
+
+    server = CustomWebsocketSessionServer(
+        pipeline_factory,
+        port=port,
+        params_factory=lambda: WebsocketServerParams(audio_out_enabled=True,
+                                                     vad_enabled=True,
+                                                     vad_analyzer=SileroVADAnalyzer(),
+                                                     vad_audio_passthrough=True),
+        max_sessions=clients,
+        vad_scheduler=scheduler)
+    server_task = asyncio.get_running_loop().create_task(server.run())
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("localhost", port)
+            writer.close()
+            break
+        except OSError:
+            await asyncio.sleep(0.05)
+
+    rss_before = rss_bytes()
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        replay_client(port, f"replay-{i}", audio, speed, args.keyword_end) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_before
+    rss_after = rss_bytes()
+
+    await server.stop()
+    await server_task
+    scheduler.shutdown()
+    pool.close()
+
+    scanned = metrics.counter("porcupine_frames") - scanned_before
+    skipped = metrics.counter("porcupine_frames_skipped") - skipped_before
+    latencies = sorted(r["detection_latency"] for r in results if r["detection_latency"] is not None)
+    return {
+        "fps": sum(r["frames"] for r in results) / elapsed,
+        "cpu_per_stream": cpu / clients,
+        "audio_secs": len(audio) / (SAMPLE_RATE * 2),
+        "rss_growth": rss_after - rss_before,
+        "skipped": skipped / (scanned + skipped) if scanned + skipped else 0.0,
+        "detections": len(latencies),
+        "detection_p50": latencies[len(latencies) // 2] if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", nargs="+", help="16kHz mono 16-bit .wav or raw .pcm files")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[1, 10, 0], help="replay speeds (0 = max)")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16], help="simultaneous clients")
+    parser.add_argument("--keyword-path", help=".ppn keyword file (uses a fake Porcupine if omitted)")
+    parser.add_argument("--keyword-end", type=float, help="seconds into the recording where the keyword ends")
+    parser.add_argument("--porcupine-ms", type=float, default=0.2, help="CPU per frame of the fake Porcupine")
+    parser.add_argument("--energy-gate-dbfs", type=float, help="also run with the energy gate at this level")
+    args = parser.parse_args()
+
+    audio = b"".join(load_pcm(path) for path in args.recordings)
+    gates = [None] if args.energy_gate_dbfs is None else [None, args.energy_gate_dbfs]
+
+    print(f"{'speed':>6}{'clients':>8}{'gate':>8}{'frames/s':>10}{'cpu/stream':>12}{'skipped':>9}"
+          f"{'rss growth':>12}{'detected':>10}{'latency p50':>13}")
+    for speed in args.speeds:
+        for clients in args.clients:
+            baseline = None
+            for gate in gates:
+                result = asyncio.run(run(audio, speed, clients, args, gate))
+                latency = f"{result['detection_p50'] * 1000:.0f}ms" if result["detection_p50"] is not None else "-"
+                print(f"{'max' if speed == 0 else f'{speed:g}x':>6}{clients:>8}"
+                      f"{'off' if gate is None else f'{gate:g}dB':>8}{result['fps']:>10.0f}"
+                      f"{result['cpu_per_stream'] / result['audio_secs'] * 100:>11.1f}%"
+                      f"{result['skipped'] * 100:>8.1f}%"
+                      f"{result['rss_growth'] / 2**20:>10.1f}MB"
+                      f"{result['detections']:>6}/{clients:<3}{latency:>13}")
+                if baseline is None:
+                    baseline = result
+                elif baseline["cpu_per_stream"]:
+                    saved = 1 - result["cpu_per_stream"] / baseline["cpu_per_stream"]
+                    print(f"{'':>14}energy gate saved {saved * 100:.1f}% CPU per stream")
+
+
+if __name__ == "__main__":
+    main()
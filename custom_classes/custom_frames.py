@@ -0,0 +1,70 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+from dataclasses import dataclass
+
+from pipecat.frames.frames import SystemFrame
+
+
+@dataclass
+class ParticipantJoinedFrame(SystemFrame):
+    """
+    Pushed by the input transport when a client connects. Audio frames that follow belong to
+    this participant (AudioRawFrame does not carry a user id).
+    """
+    participant_id: str
+
+    def __str__(self):
+        return f"{self.name}(participant: {self.participant_id})"
+
+
+@dataclass
+class ParticipantLeftFrame(SystemFrame):
+    """Pushed by the input transport when a client disconnects."""
+    participant_id: str
+
+    def __str__(self):
+        return f"{self.name}(participant: {self.participant_id})"
+
+
+@dataclass
+class SpeechSegmentStartedFrame(SystemFrame):
+    """
+    Pushed by the input transport (in order with the audio) when VAD detects that the participant
+    started speaking. Audio frames that follow belong to the speech segment until the matching
+    SpeechSegmentStoppedFrame. `start_time` is the wall-clock time of the detection.
+    """
+    participant_id: str
+    start_time: float
+
+    def __str__(self):
+        return f"{self.name}(participant: {self.participant_id}, start: {self.start_time:.3f})"
+
+
+@dataclass
+class SpeechSegmentStoppedFrame(SystemFrame):
+    """Pushed by the input transport when the participant's speech segment ends (or they disconnect)."""
+    participant_id: str
+    start_time: float
+    stop_time: float
+
+    def __str__(self):
+        return (f"{self.name}(participant: {self.participant_id}, "
+                f"start: {self.start_time:.3f}, stop: {self.stop_time:.3f})")
+
+
+@dataclass
+class WakeWordDetectedFrame(SystemFrame):
+    """
+    Pushed by the wake word filter when a keyword fires, before the audio that follows it.
+    `keyword_index` is the index Porcupine reported within the participant's keyword set.
+    """
+    participant_id: str
+    keyword_index: int
+    keyword: str
+
+    def __str__(self):
+        return f"{self.name}(participant: {self.participant_id}, keyword: {self.keyword})"
@@ -0,0 +1,190 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import json
+import os
+import platform
+import threading
+
+from dataclasses import dataclass, replace
+from typing import Iterable
+
+from pipecat.frames.frames import DataFrame, Frame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from custom_classes.custom_frames import ParticipantLeftFrame, WakeWordDetectedFrame
+
+from loguru import logger
+
+# Platform part of Picovoice keyword file names (e.g. hey-pipe_en_mac_v3_0_0.ppn, hey_pipe_linux.ppn)
+PLATFORM_TOKENS = {"Darwin": "mac", "Linux": "linux", "Windows": "windows"}
+KNOWN_PLATFORM_TOKENS = {"mac", "linux", "windows", "raspberry-pi", "android", "ios", "wasm"}
+# Languages Porcupine has models for, console downloads put the code before the platform
+PORCUPINE_LANGUAGES = {"ar", "de", "en", "es", "fa", "fr", "hi", "it", "ja", "ko", "nl", "pl", "pt", "ru", "sv", "vi", "zh"}
+
+
+def parse_keyword_file(path: str) -> tuple[str, str | None]:
+    """Return the keyword name and the platform token (None if it has none) of a .ppn file."""
+    tokens = os.path.splitext(os.path.basename(path))[0].split("_")
+    for i, token in enumerate(tokens):
+        if token in KNOWN_PLATFORM_TOKENS and i > 0:
+            name = tokens[:i]
+            # Drop the language code of console downloads (hey-pipe_en_mac_...)
+            if len(name) > 1 and name[-1] in PORCUPINE_LANGUAGES:
+                name = name[:-1]
+            return "_".join(name), token
+    return "_".join(tokens), None
+
+
+@dataclass(frozen=True)
+class KeywordSet:
+    """
+    The keywords one Porcupine instance listens for (a single engine handles all of them),
+    in the order Porcupine reports their index. Hashable, so handles can be cached per set.
+    """
+    names: tuple[str, ...]
+    paths: tuple[str, ...]
+    sensitivities: tuple[float, ...]
+
+    @classmethod
+    def from_path(cls, path: str, sensitivity: float = 0.5) -> "KeywordSet":
+        return cls((parse_keyword_file(path)[0],), (path,), (sensitivity,))
+
+    def keyword(self, index: int) -> str:
+        return self.names[index] if 0 <= index < len(self.names) else ""
+
+    def adjusted(self, offset: float) -> "KeywordSet":
+        """The same keywords with every sensitivity moved by `offset` (kept within 0..1)."""
+        if not offset:
+            return self
+        return replace(self, sensitivities=tuple(min(1.0, max(0.0, round(s + offset, 3))) for s in self.sensitivities))
+
+
+class KeywordRegistry:
+    """
+    Keyword files (.ppn) for the current platform found in `directory`, with their sensitivities.
+
+    An optional `keywords.json` in the same directory configures them:
+
+        {
+            "sensitivities": {"hey_pipe": 0.6},
+            "default": ["hey_pipe"],
+            "participants": {"some-user-id": ["hey_pipe", "computer"]}
+        }
+
+    Participants without an entry get the default keywords (every keyword found if not set).
+    Keyword sets are deduplicated: the same keywords always give the same KeywordSet, so
+    participants that use the same keywords share Porcupine handles of one configuration.
+    """
+    def __init__(self,
+                 directory: str = "keyword_files",
+                 config_file: str = "keywords.json",
+                 default_sensitivity: float = 0.5,
+                 platform_name: str = None):
+        self.directory = directory
+        self.config_file = config_file
+        self.default_sensitivity = default_sensitivity
+        self.platform_name = platform_name or platform.system()
+
+        self._paths: dict[str, str] = {}
+        self._sensitivities: dict[str, float] = {}
+        self._default: tuple[str, ...] = ()
+        self._participants: dict[str, KeywordSet] = {}
+        self._sets: dict[tuple[str, ...], KeywordSet] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def names(self) -> list[str]:
+        return sorted(self._paths)
+
+    def load(self):
+        token = PLATFORM_TOKENS.get(self.platform_name)
+        paths = {}
+        if os.path.isdir(self.directory):
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith(".ppn"):
+                    continue
+                name, file_platform = parse_keyword_file(filename)
+                # Files without a platform in their name are used everywhere,
+                # a file for this platform wins over one without
+                if file_platform == token or (file_platform is None and name not in paths):
+                    paths[name] = os.path.join(self.directory, filename)
+
+        config = {}
+        config_path = os.path.join(self.directory, self.config_file)
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                config = json.load(f)
+
+        with self._lock:
+            self._paths = paths
+            self._sensitivities = {name: float(value) for name, value in config.get("sensitivities", {}).items()}
+            self._sets = {}
+            self._default = self._canonical(config.get("default") or paths)
+            self._participants = {participant_id: self._keyword_set(names)
+                                  for participant_id, names in config.get("participants", {}).items()}
+        logger.debug(f"Loaded {len(paths)} keyword files for {self.platform_name}: {', '.join(sorted(paths))}")
+
+    def _canonical(self, names: Iterable[str]) -> tuple[str, ...]:
+        names = tuple(sorted(set(names)))
+        unknown = [name for name in names if name not in self._paths]
+        if unknown:
+            raise ValueError(f"No keyword file for {', '.join(unknown)} in {self.directory}.")
+        return names
+
+    def _keyword_set(self, names: Iterable[str]) -> KeywordSet:
+        names = self._canonical(names)
+        if not names:
+            raise ValueError(f"No keyword files for {self.platform_name} found in {self.directory}.")
+        keyword_set = self._sets.get(names)
+        if keyword_set is None:
+            keyword_set = KeywordSet(names,
+                                     tuple(self._paths[name] for name in names),
+                                     tuple(self._sensitivities.get(name, self.default_sensitivity) for name in names))
+            self._sets[names] = keyword_set
+        return keyword_set
+
+    def keyword_set(self, names: Iterable[str] | None = None) -> KeywordSet:
+        """KeywordSet for the given keyword names (the default keywords if None)."""
+        with self._lock:
+            return self._keyword_set(self._default if names is None else names)
+
+    def assign(self, participant_id: str, names: Iterable[str] | None):
+        """Give a participant their own keywords (None goes back to the default ones)."""
+        with self._lock:
+            if names is None:
+                self._participants.pop(participant_id, None)
+            else:
+                self._participants[participant_id] = self._keyword_set(names)
+
+    def for_participant(self, participant_id: str) -> KeywordSet:
+        keyword_set = self._participants.get(participant_id)
+        return keyword_set if keyword_set is not None else self.keyword_set()
+
+
+class KeywordFilter(FrameProcessor):
+    """
+    Routes by keyword: only lets data frames (audio, transcriptions, text) through after one of
+    `keywords` woke the pipeline, until a different keyword fires. Control and system frames
+    always pass. Put one at the start of each branch of a ParallelPipeline placed after the wake
+    word filter to send each keyword (or intent) to its own processors.
+    """
+    def __init__(self, keywords: Iterable[str], **kwargs):
+        super().__init__(**kwargs)
+        self._keywords = frozenset(keywords)
+        self._active = False
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, WakeWordDetectedFrame):
+            self._active = frame.keyword in self._keywords
+        elif isinstance(frame, ParticipantLeftFrame):
+            self._active = False
+
+        if direction == FrameDirection.UPSTREAM or not isinstance(frame, DataFrame) or self._active:
+            await self.push_frame(frame, direction)
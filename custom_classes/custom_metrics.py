@@ -0,0 +1,57 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+from pipecat.frames.frames import Frame, MetricsFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from custom_classes.custom_frames import ParticipantJoinedFrame
+from utils.metrics import PipelineMetrics, metrics
+
+from loguru import logger
+
+
+def stage_metrics_frame(stage: str, participant_id: str, latency: float,
+                        registry: PipelineMetrics = metrics) -> MetricsFrame:
+    """MetricsFrame with the latest latency of a stage and its p50/p95/p99 for the participant."""
+    summary = registry.histogram(stage, participant_id).summary()
+    return MetricsFrame(processing=[{
+        "processor": stage,
+        "participant_id": participant_id,
+        "value": latency,
+        "p50": summary["p50"],
+        "p95": summary["p95"],
+        "p99": summary["p99"],
+    }])
+
+
+class LatencyProbe(FrameProcessor):
+    """
+    Pass-through processor that measures the time from the participant's wake word to the
+    first frame of the given types reaching this point of the pipeline (e.g. placed after
+    STT with TranscriptionFrame). Records into the metrics registry and pushes a MetricsFrame.
+    """
+    def __init__(self, stage: str, frame_types: tuple[type[Frame], ...],
+                 event: str = "wake", registry: PipelineMetrics = metrics, **kwargs):
+        super().__init__(**kwargs)
+        self._stage = stage
+        self._frame_types = frame_types
+        self._event = event
+        self._registry = registry
+        self._participant_id = ""
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, ParticipantJoinedFrame):
+            self._participant_id = frame.participant_id
+
+        await self.push_frame(frame, direction)
+
+        if direction == FrameDirection.DOWNSTREAM and isinstance(frame, self._frame_types):
+            latency = self._registry.observe_since(self._stage, self._event, self._participant_id)
+            if latency is not None:
+                logger.debug(f"{self._stage} for {self._participant_id}: {latency * 1000:.0f}ms")
+                await self.push_frame(stage_metrics_frame(self._stage, self._participant_id, latency, self._registry))
@@ -0,0 +1,150 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import struct
+
+from enum import IntEnum
+
+from pipecat.frames.frames import AudioRawFrame, Frame
+from pipecat.serializers.base_serializer import FrameSerializer
+
+from loguru import logger
+
+try:
+    import opuslib
+except ModuleNotFoundError:
+    opuslib = None
+except Exception as e:
+    # opuslib raises a plain Exception when the system's libopus is missing
+    logger.warning(f"opuslib is installed but can not be used ({e}), Opus is disabled.")
+    opuslib = None
+
+
+class UnsupportedCodecError(ValueError):
+    """The peer announced audio in a codec this process can not decode."""
+
+
+class PCMStreamSerializer(FrameSerializer):
+    """
+    Lean streaming wire format used instead of a protobuf AudioRawFrame (with a WAV header)
+    per chunk. Every websocket message is a fixed 8 byte header followed by the payload:
+
+        uint8 type | 3 bytes padding | uint32 payload length (big-endian) | payload
+
+    The padding keeps the payload 2-byte aligned so clients can view 16-bit samples in place.
+    Sample rate, channel count and codec are sent once, in a SESSION_START message, and every
+    AUDIO message after that only carries the samples (raw 16-bit PCM, or Opus packets each
+    prefixed with a uint16 length when the codec is Opus and `opuslib` is installed).
+    """
+    HEADER = struct.Struct(">B3xI")
+    SESSION_START = struct.Struct(">IHB")
+
+    class MessageType(IntEnum):
+        SESSION_START = 1
+        AUDIO = 2
+
+    class Codec(IntEnum):
+        PCM16 = 0
+        OPUS = 1
+
+    def __init__(self,
+                 sample_rate: int = 16000,
+                 num_channels: int = 1,
+                 codec: "PCMStreamSerializer.Codec" = None,
+                 opus_frame_ms: int = 20):
+        codec = PCMStreamSerializer.Codec.PCM16 if codec is None else codec
+        if not self.codec_available(codec):
+            logger.warning("Opus requires `pip install opuslib`, streaming raw PCM instead.")
+            codec = PCMStreamSerializer.Codec.PCM16
+
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.codec = codec
+
+        # Format of the audio the client sends, until its own SESSION_START says otherwise
+        self._in_sample_rate = sample_rate
+        self._in_num_channels = num_channels
+        self._in_codec = codec
+
+        self._opus_frame_samples = sample_rate * opus_frame_ms // 1000
+        self._encoder = None
+        self._decoder = None
+        self._pending_pcm = b""
+
+    @staticmethod
+    def codec_available(codec: "PCMStreamSerializer.Codec") -> bool:
+        return codec != PCMStreamSerializer.Codec.OPUS or opuslib is not None
+
+    @classmethod
+    def message(cls, message_type: "PCMStreamSerializer.MessageType", payload: bytes) -> bytes:
+        return cls.HEADER.pack(message_type, len(payload)) + payload
+
+    def session_start(self) -> bytes:
+        """Message announcing the format of the audio sent to the client, sent once per connection."""
+        return self.message(PCMStreamSerializer.MessageType.SESSION_START,
+                            self.SESSION_START.pack(self.sample_rate, self.num_channels, self.codec))
+
+    def serialize(self, frame: Frame) -> bytes | None:
+        if not isinstance(frame, AudioRawFrame):
+            return None
+        if self.codec == PCMStreamSerializer.Codec.OPUS:
+            payload = self._encode_opus(frame.audio)
+            if not payload:
+                return None
+        else:
+            payload = frame.audio
+        return self.message(PCMStreamSerializer.MessageType.AUDIO, payload)
+
+    def deserialize(self, data: str | bytes) -> Frame | None:
+        if not isinstance(data, bytes) or len(data) < self.HEADER.size:
+            return None
+
+        message_type, length = self.HEADER.unpack_from(data)
+        payload = data[self.HEADER.size:self.HEADER.size + length]
+        if len(payload) != length:
+            logger.warning(f"Dropping truncated message ({len(payload)} of {length} bytes)")
+            return None
+
+        if message_type == PCMStreamSerializer.MessageType.SESSION_START:
+            sample_rate, num_channels, codec = self.SESSION_START.unpack(payload)
+            codec = PCMStreamSerializer.Codec(codec)
+            if not self.codec_available(codec):
+                raise UnsupportedCodecError(f"{codec.name} audio requires `pip install opuslib`.")
+            self._in_sample_rate, self._in_num_channels, self._in_codec = sample_rate, num_channels, codec
+            self._decoder = None
+            return None
+        if message_type == PCMStreamSerializer.MessageType.AUDIO:
+            audio = self._decode_opus(payload) if self._in_codec == PCMStreamSerializer.Codec.OPUS else payload
+            return AudioRawFrame(audio=audio, sample_rate=self._in_sample_rate, num_channels=self._in_num_channels)
+        return None
+
+    def _encode_opus(self, audio: bytes) -> bytes:
+        if self._encoder is None:
+            self._encoder = opuslib.Encoder(self.sample_rate, self.num_channels, opuslib.APPLICATION_VOIP)
+
+        # Opus encodes fixed-size frames, anything left over waits for the next chunk
+        self._pending_pcm += audio
+        frame_bytes = self._opus_frame_samples * self.num_channels * 2
+        packets = []
+        while len(self._pending_pcm) >= frame_bytes:
+            packet = self._encoder.encode(self._pending_pcm[:frame_bytes], self._opus_frame_samples)
+            packets.append(struct.pack(">H", len(packet)) + packet)
+            self._pending_pcm = self._pending_pcm[frame_bytes:]
+        return b"".join(packets)
+
+    def _decode_opus(self, payload: bytes) -> bytes:
+        if opuslib is None:
+            raise ValueError("Received Opus audio but opuslib is not installed.")
+        if self._decoder is None:
+            self._decoder = opuslib.Decoder(self._in_sample_rate, self._in_num_channels)
+
+        pcm, offset = [], 0
+        frame_samples = self._in_sample_rate * 60 // 1000  # largest Opus frame
+        while offset + 2 <= len(payload):
+            (length,) = struct.unpack_from(">H", payload, offset)
+            pcm.append(self._decoder.decode(payload[offset + 2:offset + 2 + length], frame_samples))
+            offset += 2 + length
+        return b"".join(pcm)
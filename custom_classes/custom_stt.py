@@ -0,0 +1,158 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+import json
+
+from typing import Awaitable, Callable
+
+from pipecat.frames.frames import CancelFrame, EndFrame, Frame, StartFrame
+from pipecat.processors.frame_processor import FrameDirection
+from pipecat.services.deepgram import DeepgramSTTService
+
+from deepgram import DeepgramClient, DeepgramClientOptions, LiveOptions, LiveTranscriptionEvents
+
+from custom_classes.custom_frames import ParticipantJoinedFrame
+from utils.connections import WarmConnectionPool
+
+from loguru import logger
+
+DEFAULT_LIVE_OPTIONS = LiveOptions(
+    encoding="linear16",
+    language="en-US",
+    model="nova-2-conversationalai",
+    sample_rate=16000,
+    channels=1,
+    interim_results=True,
+    smart_format=True,
+)
+
+
+class DeepgramConnection:
+    """
+    A started Deepgram live connection and whoever leased it. The connection's transcript
+    handler is registered once and forwards to the current `handler`, transcripts that arrive
+    while it is not leased are dropped.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.handler: Callable[..., Awaitable[None]] | None = None
+        self.closed = False
+        # Set by the result Deepgram sends back for a Finalize message (or when the connection closes)
+        self._finalized: asyncio.Event | None = None
+
+        connection.on(LiveTranscriptionEvents.Transcript, self._on_transcript)
+        connection.on(LiveTranscriptionEvents.Close, self._on_closed)
+        connection.on(LiveTranscriptionEvents.Error, self._on_closed)
+
+    async def _on_transcript(self, *args, **kwargs):
+        if getattr(kwargs.get("result"), "from_finalize", False) and self._finalized is not None:
+            self._finalized.set()
+        if self.handler is not None:
+            await self.handler(*args, **kwargs)
+
+    async def _on_closed(self, *args, **kwargs):
+        self.closed = True
+        if self._finalized is not None:
+            self._finalized.set()
+
+    async def finalize(self, timeout: float = 3.0) -> bool:
+        """
+        Ask Deepgram to flush the audio it has received (Finalize) and wait for the result it
+        marks `from_finalize`, after which nothing from earlier audio is left to arrive.
+        Returns False if that did not happen within `timeout` (e.g. an SDK that does not report
+        `from_finalize`) or the connection closed, then the connection must not be reused.
+        """
+        if self.closed:
+            return False
+        self._finalized = asyncio.Event()
+        try:
+            if not await self.connection.send(json.dumps({"type": "Finalize"})):
+                return False
+            await asyncio.wait_for(self._finalized.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._finalized = None
+        return not self.closed
+
+
+def deepgram_connection_pool(api_key: str,
+                             url: str = "",
+                             live_options: LiveOptions = DEFAULT_LIVE_OPTIONS,
+                             size: int = 2,
+                             max_idle_secs: float | None = 300,
+                             finalize_timeout: float = 3.0) -> WarmConnectionPool[DeepgramConnection]:
+    """
+    Pool of started Deepgram live connections (kept open by the SDK's keepalive messages).
+    A released connection is only reused once Deepgram confirmed the Finalize sent on release,
+    so late results of one session can not reach the next, otherwise it is closed.
+    """
+    client = DeepgramClient(api_key, config=DeepgramClientOptions(url=url, options={"keepalive": "true"}))
+
+    async def connect() -> DeepgramConnection:
+        connection = DeepgramConnection(client.listen.asynclive.v("1"))
+        if not await connection.connection.start(live_options):
+            raise ConnectionError("Unable to connect to Deepgram")
+        return connection
+
+    async def close(connection: DeepgramConnection):
+        connection.handler = None
+        await connection.connection.finish()
+
+    return WarmConnectionPool("stt", connect, close,
+                              is_alive=lambda connection: not connection.closed,
+                              drain=lambda connection: connection.finalize(finalize_timeout),
+                              size=size,
+                              max_idle_secs=max_idle_secs)
+
+
+class PooledDeepgramSTTService(DeepgramSTTService):
+    """
+    DeepgramSTTService that leases an already open live connection from a pool when the
+    pipeline starts and hands it back when it ends, instead of connecting on start and
+    closing on stop. Falls back to its own connection if the pool can not provide one.
+    """
+    def __init__(self, pool: WarmConnectionPool[DeepgramConnection], **kwargs):
+        super().__init__(**kwargs)
+        self._pool = pool
+        self._lease: DeepgramConnection | None = None
+        self._participant_id = ""
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        if isinstance(frame, ParticipantJoinedFrame):
+            self._participant_id = frame.participant_id
+        await super().process_frame(frame, direction)
+
+    async def start(self, frame: StartFrame):
+        try:
+            self._lease = await self._pool.lease()
+        except Exception as e:
+            logger.warning(f"{self}: No pooled Deepgram connection ({e}), connecting directly")
+            await super().start(frame)
+            return
+        self._lease.handler = self._on_message
+        self._connection = self._lease.connection
+        logger.debug(f"{self}: Leased a Deepgram connection")
+
+    async def _release(self):
+        lease, self._lease = self._lease, None
+        if lease is None:
+            await self._connection.finish()
+            return
+        lease.handler = None
+        logger.debug(f"{self}: Released the Deepgram connection of {self._participant_id or 'the session'}")
+        await self._pool.release(lease, reusable=not lease.closed)
+
+    async def stop(self, frame: EndFrame):
+        await self._release()
+        await self._push_queue.put((frame, FrameDirection.DOWNSTREAM))
+        await self._push_frame_task
+
+    async def cancel(self, frame: CancelFrame):
+        await self._release()
+        self._push_frame_task.cancel()
+        await self._push_frame_task
@@ -0,0 +1,80 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+from typing import AsyncGenerator, Iterable
+
+from pipecat.frames.frames import AudioRawFrame, ErrorFrame, Frame
+from pipecat.services.elevenlabs import ElevenLabsTTSService
+
+from utils.tts_cache import TTSAudioCache
+
+from loguru import logger
+
+# What ElevenLabsTTSService asks for (output_format of its request)
+AUDIO_FORMAT = "pcm_16000"
+SAMPLE_RATE = 16000
+
+
+class CachedElevenLabsTTSService(ElevenLabsTTSService):
+    """
+    ElevenLabsTTSService with a TTSAudioCache in front: texts of up to `max_cached_chars`
+    (greetings, confirmations and other short phrases that repeat across users) are served
+    from the cache without a request once they were synthesized, longer texts always go to
+    ElevenLabs. Audio is only stored once a synthesis completed without an error.
+    """
+    def __init__(self,
+                 *,
+                 cache: TTSAudioCache,
+                 max_cached_chars: int = 120,
+                 chunk_secs: float = 0.5,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self._cache = cache
+        self._max_cached_chars = max_cached_chars
+        self._chunk_bytes = int(chunk_secs * SAMPLE_RATE) * 2
+
+    def _cache_key(self, text: str) -> str | None:
+        if len(text) > self._max_cached_chars:
+            return None
+        return TTSAudioCache.key(text, self._voice_id, self._model, AUDIO_FORMAT)
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        key = self._cache_key(text)
+        audio = await self._cache.get(key) if key else None
+        if audio is not None:
+            logger.debug(f"TTS cache hit: [{text}]")
+            await self.start_ttfb_metrics()
+            await self.stop_ttfb_metrics()
+            for start in range(0, len(audio), self._chunk_bytes):
+                yield AudioRawFrame(audio[start:start + self._chunk_bytes], SAMPLE_RATE, 1)
+            return
+
+        async for frame in self._synthesize(text, key):
+            yield frame
+
+    async def _synthesize(self, text: str, key: str | None) -> AsyncGenerator[Frame, None]:
+        chunks = []
+        failed = False
+        async for frame in super().run_tts(text):
+            if isinstance(frame, AudioRawFrame):
+                chunks.append(frame.audio)
+            elif isinstance(frame, ErrorFrame):
+                failed = True
+            yield frame
+
+        if key and chunks and not failed:
+            await self._cache.put(key, b"".join(chunks))
+
+    async def prerender(self, phrases: Iterable[str]):
+        """Synthesize the phrases that are not cached yet, so they are served without a request."""
+        for text in (phrase.strip() for phrase in phrases):
+            key = self._cache_key(text)
+            if not text or key is None or key in self._cache:
+                continue
+            async for frame in self._synthesize(text, key):
+                if isinstance(frame, ErrorFrame):
+                    logger.warning(f"Could not prerender [{text}]: {frame.error}")
+                    break
@@ -0,0 +1,271 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from pipecat.vad.vad_analyzer import VADAnalyzer, VADState
+
+if TYPE_CHECKING:
+    from pipecat.vad.silero import SileroVADAnalyzer
+
+from loguru import logger
+
+
+class VADBatchScheduler:
+    """
+    Collects the audio chunks every input transport wants analyzed and runs them through
+    VAD in batches on a single worker thread, instead of one executor hop per 32ms chunk
+    per client. Silero analyzers in the same batch share one inference call (both the torch
+    model of pipecat <= 0.0.41 and the ONNX model of later versions take a batch dimension),
+    and each transport gets its own VADState back.
+
+    Only Silero analyzers can be batched, `check` raises for any other analyzer (transports
+    check theirs when they are created, so a misconfiguration shows up on the first connection
+    instead of as a silently slower path).
+
+    A batch is dispatched once `max_batch_size` chunks are pending or `max_wait` seconds
+    after the first one arrived, whichever comes first.
+    """
+    def __init__(self, max_batch_size: int = 32, max_wait: float = 0.005):
+        if max_batch_size < 1:
+            raise ValueError("VAD batch size must be atleast 1.")
+
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        # One worker so batches (and therefore every analyzer's chunks) are analyzed in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vad")
+        self._pending: list[tuple[VADAnalyzer, bytes, asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._in_flight = 0
+        self._closed = False
+
+    @property
+    def queue_depth(self) -> int:
+        """Chunks waiting for a batch plus chunks being analyzed."""
+        return len(self._pending) + self._in_flight
+
+    @staticmethod
+    def batchable(analyzer: VADAnalyzer) -> bool:
+        return _silero_backend(analyzer) is not None
+
+    @classmethod
+    def check(cls, analyzer: VADAnalyzer):
+        if not cls.batchable(analyzer):
+            raise ValueError(f"VAD batching is enabled but {type(analyzer).__name__} can not be batched "
+                             "(only Silero analyzers can), set VAD_BATCH_MAX_SIZE=0 to analyze chunk by chunk.")
+
+    async def analyze(self, analyzer: VADAnalyzer, audio: bytes, executor: Executor | None = None) -> VADState:
+        loop = asyncio.get_running_loop()
+        if self._closed:
+            # Chunks still arriving while the process shuts down
+            return await loop.run_in_executor(executor, analyzer.analyze_audio, audio)
+        self.check(analyzer)
+
+        future = loop.create_future()
+        self._pending.append((analyzer, audio, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch or self._closed:
+            return
+
+        self._in_flight += len(batch)
+        result = asyncio.get_running_loop().run_in_executor(
+            self._executor, analyze_batch, [(analyzer, audio) for analyzer, audio, _ in batch])
+        result.add_done_callback(lambda f: self._resolve(batch, f))
+
+    def _resolve(self, batch: list[tuple[VADAnalyzer, bytes, asyncio.Future]], result: asyncio.Future):
+        self._in_flight -= len(batch)
+
+        # Fan the states back out to the transports that are still waiting for them
+        error = result.exception()
+        states = result.result() if error is None else [None] * len(batch)
+        for (_, _, future), state in zip(batch, states):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(state)
+
+    def shutdown(self):
+        self._closed = True
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        for _, _, future in pending:
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+
+def analyze_batch(items: list[tuple[VADAnalyzer, bytes]]) -> list[VADState]:
+    """Run `analyze_audio` for every (analyzer, chunk) pair, batching the model inference."""
+    states: list[VADState | None] = [None] * len(items)
+    remaining = list(range(len(items)))
+
+    # An analyzer is stateful, so if it shows up more than once its chunks are analyzed in rounds
+    while remaining:
+        seen = set()
+        current, remaining_next = [], []
+        for i in remaining:
+            if id(items[i][0]) in seen:
+                remaining_next.append(i)
+            else:
+                seen.add(id(items[i][0]))
+                current.append(i)
+        _analyze_round(items, current, states)
+        remaining = remaining_next
+    return states
+
+
+def _analyze_round(items: list[tuple[VADAnalyzer, bytes]], indexes: list[int], states: list):
+    # The analyzer only runs the model once it has buffered a full window, work out which
+    # chunks complete one and what that window is (same slicing as VADAnalyzer.analyze_audio)
+    scored: list[tuple[int, bytes]] = []
+    for i in indexes:
+        analyzer, audio = items[i]
+        num_required_bytes = analyzer._vad_frames_num_bytes
+        if len(analyzer._vad_buffer) + len(audio) >= num_required_bytes:
+            scored.append((i, (analyzer._vad_buffer + audio)[:num_required_bytes]))
+
+    confidences = batch_voice_confidence([items[i][0] for i, _ in scored], [window for _, window in scored])
+    confidence_by_index = {i: confidence for (i, _), confidence in zip(scored, confidences)}
+
+    for i in indexes:
+        analyzer, audio = items[i]
+        if i not in confidence_by_index:
+            states[i] = analyzer.analyze_audio(audio)
+            continue
+
+        # Let the analyzer run its own state machine with the confidence computed in the batch
+        analyzer.voice_confidence = lambda buffer, confidence=confidence_by_index[i]: confidence
+        try:
+            states[i] = analyzer.analyze_audio(audio)
+        finally:
+            del analyzer.voice_confidence
+
+
+def batch_voice_confidence(analyzers: list[VADAnalyzer], windows: list[bytes]) -> list[float]:
+    confidences: list[float | None] = [None] * len(analyzers)
+
+    # Silero analyzers with the same model backend and sample rate can share one inference call
+    groups: dict[tuple[str, int], list[int]] = {}
+    for i, analyzer in enumerate(analyzers):
+        backend = _silero_backend(analyzer)
+        if backend is not None:
+            groups.setdefault((backend, analyzer.sample_rate), []).append(i)
+
+    for (backend, sample_rate), indexes in groups.items():
+        try:
+            batch = _silero_batch([analyzers[i] for i in indexes], [windows[i] for i in indexes], backend, sample_rate)
+            for i, confidence in zip(indexes, batch):
+                confidences[i] = confidence
+        except Exception as e:
+            logger.warning(f"Batched Silero inference failed, analyzing one by one: {e}")
+
+    for i, analyzer in enumerate(analyzers):
+        if confidences[i] is None:
+            confidences[i] = analyzer.voice_confidence(windows[i])
+    return confidences
+
+
+# Recurrent state of one Silero v5 stream, (h, c) x batch x hidden
+SILERO_STATE_SHAPE = (2, 1, 128)
+
+
+def _silero_backend(analyzer: VADAnalyzer) -> str | None:
+    # Silero (and torch / onnxruntime) is not imported here, it is loaded by whoever creates the analyzer
+    silero = sys.modules.get("pipecat.vad.silero")
+    if silero is None or not isinstance(analyzer, silero.SileroVADAnalyzer):
+        return None
+    model = getattr(analyzer, "_model", None)
+    if not all(hasattr(model, attr) for attr in ("_state", "_context", "reset_states")):
+        return None
+    # The state is empty until the first window, afterwards it has to be a single stream's
+    if model._state.shape[-1] and tuple(model._state.shape) != SILERO_STATE_SHAPE:
+        return None
+    if hasattr(model, "session"):
+        return "onnx"
+    if hasattr(model, "_model") and hasattr(model, "_model_8k"):
+        return "torch"
+    return None
+
+
+def _silero_batch(analyzers: list["SileroVADAnalyzer"],
+                  windows: list[bytes],
+                  backend: str,
+                  sample_rate: int) -> list[float]:
+    models = [analyzer._model for analyzer in analyzers]
+    context_size = 64 if sample_rate == 16000 else 32
+
+    # Stack every stream's audio, context and recurrent state along the batch dimension. A fresh
+    # (or just reset) model has an empty context and state, it starts from silence and zeros instead
+    audio = np.stack([np.frombuffer(window, np.int16).astype(np.float32) / 32768.0 for window in windows])
+    context = np.concatenate([_as_array(model._context) if model._context.shape[-1]
+                              else np.zeros((1, context_size), np.float32) for model in models], axis=0)
+    state = np.concatenate([_as_array(model._state) if model._state.shape[-1]
+                            else np.zeros(SILERO_STATE_SHAPE, np.float32) for model in models], axis=1)
+    audio = np.concatenate((context, audio), axis=1)
+
+    if backend == "onnx":
+        out, state = models[0].session.run(None, {"input": audio,
+                                                   "state": state,
+                                                   "sr": np.array(sample_rate, dtype=np.int64)})
+    else:
+        torch = sys.modules["torch"]
+        network = models[0]._model if sample_rate == 16000 else models[0]._model_8k
+        with torch.no_grad():
+            out, state = network(torch.from_numpy(audio), torch.from_numpy(state))
+        out, state = out.numpy(), state.numpy()
+
+    # Hand each stream its slice of the new state back, in the type its model keeps
+    for j, model in enumerate(models):
+        model._state = _like(model, state[:, j:j + 1].copy())
+        model._context = _like(model, audio[j:j + 1, -context_size:].copy())
+        model._last_sr = sample_rate
+        model._last_batch_size = 1
+
+    # Same periodic reset as SileroVADAnalyzer.voice_confidence, per analyzer
+    silero = sys.modules["pipecat.vad.silero"]
+    reset_secs = getattr(silero, "_MODEL_RESET_STATES_TIME", 5.0)
+    now = time.time()
+    for analyzer in analyzers:
+        if now - analyzer._last_reset_time >= reset_secs:
+            analyzer._model.reset_states()
+            analyzer._last_reset_time = now
+    return [float(confidence) for confidence in out[:, 0]]
+
+
+def _as_array(value) -> np.ndarray:
+    # torch tensors (the torch model's state) or numpy arrays (the ONNX model's)
+    if hasattr(value, "detach"):
+        return value.detach().numpy()
+    return value
+
+
+def _like(model, array: np.ndarray):
+    if hasattr(model, "session"):
+        return array
+    return sys.modules["torch"].from_numpy(array)
@@ -5,18 +5,35 @@
 # SPDX-License-Identifier: BSD 2-Clause License
 #
 
+import asyncio
 import time
 import os
 import pvporcupine
 from pvporcupine import Porcupine
 import platform
-import struct
+import threading
 
+from concurrent.futures import Executor
+from ctypes import byref, c_int, c_short
 from enum import Enum
+from typing import Callable
 
-from pipecat.frames.frames import ErrorFrame, Frame, AudioRawFrame
+from pipecat.frames.frames import ErrorFrame, Frame, AudioRawFrame, CancelFrame, EndFrame
 from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 
+from custom_classes.custom_frames import (
+    ParticipantJoinedFrame,
+    ParticipantLeftFrame,
+    SpeechSegmentStartedFrame,
+    SpeechSegmentStoppedFrame,
+    WakeWordDetectedFrame)
+from custom_classes.custom_keywords import KeywordRegistry, KeywordSet
+from custom_classes.custom_metrics import stage_metrics_frame
+from utils.audio_buffer import AudioRingBuffer
+from utils.energy_gate import EnergyGate
+from utils.metrics import metrics
+from utils.wake_tuning import WakeStats, WakeTuner
+
 from loguru import logger
 
 
@@ -45,9 +62,6 @@ class CustomWakeCheckFilter(FrameProcessor):
             if picovoice_api_key is None:
                 raise ValueError("PicoVoice API key is required.")
             
-            if keyword_path_windows is None and keyword_path_linux is None and keyword_path_mac is None:
-                raise ValueError("Atleast one keyword path is required.")
-            
             self.current_platform = platform.system()
             if self.current_platform not in ["Windows", "Linux", "Darwin"]:
                 raise OSError("Unsupported platform by PicoVoice.")
@@ -56,62 +70,343 @@ class CustomWakeCheckFilter(FrameProcessor):
             self.path_linux = keyword_path_linux
             self.path_mac = keyword_path_mac
             
-        # Create the Porcupine handler based on the platform
-        def create_handler(self) -> Porcupine:
-            if self.current_platform == "Windows" and self.path_windows:
-                directory, filename = os.path.split(self.path_windows)
-                handler = pvporcupine.create(self._api_key, keyword_paths=[
-                                            os.path.join(directory, filename)])
-
-            if self.current_platform == "Linux" and self.path_linux:
-                directory, filename = os.path.split(self.path_linux)
-                handler = pvporcupine.create(self._api_key, keyword_paths=[
-                                            os.path.join(directory, filename)])
-
-            if self.current_platform == "Darwin" and self.path_mac:
-                directory, filename = os.path.split(self.path_mac)
-                handler = pvporcupine.create(self._api_key, keyword_paths=[
-                                            os.path.join(directory, filename)])
+        # Keyword file for the platform (only one branch applies, previously the Darwin check
+        # raised on Windows and Linux even after their handler was created)
+        def keyword_path(self) -> str:
+            if self.path_windows is None and self.path_linux is None and self.path_mac is None:
+                raise ValueError("Atleast one keyword path is required.")
+            if self.current_platform == "Windows":
+                path = self.path_windows
+            elif self.current_platform == "Linux":
+                path = self.path_linux
             else:
-                raise OSError("Atleast one keyword file must be provided or unsupported platform by PicoVoice.")
-            return handler
+                path = self.path_mac
+            if not path:
+                raise OSError(f"No keyword file provided for {self.current_platform}.")
+            return path
+
+        # Create the Porcupine handler listening for every keyword of the set at once
+        # (the platform keyword file if no set is given)
+        def create_handler(self, keyword_set: KeywordSet = None) -> Porcupine:
+            keyword_set = keyword_set or KeywordSet.from_path(self.keyword_path())
+            return pvporcupine.create(self._api_key,
+                                      keyword_paths=list(keyword_set.paths),
+                                      sensitivities=list(keyword_set.sensitivities))
 
     class ParticipantState:
-        def __init__(self, participant_id: str):
+        def __init__(self, participant_id: str, handler: Porcupine, max_buffer_secs: float,
+                     gate: EnergyGate | None = None, keyword_set: KeywordSet | None = None,
+                     keepalive_timeout: float = 3, profile: int = 0):
             self.participant_id = participant_id
+            # Keywords the handle listens for, to name the one that fired
+            self.keyword_set = keyword_set
+            # The participant's own keyword set, sensitivity profiles are offsets from it
+            self.base_keyword_set = keyword_set
+            self.profile = profile
             self.state = CustomWakeCheckFilter.WakeState.IDLE
             self.wake_timer = 0.0
-            self.accumulator = bytearray() # initialize as empty byte array to accumulate audio insteaad of text
+            # Keepalive window of this participant (adapted by the tuner if there is one)
+            self.keepalive_timeout = keepalive_timeout
+            # Recent wakes, speech after them and immediate cancels
+            self.stats = WakeStats()
+            # Whether the participant is inside a speech segment (Porcupine only scans those)
+            self.in_speech = False
+            self.speech_start: float | None = None
+            # Porcupine handle leased from the pool for this participant only (the engine keeps
+            # state between frames so it cannot be shared by concurrent audio streams)
+            self.handler = handler
+            # fixed-size ring buffer to accumulate audio instead of text, Porcupine only reads
+            # the frames it has not seen yet and the retained history is bounded
+            # (Porcupine consumes frames of 512 16-bit samples / 1024 bytes at 16kHz)
+            self.accumulator = AudioRingBuffer(int(max_buffer_secs * handler.sample_rate) * 2,
+                                               handler.frame_length * 2)
+            # Batch of frames being scanned in the executor (only one per participant at a time,
+            # so the leased handle is never used from two threads)
+            self.scan_task: asyncio.Task | None = None
+            # Optional energy gate, frames it considers silent are not given to Porcupine
+            self.gate = gate
+            # Held while a frame is handled and while a detection from the scan task is resolved,
+            # so live audio can not overtake the buffered audio pushed on a wake
+            self.wake_lock = asyncio.Lock()
 
     def __init__(self, keepalive_timeout: float = 3,
                  user_id: str = None,
                  keyword_path_windows: str = None,
                  keyword_path_linux: str = None,
-                 keyword_path_mac: str = None):
+                 keyword_path_mac: str = None,
+                 max_buffer_secs: float = 5.0,
+                 pool: "PorcupinePool" = None,
+                 executor: Executor = None,
+                 pre_roll_secs: float = 0.0,
+                 scan_pre_roll_secs: float = 0.5,
+                 energy_gate_dbfs: float | None = None,
+                 energy_gate_hangover_secs: float = 0.3,
+                 tuner: WakeTuner | None = None,
+                 clock: Callable[[], float] = time.time):
         
         # Wake phrases are not used in this filter, instead we use the Porcupine wake word detection engine
         # so we pass an empty list to the super class
         super().__init__(wake_phrases=[""], keepalive_timeout=keepalive_timeout)
         
         self._participant_states = {}
+        # Participants whose audio is dropped until the pool has a handle for them
+        self._waiting_for_handle: set[str] = set()
         self._keepalive_timeout = keepalive_timeout
         self._wake_patterns = []
+        self._max_buffer_secs = max_buffer_secs
         
-        # Initialize the Porcupine handler as a class attribute (atleast one keyword file is required)
-        self.pico_handler = CustomWakeCheckFilter.PicoHandle(os.getenv("PICOVOICE_API_KEY"),
-                                                                keyword_path_windows,
-                                                                keyword_path_linux,
-                                                                keyword_path_mac).create_handler()
-                                                       
-                                                       
+        # On detection everything said after the keyword (still in the participant's buffer) is sent on
+        # in one frame so it reaches STT, plus `pre_roll_secs` of audio before the end of the keyword
+        if pre_roll_secs > max_buffer_secs:
+            raise ValueError("Pre-roll can not be longer than the buffered audio.")
+        self._pre_roll_secs = pre_roll_secs
         
-        # variable to keep track of the state of the participant variable (if assigned or not)
-        # so we do not run into issues with accessing the participant state
-        self.p_assigned = False
+        # When a speech segment starts, Porcupine only scans the audio from `scan_pre_roll_secs` (or the
+        # pre-roll, if longer) before the onset, enough for a keyword VAD was late on. Older unread audio
+        # is never scanned, so the onset does not cost a burst of up to `max_buffer_secs` of frames
+        self._scan_pre_roll_secs = max(pre_roll_secs, scan_pre_roll_secs)
         
-        # User ID is required to keep track of the state of the participant
-        # AudioRawFrame does not have a user_id attribute so we need to pass it in
+        # With `energy_gate_dbfs`, Porcupine is skipped for frames quieter than that level
+        # (kept open for `energy_gate_hangover_secs` after speech so word endings are not cut)
+        self._energy_gate_dbfs = energy_gate_dbfs
+        self._energy_gate_hangover_secs = energy_gate_hangover_secs
+        
+        # Porcupine handles are leased per participant from a pool that can be shared by every
+        # pipeline in the process. Without one, a single handle pool is built from the keyword files
+        # (atleast one keyword file is required)
+        if pool is None:
+            pool = PorcupinePool(1, keyword_path_windows, keyword_path_linux, keyword_path_mac)
+        self._pool = pool
+        
+        # With a tuner, each participant's keepalive window and sensitivity profile follow their
+        # wake stats (keepalive_timeout is where the window starts). `clock` gives the time in
+        # seconds (the audio position when replaying recordings offline)
+        self._tuner = tuner
+        self._clock = clock
+        
+        # When an executor (thread pool) is given, Porcupine runs in batches on the executor
+        # instead of blocking the event loop that also handles websocket reads, VAD and TTS output
+        self._executor = executor
+        
+        # User ID used until the transport announces the connected participant
+        # AudioRawFrame does not have a user_id attribute so the current participant is tracked here
         self.user_id = user_id
+        self._participant_id = user_id
+
+    def _participant_state(self, participant_id: str) -> "CustomWakeCheckFilter.ParticipantState":
+        p = self._participant_states.get(participant_id)
+        if p is None:
+            handler = self._pool.lease(participant_id)
+            gate = None
+            if self._energy_gate_dbfs is not None:
+                frame_secs = handler.frame_length / handler.sample_rate
+                gate = EnergyGate(self._energy_gate_dbfs, round(self._energy_gate_hangover_secs / frame_secs))
+            p = CustomWakeCheckFilter.ParticipantState(participant_id, handler, self._max_buffer_secs, gate,
+                                                       self._pool.keyword_set(participant_id),
+                                                       self._keepalive_timeout,
+                                                       self._tuner.default_profile if self._tuner else 0)
+            self._participant_states[participant_id] = p
+            metrics.set_gauge("wake_buffer_bytes", lambda: p.accumulator.retained, participant_id)
+            metrics.set_gauge("wake_keepalive_secs", lambda: p.keepalive_timeout, participant_id)
+            if self._tuner is not None:
+                metrics.set_gauge("wake_sensitivity_offset", lambda: self._tuner.profiles[p.profile], participant_id)
+        return p
+
+    def _lease_participant(self, participant_id: str) -> "CustomWakeCheckFilter.ParticipantState | None":
+        # While every handle is in use the participant's audio is dropped (it is not passed on before
+        # a wake anyway) and the lease is tried again with the next frame, logged once per participant
+        try:
+            p = self._participant_state(participant_id)
+        except PorcupinePoolExhausted as e:
+            if participant_id not in self._waiting_for_handle:
+                self._waiting_for_handle.add(participant_id)
+                logger.warning(f"No Porcupine handle for {participant_id} yet, dropping their audio until one is free: {e}")
+            metrics.increment("porcupine_pool_exhausted", participant_id)
+            return None
+        if participant_id in self._waiting_for_handle:
+            self._waiting_for_handle.discard(participant_id)
+            logger.info(f"Got a Porcupine handle for {participant_id}")
+        return p
+
+    async def _release_participant(self, participant_id: str):
+        self._waiting_for_handle.discard(participant_id)
+        p = self._participant_states.pop(participant_id, None)
+        if p is not None:
+            # The handle can only go back to the pool once no worker is using it anymore
+            if p.scan_task is not None:
+                try:
+                    await p.scan_task
+                except Exception:
+                    pass
+            self._pool.release(participant_id)
+            metrics.forget(participant_id)
+
+    async def _wake(self, p: "CustomWakeCheckFilter.ParticipantState", frame: AudioRawFrame,
+                    keyword_end: int, keyword_index: int):
+        keyword = p.keyword_set.keyword(keyword_index) if p.keyword_set else ""
+        logger.debug(f"Porcupine wake word {keyword or keyword_index} triggered for {p.participant_id}")
+        p.wake_timer = self._clock()
+        p.stats.on_wake(p.wake_timer)
+        if p.stats.rewoken[-1]:
+            metrics.increment("wake_rewakes", p.participant_id)
+        if p.stats.missed[-1]:
+            metrics.increment("wake_after_miss", p.participant_id)
+        
+        # How long the end of the keyword waited in the buffer before it was detected, downstream
+        # stages measure their latency from this point
+        detection_latency = (p.accumulator.write_pos - keyword_end) / (p.handler.sample_rate * 2)
+        metrics.mark("wake", p.participant_id)
+        metrics.increment("wake_detections", p.participant_id)
+        metrics.observe("wake_detection", p.participant_id, detection_latency)
+        await self.push_frame(stage_metrics_frame("wake_detection", p.participant_id, detection_latency))
+        
+        # Which keyword fired, so downstream can route by keyword (see KeywordFilter)
+        await self.push_frame(WakeWordDetectedFrame(p.participant_id, keyword_index, keyword))
+        
+        # Found the wake word. Pass on the audio from the end of the keyword (minus the pre-roll)
+        # up to now as one frame, so what was said in the same breath is not lost, then start over
+        pre_roll_bytes = int(self._pre_roll_secs * p.handler.sample_rate) * 2
+        audio = p.accumulator.since(keyword_end - pre_roll_bytes)
+        p.accumulator.clear()
+        if p.gate is not None:
+            p.gate.reset()
+        if audio:
+            await self.push_frame(AudioRawFrame(audio=audio,
+                                                sample_rate=frame.sample_rate,
+                                                num_channels=frame.num_channels))
+
+        # Only now let live audio through, after the audio that came before it
+        p.state = CustomWakeCheckFilter.WakeState.AWAKE
+
+    async def _end_window(self, p: "CustomWakeCheckFilter.ParticipantState", now: float):
+        # The part of a speech segment that is still going on counts for the window that ends
+        if p.in_speech and p.speech_start is not None:
+            p.stats.on_speech(p.speech_start, now)
+            p.speech_start = now
+        if p.stats.on_window_end(now):
+            metrics.increment("wake_false_wakes", p.participant_id)
+        if self._tuner is None:
+            return
+
+        p.keepalive_timeout = self._tuner.keepalive(p.stats)
+        profile = self._tuner.profile(p.stats, p.profile)
+        if profile == p.profile:
+            return
+        keyword_set = p.base_keyword_set.adjusted(self._tuner.profiles[profile])
+        if p.scan_task is not None and not p.scan_task.done():
+            await p.scan_task
+        try:
+            # Creating a handle (if none is idle for these sensitivities) blocks, keep it off the event loop
+            p.handler = await self.get_event_loop().run_in_executor(
+                self._executor, self._pool.switch, p.participant_id, keyword_set)
+        except Exception as e:
+            logger.warning(f"Could not switch {p.participant_id} to sensitivities {keyword_set.sensitivities}: {e}")
+            return
+        logger.debug(f"Wake word sensitivity of {p.participant_id} moved to {keyword_set.sensitivities} "
+                     f"(false wakes {p.stats.false_wake_rate:.0%}, wakes after a miss {p.stats.missed_rate:.0%}), "
+                     f"keepalive {p.keepalive_timeout:.1f}s")
+        p.profile = profile
+        p.keyword_set = keyword_set
+        if p.gate is not None:
+            p.gate.reset()
+
+    def _observe_backlog(self, p: "CustomWakeCheckFilter.ParticipantState"):
+        # Audio that is waiting for Porcupine (e.g. buffered until the participant started speaking)
+        if p.accumulator.unread >= p.accumulator.frame_bytes:
+            metrics.observe("wake_scan_backlog", p.participant_id,
+                            p.accumulator.unread / (p.handler.sample_rate * 2))
+
+    def _frames_to_scan(self, p: "CustomWakeCheckFilter.ParticipantState"):
+        """
+        Yield (end position, frame) for every unread frame Porcupine should see. The ring buffer
+        only hands out complete frames (512 samples, Porcupine's requirement) that have not been
+        read yet, so each sample is only scanned once. Frames the energy gate rejects are skipped.
+        """
+        chunk = p.accumulator.read_frame()
+        while chunk is not None:
+            end = p.accumulator.read_pos
+            rewind = 0 if p.gate is None else p.gate.admit(chunk)
+            if rewind is None:
+                metrics.increment("porcupine_frames_skipped", p.participant_id)
+            else:
+                if rewind:
+                    # Speech started after skipped frames, scan the ones right before the onset
+                    # first so the start of the keyword is not clipped
+                    frame_bytes = p.accumulator.frame_bytes
+                    start = end - frame_bytes
+                    prior = p.accumulator.since(start - rewind * frame_bytes, start)
+                    prior = memoryview(prior)[len(prior) % frame_bytes:]
+                    for offset in range(0, len(prior), frame_bytes):
+                        yield start - len(prior) + offset + frame_bytes, prior[offset:offset + frame_bytes]
+                yield end, chunk
+            chunk = p.accumulator.read_frame()
+
+    async def _scan(self, p: "CustomWakeCheckFilter.ParticipantState", frame: AudioRawFrame):
+        self._observe_backlog(p)
+        for end, chunk in self._frames_to_scan(p):
+            # The frame's bytes go to Porcupine as they are (16-bit signed linear PCM), no Python int per sample
+            self.match = porcupine_process(p.handler, chunk)
+            metrics.increment("porcupine_frames", p.participant_id)
+            if self.match >= 0:
+                # The keyword ends with the frame that was just scanned
+                await self._wake(p, frame, end, self.match)
+                break  # Exit the loop if a match is found
+
+    async def _scan_offloaded(self, p: "CustomWakeCheckFilter.ParticipantState", frame: AudioRawFrame):
+        try:
+            while p.state == CustomWakeCheckFilter.WakeState.IDLE:
+                # Copy the pending frames out of the ring buffer, it keeps being written while the worker runs
+                self._observe_backlog(p)
+                batch, batch_ends = [], []
+                for end, chunk in self._frames_to_scan(p):
+                    batch.append(bytes(chunk))
+                    batch_ends.append(end)
+                if not batch:
+                    break
+
+                index, self.match = await self.get_event_loop().run_in_executor(
+                    self._executor, process_batch, p.handler, batch)
+                metrics.increment("porcupine_frames", p.participant_id, len(batch) if index < 0 else index + 1)
+
+                # Detections are resolved back on the loop (the participant may have left meanwhile),
+                # audio that arrived while the batch was processed is still in the buffer
+                if self.match >= 0 and self._participant_states.get(p.participant_id) is p:
+                    async with p.wake_lock:
+                        await self._wake(p, frame, batch_ends[index], self.match)
+        except Exception as e:
+            error_msg = f"Error in wake word filter: {e}"
+            logger.error(error_msg)
+            await self.push_error(ErrorFrame(error_msg))
+
+    async def _process_audio(self, p: "CustomWakeCheckFilter.ParticipantState", frame: AudioRawFrame):
+        # If we have been AWAKE within the last keepalive_timeout seconds, pass
+        # the frame through
+        if p.state == CustomWakeCheckFilter.WakeState.AWAKE:
+            now = self._clock()
+            if now - p.wake_timer < p.keepalive_timeout:
+                await self.push_frame(frame)
+                return
+            else:
+                p.state = CustomWakeCheckFilter.WakeState.IDLE
+                logger.debug("Wake phrase keepalive timeout has expired. Listening for wake word again.")
+                await self._end_window(p, now)
+        
+                # reseting wake timer here instead of in the above if block
+                # (previously reset in the above if block caused issues)
+                p.wake_timer = now
+        
+        # accumulate audio outside loop to avoid losing audio / user input
+        # (the ring buffer overwrites the oldest audio instead of growing)
+        p.accumulator.write(frame.audio)
+        
+        # only scan while the participant is speaking (between the transport's speech segment frames),
+        # the audio right before the segment was detected is still unread in the buffer and scanned first
+        if p.in_speech and p.state == CustomWakeCheckFilter.WakeState.IDLE:
+            if self._executor is None:
+                await self._scan(p, frame)
+            elif p.scan_task is None or p.scan_task.done():
+                # Frames that arrive while a batch is in flight are picked up by the same task
+                p.scan_task = self.get_event_loop().create_task(self._scan_offloaded(p, frame))
 
     async def process_frame(self, frame: Frame, direction: FrameDirection):
         await super().process_frame(frame, direction)
@@ -119,68 +414,260 @@ class CustomWakeCheckFilter(FrameProcessor):
         try:
             # If the frame is an AudioRawFrame, process it (instead of TranscriptionFrame as in the base class)
             if isinstance(frame, AudioRawFrame):
-                p = self._participant_states.get(self.user_id)
-                if not self.p_assigned:
-                    if p is None:
-                        p = CustomWakeCheckFilter.ParticipantState(self.user_id)
-                        self._participant_states[self.user_id] = p
-                    self.p_assigned = True
-
-                # If we have been AWAKE within the last keepalive_timeout seconds, pass
-                # the frame through
-                if self.p_assigned and p is not None:
-                    if p.state == CustomWakeCheckFilter.WakeState.AWAKE:
-                        if time.time() - p.wake_timer < self._keepalive_timeout:
-                            await self.push_frame(frame)
-                            return
-                        else:
-                            p.state = CustomWakeCheckFilter.WakeState.IDLE
-                            self.p_assigned = False
-                            logger.debug("Wake phrase keepalive timeout has expired. Listening for wake word again.")
-                            
-                            # reseting wake timer here instead of in the above if block
-                            # (previously reset in the above if block caused issues)
-                            p.wake_timer = time.time()
-                    
-                    # accumulate audio outside loop to avoid losing audio / user input
-                    p.accumulator += frame.audio    
-                    
-                    # if the previous FrameProcessor was interrupted (this attribute is added in the new CustomFrameProcessor class)
-                    while self._prev._interrupted and p.state == CustomWakeCheckFilter.WakeState.IDLE:
-                        # accumulate until we have enough audio to process (1024 samples is the max due to Porcupine's requirements)
-                        if len(p.accumulator) >= 1024:
-                            processing_audio = p.accumulator
-                            
-                            # Convert the audio to linear PCM and make into list (required by Porcupine to be 16-bit signed integers)
-                            linear_audio = struct.unpack(str(len(processing_audio) // 2) + 'h', processing_audio)
-                            linear_audio = list(linear_audio)
-                            
-                            # Process chunks of 512 samples (1024/2 bytes) at a time (Porcupine's requirements)
-                            i = 0
-                            while i < len(linear_audio):
-                                chunk = linear_audio[i:i+512]
-                                if len(chunk) == 512:
-                                    self.match = self.pico_handler.process(chunk)
-                                    if self.match >= 0:
-                                        logger.debug("Porcupine wake word triggered")
-                                        # Found the wake word. Discard from the accumulator up to the start of the match
-                                        # and modify the frame in place.
-                                        p.state = CustomWakeCheckFilter.WakeState.AWAKE
-                                        p.wake_timer = time.time()
-                                        p.accumulator = bytearray()
-                                        await self.push_frame(frame)
-                                        break  # Exit the loop if a match is found
-                                i += 512
-                            else:
-                                pass
-                        break
-                    else:
-                        pass
-                else:
-                    pass
+                p = self._lease_participant(self._participant_id)
+                if p is None:
+                    return
+                # Waits while the scan task resolves a wake (and pushes the buffered audio first)
+                async with p.wake_lock:
+                    await self._process_audio(p, frame)
+            elif isinstance(frame, ParticipantJoinedFrame):
+                # New connection on the transport, following audio belongs to this participant. The
+                # transport serves one connection at a time and announces a replacing connection before
+                # the replaced one leaves, so hand the earlier participants' handles back first (with a
+                # pool of one the new participant could not get a handle otherwise)
+                for participant_id in list(self._participant_states):
+                    if participant_id != frame.participant_id:
+                        await self._release_participant(participant_id)
+                self._participant_id = frame.participant_id
+                self._lease_participant(frame.participant_id)
+                await self.push_frame(frame, direction)
+            elif isinstance(frame, SpeechSegmentStartedFrame):
+                p = self._lease_participant(frame.participant_id or self._participant_id)
+                if p is not None:
+                    p.in_speech = True
+                    p.speech_start = self._clock()
+                    skipped = p.accumulator.skip(int(self._scan_pre_roll_secs * p.handler.sample_rate) * 2)
+                    if skipped:
+                        metrics.increment("porcupine_frames_skipped", p.participant_id,
+                                          skipped // p.accumulator.frame_bytes)
+                await self.push_frame(frame, direction)
+            elif isinstance(frame, SpeechSegmentStoppedFrame):
+                p = self._participant_states.get(frame.participant_id or self._participant_id)
+                if p is not None:
+                    p.in_speech = False
+                    if p.speech_start is not None:
+                        p.stats.on_speech(p.speech_start, self._clock())
+                        p.speech_start = None
+                await self.push_frame(frame, direction)
+            elif isinstance(frame, ParticipantLeftFrame):
+                # Give the Porcupine handle back to the pool so the next connection can reuse it
+                await self._release_participant(frame.participant_id)
+                if self._participant_id == frame.participant_id:
+                    self._participant_id = self.user_id
+                await self.push_frame(frame, direction)
+            elif isinstance(frame, (EndFrame, CancelFrame)):
+                for participant_id in list(self._participant_states):
+                    await self._release_participant(participant_id)
+                await self.push_frame(frame, direction)
             else:
                 await self.push_frame(frame, direction)
         except Exception as e:
             error_msg = f"Error in wake word filter: {e}"
             logger.error(error_msg)
             await self.push_error(ErrorFrame(error_msg))
+
+
+def process_batch(handler: Porcupine, batch: list[bytes]) -> tuple[int, int]:
+    """
+    Run Porcupine over a batch of frames (on an executor thread, the library call releases the GIL).
+    Returns the index of the frame that triggered and the keyword index, or (-1, -1).
+    """
+    for i, chunk in enumerate(batch):
+        match = porcupine_process(handler, chunk)
+        if match >= 0:
+            return i, match
+    return -1, -1
+
+
+# Private pvporcupine attributes porcupine_process relies on (written against pvporcupine 4.0.3,
+# pinned in requirements.txt), checked on every handle the pool creates
+PORCUPINE_CLASS_INTERNALS = ("PicovoiceStatuses", "_PICOVOICE_STATUS_TO_EXCEPTION")
+PORCUPINE_HANDLE_INTERNALS = ("_process_func", "_handle", "_get_error_stack")
+
+
+def check_porcupine_internals(handler: Porcupine):
+    missing = [name for name in PORCUPINE_CLASS_INTERNALS if not hasattr(Porcupine, name)]
+    missing += [name for name in PORCUPINE_HANDLE_INTERNALS if not hasattr(handler, name)]
+    if missing:
+        raise RuntimeError(f"This pvporcupine version has no {', '.join(missing)}, which the wake word filter "
+                           "relies on. Install the version pinned in requirements.txt.")
+
+
+def porcupine_process(handler: Porcupine, frame: bytes | memoryview) -> int:
+    """
+    Run Porcupine on one frame of 16-bit PCM bytes. `Porcupine.process` takes a sequence of ints
+    and builds its C array from it one Python int per sample, so with a pvporcupine handle the
+    bytes are copied into the C array in one go and passed to the same native call instead.
+    Other handlers (e.g. the benchmark fakes) get an int16 view of the frame through `process`.
+    """
+    if not isinstance(handler, Porcupine):
+        return handler.process(memoryview(frame).cast('h'))
+
+    if len(frame) != handler.frame_length * 2:
+        raise ValueError(f"Invalid frame length. expected {handler.frame_length} but received {len(frame) // 2}")
+    result = c_int()
+    status = handler._process_func(handler._handle, (c_short * handler.frame_length).from_buffer_copy(frame),
+                                   byref(result))
+    if status is not Porcupine.PicovoiceStatuses.SUCCESS:
+        raise Porcupine._PICOVOICE_STATUS_TO_EXCEPTION[status](message="Processing failed",
+                                                               message_stack=handler._get_error_stack())
+    return result.value
+
+
+class PorcupinePoolExhausted(RuntimeError):
+    """Every handle of the pool is leased (or idle for other keywords that can not be replaced)."""
+
+
+class PorcupinePool:
+    """
+    Pool of Porcupine handles that can be shared by every wake word filter in the process.
+    A handle is leased to a participant while it is connected and returned to the pool on
+    disconnect, so new connections reuse existing handles instead of calling `pvporcupine.create`.
+    At most `size` handles are ever created (one per concurrent participant).
+
+    With a KeywordRegistry, each participant gets a handle for their keyword set (one engine
+    listening for all of its keywords) and idle handles are kept per set, so participants with
+    the same keywords reuse each other's handles. When the pool is full, an idle handle of
+    another set is deleted to make room. Without one, every handle uses the platform keyword file.
+    """
+    def __init__(self,
+                 size: int = 8,
+                 keyword_path_windows: str = None,
+                 keyword_path_linux: str = None,
+                 keyword_path_mac: str = None,
+                 picovoice_api_key: str = None,
+                 registry: KeywordRegistry = None):
+        
+        if size < 1:
+            raise ValueError("Porcupine pool size must be atleast 1.")
+        
+        self.size = size
+        self._pico_handle = CustomWakeCheckFilter.PicoHandle(picovoice_api_key or os.getenv("PICOVOICE_API_KEY"),
+                                                             keyword_path_windows,
+                                                             keyword_path_linux,
+                                                             keyword_path_mac)
+        self.registry = registry
+        self.default_keyword_set = (registry.keyword_set() if registry is not None
+                                    else KeywordSet.from_path(self._pico_handle.keyword_path()))
+        self._created = 0
+        self._idle: dict[KeywordSet, list[Porcupine]] = {}
+        self._leases: dict[str, tuple[KeywordSet, Porcupine]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def leased(self) -> int:
+        return len(self._leases)
+
+    @property
+    def idle(self) -> int:
+        return sum(len(handlers) for handlers in self._idle.values())
+
+    @property
+    def available(self) -> int:
+        """Participants that can still get a handle (idle handles of any keyword set can be replaced)."""
+        return self.size - len(self._leases)
+
+    def keyword_set(self, participant_id: str) -> KeywordSet:
+        """Keyword set of the participant's lease (or the one they would get)."""
+        lease = self._leases.get(participant_id)
+        if lease is not None:
+            return lease[0]
+        return self.registry.for_participant(participant_id) if self.registry is not None else self.default_keyword_set
+
+    def preload(self, keyword_sets: list[KeywordSet]):
+        """Create one idle handle for each keyword set that has none (e.g. sensitivity profiles), while there is room."""
+        for keyword_set in keyword_sets:
+            with self._lock:
+                if self._idle.get(keyword_set) or self._created >= self.size:
+                    continue
+            handler = self._create(keyword_set)
+            with self._lock:
+                self._idle.setdefault(keyword_set, []).append(handler)
+
+    def prefill(self, count: int = None):
+        """
+        Create idle handles for the default keywords ahead of time (up to `count`, while the pool
+        has room) so the first connections do not pay for it. Handles of other keyword sets, e.g.
+        preloaded sensitivity profiles, do not count towards `count`.
+        """
+        count = self.size if count is None else min(count, self.size)
+        while True:
+            with self._lock:
+                if len(self._idle.get(self.default_keyword_set, [])) >= count or self._created >= self.size:
+                    return
+            handler = self._create(self.default_keyword_set)
+            with self._lock:
+                self._idle.setdefault(self.default_keyword_set, []).append(handler)
+
+    def _create(self, keyword_set: KeywordSet) -> Porcupine:
+        evicted = None
+        with self._lock:
+            if self._created >= self.size:
+                # Make room by dropping an idle handle that listens for other keywords
+                for other, handlers in self._idle.items():
+                    if other != keyword_set and handlers:
+                        evicted = handlers.pop()
+                        self._created -= 1
+                        break
+                else:
+                    raise PorcupinePoolExhausted(f"Porcupine pool exhausted ({self.size} handles in use).")
+            self._created += 1
+        if evicted is not None:
+            evicted.delete()
+        try:
+            handler = self._pico_handle.create_handler(keyword_set)
+            if isinstance(handler, Porcupine):
+                try:
+                    check_porcupine_internals(handler)
+                except RuntimeError:
+                    handler.delete()
+                    raise
+            return handler
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def lease(self, participant_id: str, keyword_set: KeywordSet = None) -> Porcupine:
+        keyword_set = keyword_set or self.keyword_set(participant_id)
+        with self._lock:
+            lease = self._leases.get(participant_id)
+            handler = lease[1] if lease else None
+            if handler is None and self._idle.get(keyword_set):
+                handler = self._idle[keyword_set].pop()
+                self._leases[participant_id] = (keyword_set, handler)
+        if handler is None:
+            handler = self._create(keyword_set)
+            with self._lock:
+                self._leases[participant_id] = (keyword_set, handler)
+            logger.debug(f"Created Porcupine handle {self._created}/{self.size} for {participant_id} "
+                         f"({', '.join(keyword_set.names)})")
+        return handler
+
+    def switch(self, participant_id: str, keyword_set: KeywordSet) -> Porcupine:
+        """Lease the participant a handle for another keyword set (e.g. other sensitivities) instead of theirs."""
+        previous = self.keyword_set(participant_id)
+        self.release(participant_id)
+        try:
+            return self.lease(participant_id, keyword_set)
+        except Exception:
+            # Keep the handle they had
+            self.lease(participant_id, previous)
+            raise
+
+    def release(self, participant_id: str):
+        with self._lock:
+            lease = self._leases.pop(participant_id, None)
+            if lease is not None:
+                keyword_set, handler = lease
+                self._idle.setdefault(keyword_set, []).append(handler)
+
+    def close(self):
+        with self._lock:
+            handlers = [handler for idle in self._idle.values() for handler in idle]
+            handlers += [handler for _, handler in self._leases.values()]
+            self._idle = {}
+            self._leases = {}
+            self._created = 0
+        for handler in handlers:
+            handler.delete()
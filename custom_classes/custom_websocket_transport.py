@@ -6,8 +6,19 @@
 #
 
 import asyncio
+import inspect
+import io
+import time
+import uuid
+import wave
+
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from urllib.parse import parse_qs, urlparse
 
 from pipecat.frames.frames import AudioRawFrame, StartFrame
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineTask
 from pipecat.processors.frame_processor import FrameProcessor
 from pipecat.transports.base_input import BaseInputTransport
 from pipecat.transports.base_transport import BaseTransport, TransportParams
@@ -25,6 +36,7 @@ from pipecat.frames.frames import (
     UserStoppedSpeakingFrame)
 from pipecat.transports.base_transport import TransportParams
 from pipecat.transports.network.websocket_server import WebsocketServerParams, WebsocketServerCallbacks, WebsocketServerOutputTransport
+from pipecat.serializers.base_serializer import FrameSerializer
 
 from pipecat.vad.vad_analyzer import VADAnalyzer, VADState
 
@@ -42,52 +54,116 @@ from enum import Enum
 from pipecat.frames.frames import ErrorFrame, Frame, MetricsFrame, StartFrame, UserStoppedSpeakingFrame
 from pipecat.utils.utils import obj_count, obj_id
 
+from utils.energy_gate import EnergyGate
+from utils.frame_queue import BoundedFrameQueue, QueueLimits
+from utils.metrics import metrics
 
-class CustomFrameProcessor(FrameProcessor):
+from custom_classes.custom_frames import (
+    ParticipantJoinedFrame,
+    ParticipantLeftFrame,
+    SpeechSegmentStartedFrame,
+    SpeechSegmentStoppedFrame)
+from custom_classes.custom_metrics import stage_metrics_frame
+from custom_classes.custom_serializer import PCMStreamSerializer, UnsupportedCodecError
+from custom_classes.custom_vad_scheduler import VADBatchScheduler
+
+
+MAX_PARTICIPANT_ID_LENGTH = 128
 
-    def __init__(
-            self,
-            name: str | None = None,
-            loop: asyncio.AbstractEventLoop | None = None,
-            **kwargs):
-        
-        super().__init__(name, loop, **kwargs)
-        
-        # Interrupted state
-        self._interrupted = False
+
+@dataclass
+class WireFormat:
+    """How one connection's messages are encoded, negotiated when the client connects."""
+    serializer: FrameSerializer
+    add_wav_header: bool
 
 
 class CustomBaseInputTransport(BaseInputTransport):
 
-    def __init__(self, params: TransportParams, **kwargs):
+    def __init__(self,
+                 params: TransportParams,
+                 vad_scheduler: VADBatchScheduler | None = None,
+                 queue_limits: QueueLimits | None = None,
+                 **kwargs):
+        # With limits, the audio input queue (before VAD) and the push queue (after VAD) each hold
+        # a bounded amount of audio instead of growing behind a slow consumer. Set before the base
+        # class creates the push queue
+        self._queue_limits = queue_limits
+        self._silence_gate = EnergyGate()
+        
         super().__init__(params, **kwargs)
         
-        self._interrupted = False
+        # Participant whose audio is coming in, and the start of their current speech segment
+        # (announced downstream with SpeechSegmentStartedFrame / SpeechSegmentStoppedFrame)
+        self._participant_id = ""
+        self._segment_start: float | None = None
+        
+        # Shared scheduler that batches VAD analysis across transports (None runs one executor call per chunk)
+        self._vad_scheduler = vad_scheduler
+        if vad_scheduler is not None and params.vad_analyzer is not None:
+            vad_scheduler.check(params.vad_analyzer)
+
+    #
+    # Bounded queues
+    #
+
+    def _new_queue(self, name: str) -> asyncio.Queue | BoundedFrameQueue:
+        if self._queue_limits is None:
+            return asyncio.Queue()
+        return BoundedFrameQueue(self._queue_limits, self._is_speech,
+                                 lambda frame: metrics.increment(f"{name}_frames_dropped", self._participant_id))
+
+    def _is_speech(self, frame: AudioRawFrame) -> bool:
+        # Inside a speech segment everything counts as speech, outside only what is loud enough
+        return self._segment_start is not None or self._silence_gate.is_speech(frame.audio)
+
+    def _observe_queues(self):
+        # Depth gauges are per participant (they are forgotten when the participant leaves)
+        for name, queue in (("audio_in", getattr(self, "_audio_in_queue", None)), ("push", self._push_queue)):
+            if isinstance(queue, BoundedFrameQueue):
+                metrics.set_gauge(f"{name}_queue_depth", lambda queue=queue: queue.qsize(), self._participant_id)
+
+    async def start(self, frame: StartFrame):
+        # Same as the base class, with the audio input queue bounded
+        if self._params.audio_in_enabled or self._params.vad_enabled:
+            self._audio_in_queue = self._new_queue("audio_in")
+            self._audio_task = self.get_event_loop().create_task(self._audio_task_handler())
+
+    def _create_push_task(self):
+        loop = self.get_event_loop()
+        self._push_queue = self._new_queue("push")
+        self._push_frame_task = loop.create_task(self._push_frame_task_handler())
 
     #
     # Handle interruptions
     #
 
     async def _handle_interruptions(self, frame: Frame):
-        if self.interruptions_allowed:
-            # Make sure we notify about interruptions quickly out-of-band
-            if isinstance(frame, UserStartedSpeakingFrame):
-                logger.debug("User started speaking")
-                
-                self._interrupted = True # Set the interrupted state to True
-                
-                self._push_frame_task.cancel()
-                await self._push_frame_task
+        if isinstance(frame, UserStartedSpeakingFrame):
+            logger.debug("User started speaking")
+            
+            # Queued in order with the audio, so the frames after it are exactly the speech segment
+            self._segment_start = time.time()
+            await self._internal_push_frame(SpeechSegmentStartedFrame(self._participant_id, self._segment_start))
+            
+            if self.interruptions_allowed:
+                # Make sure we notify about interruptions quickly out-of-band. The push task is
+                # left running: it only holds the user's own audio, which downstream still needs
                 await self.push_frame(StartInterruptionFrame())
-                self._create_push_task()
-            elif isinstance(frame, UserStoppedSpeakingFrame):
-                logger.debug("User stopped speaking")
-                
-                self._interrupted = False # Set the interrupted state to False
-                
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            logger.debug("User stopped speaking")
+            
+            if self.interruptions_allowed:
                 await self.push_frame(StopInterruptionFrame())
+            await self._end_speech_segment()
         await self._internal_push_frame(frame)
 
+    async def _end_speech_segment(self):
+        if self._segment_start is not None:
+            await self._internal_push_frame(
+                SpeechSegmentStoppedFrame(self._participant_id, self._segment_start, time.time()))
+            self._segment_start = None
+
     #
     # Audio input
     #
@@ -95,7 +171,9 @@ class CustomBaseInputTransport(BaseInputTransport):
     async def _vad_analyze(self, audio_frames: bytes) -> VADState:
         state = VADState.QUIET
         vad_analyzer = self.vad_analyzer()
-        if vad_analyzer:
+        if vad_analyzer and self._vad_scheduler:
+            state = await self._vad_scheduler.analyze(vad_analyzer, audio_frames, self._executor)
+        elif vad_analyzer:
             state = await self.get_event_loop().run_in_executor(
                 self._executor, vad_analyzer.analyze_audio, audio_frames)
         return state
@@ -126,6 +204,7 @@ class CustomWebsocketServerInputTransport(CustomBaseInputTransport):
             port: int,
             params: WebsocketServerParams,
             callbacks: WebsocketServerCallbacks,
+            process_request: Callable | None = None,
             **kwargs):
         super().__init__(params, **kwargs)
 
@@ -133,9 +212,20 @@ class CustomWebsocketServerInputTransport(CustomBaseInputTransport):
         self._port = port
         self._params = params
         self._callbacks = callbacks
+        # Optional `process_request` hook of websockets.serve, e.g. to serve the web client on the same port
+        self._process_request = process_request
 
         self._websocket: websockets.WebSocketServerProtocol | None = None
 
+        # Participant id of every open connection (AudioRawFrame has no user id, so the
+        # pipeline is told who is speaking with ParticipantJoinedFrame / ParticipantLeftFrame)
+        self._participant_ids: dict[websockets.WebSocketServerProtocol, str] = {}
+
+        # Wire format of every open connection, clients get the params' one unless they ask for the
+        # lean one when connecting. Kept per connection: the params are shared with the output, and a
+        # connection being replaced still has to be talked to in its own format until it is closed
+        self._wire_formats: dict[websockets.WebSocketServerProtocol, WireFormat] = {}
+
         self._stop_server_event = asyncio.Event()
 
     async def start(self, frame: StartFrame):
@@ -149,39 +239,166 @@ class CustomWebsocketServerInputTransport(CustomBaseInputTransport):
 
     async def _server_task_handler(self):
         logger.info(f"Starting websocket server on {self._host}:{self._port}")
-        async with websockets.serve(self._client_handler, self._host, self._port) as server:
+        async with websockets.serve(self._client_handler, self._host, self._port,
+                                    process_request=self._process_request) as server:
             await self._stop_server_event.wait()
 
+    def participant_id(self, websocket: websockets.WebSocketServerProtocol) -> str | None:
+        return self._participant_ids.get(websocket)
+
+    def wire_format(self, websocket: websockets.WebSocketServerProtocol) -> WireFormat:
+        return self._wire_formats.get(websocket) or WireFormat(self._params.serializer, self._params.add_wav_header)
+
+    @staticmethod
+    def _parse_participant_id(path: str) -> str:
+        # Clients can identify themselves with ?participant_id=... (or ?user_id=...) when connecting,
+        # otherwise every connection gets its own id. The id ends up in metric labels and logs, so
+        # it is capped in length and stripped of control characters
+        query = parse_qs(urlparse(path or "").query)
+        for key in ("participant_id", "user_id"):
+            participant_id = "".join(c for c in query.get(key, [""])[0][:MAX_PARTICIPANT_ID_LENGTH] if c.isprintable())
+            if participant_id:
+                return participant_id
+        return uuid.uuid4().hex
+
+    async def _negotiate_wire_format(self, websocket: websockets.WebSocketServerProtocol, path: str) -> bool:
+        # ?codec=pcm (or ?codec=opus) switches the connection to length-prefixed raw audio messages,
+        # with the audio format sent once up front instead of a WAV header in every protobuf frame.
+        # The output transport is handed the same format, so both directions use it.
+        # Returns False (and closes the connection) if the requested codec is not available
+        codec = parse_qs(urlparse(path or "").query).get("codec", [None])[0]
+        if codec in ("pcm", "opus"):
+            codec = PCMStreamSerializer.Codec.OPUS if codec == "opus" else PCMStreamSerializer.Codec.PCM16
+            if not PCMStreamSerializer.codec_available(codec):
+                logger.warning(f"Refusing {websocket.remote_address}, {codec.name} requires `pip install opuslib`")
+                # 1003: unsupported data, the client can reconnect with ?codec=pcm
+                await websocket.close(1003, f"{codec.name} is not supported, use ?codec=pcm")
+                return False
+            serializer = PCMStreamSerializer(self._params.audio_out_sample_rate,
+                                             self._params.audio_out_channels,
+                                             codec)
+            self._wire_formats[websocket] = WireFormat(serializer, False)
+            await websocket.send(serializer.session_start())
+        else:
+            self._wire_formats[websocket] = WireFormat(self._params.serializer, self._params.add_wav_header)
+        return True
+
     async def _client_handler(self, websocket: websockets.WebSocketServerProtocol, path):
         logger.info(f"New client connection from {websocket.remote_address}")
+        if not await self._negotiate_wire_format(websocket, path):
+            return
+
         if self._websocket:
             await self._websocket.close()
             logger.warning("Only one client connected, using new connection")
 
         self._websocket = websocket
+        participant_id = self._parse_participant_id(path)
+        self._participant_ids[websocket] = participant_id
+
+        # A segment still open belongs to the replaced connection
+        await self._end_speech_segment()
+        self._participant_id = participant_id
+        self._observe_queues()
+
+        # Let the rest of the pipeline know who the following audio belongs to
+        await self._internal_push_frame(ParticipantJoinedFrame(participant_id))
 
         # Notify
         await self._callbacks.on_client_connected(websocket)
 
-        # Handle incoming messages
-        async for message in websocket:
-            frame = self._params.serializer.deserialize(message)
+        serializer = self._wire_formats[websocket].serializer
+        try:
+            # Handle incoming messages
+            async for message in websocket:
+                try:
+                    frame = serializer.deserialize(message)
+                except UnsupportedCodecError as e:
+                    logger.warning(f"Closing {websocket.remote_address}: {e}")
+                    await websocket.close(1003, str(e))
+                    break
+                except Exception as e:
+                    # A malformed message only costs that message, not the session
+                    logger.warning(f"Dropping a message from {websocket.remote_address} that could not be decoded: {e}")
+                    metrics.increment("undecodable_messages", participant_id)
+                    continue
+
+                if not frame:
+                    continue
+
+                if isinstance(frame, AudioRawFrame):
+                    await self.push_audio_frame(frame)
+                else:
+                    await self._internal_push_frame(frame)
+        except websockets.ConnectionClosedError as e:
+            logger.warning(f"Client {websocket.remote_address} closed the connection with an error: {e}")
+        finally:
+            # Notify disconnection (also when the connection dropped) so the participant's resources are released
+            await self._callbacks.on_client_disconnected(websocket)
+
+            if self._participant_id == participant_id:
+                await self._end_speech_segment()
+            await self._internal_push_frame(ParticipantLeftFrame(participant_id))
+            del self._participant_ids[websocket]
+            del self._wire_formats[websocket]
+
+            # A newer connection may already have replaced this one, only forget our own
+            await websocket.close()
+            if self._websocket is websocket:
+                self._websocket = None
 
-            if not frame:
-                continue
+        logger.info(f"Client {websocket.remote_address} disconnected")
 
-            if isinstance(frame, AudioRawFrame):
-                await self.push_audio_frame(frame)
-            else:
-                await self._internal_push_frame(frame)
 
-        # Notify disconnection
-        await self._callbacks.on_client_disconnected(websocket)
+class CustomWebsocketServerOutputTransport(WebsocketServerOutputTransport):
 
-        await self._websocket.close()
-        self._websocket = None
+    def __init__(self, params: WebsocketServerParams, **kwargs):
+        super().__init__(params, **kwargs)
 
-        logger.info(f"Client {websocket.remote_address} disconnected")
+        # Participant the output currently goes to (set by the transport when a client connects)
+        self.participant_id = ""
+        # Wire format of that client, swapped together with the connection
+        self._wire_format = WireFormat(params.serializer, params.add_wav_header)
+
+    async def set_client_connection(self,
+                                    websocket: websockets.WebSocketServerProtocol | None,
+                                    wire_format: WireFormat | None = None):
+        await super().set_client_connection(websocket)
+        self._wire_format = wire_format or WireFormat(self._params.serializer, self._params.add_wav_header)
+
+    async def write_raw_audio_frames(self, frames: bytes):
+        # Time from the wake word to the first TTS audio sent back to the client
+        latency = metrics.observe_since("wake_to_tts_out", "wake", self.participant_id)
+        await self._write_audio(frames)
+        if latency is not None:
+            await self.push_frame(stage_metrics_frame("wake_to_tts_out", self.participant_id, latency))
+
+    async def _write_audio(self, frames: bytes):
+        # Same as the base class, with this connection's wire format instead of the shared params'
+        if not self._websocket:
+            return
+
+        self._audio_buffer += frames
+        while len(self._audio_buffer) >= self._params.audio_frame_size:
+            frame = AudioRawFrame(
+                audio=self._audio_buffer[:self._params.audio_frame_size],
+                sample_rate=self._params.audio_out_sample_rate,
+                num_channels=self._params.audio_out_channels)
+
+            if self._wire_format.add_wav_header:
+                content = io.BytesIO()
+                with wave.open(content, "wb") as ww:
+                    ww.setsampwidth(2)
+                    ww.setnchannels(frame.num_channels)
+                    ww.setframerate(frame.sample_rate)
+                    ww.writeframes(frame.audio)
+                frame = AudioRawFrame(content.getvalue(), sample_rate=frame.sample_rate, num_channels=frame.num_channels)
+
+            message = self._wire_format.serializer.serialize(frame)
+            if message:
+                await self._websocket.send(message)
+
+            self._audio_buffer = self._audio_buffer[self._params.audio_frame_size:]
 
 
 class CustomWebsocketServerTransport(BaseTransport):
@@ -193,18 +410,24 @@ class CustomWebsocketServerTransport(BaseTransport):
             params: WebsocketServerParams = WebsocketServerParams(),
             input_name: str | None = None,
             output_name: str | None = None,
-            loop: asyncio.AbstractEventLoop | None = None):
+            loop: asyncio.AbstractEventLoop | None = None,
+            vad_scheduler: VADBatchScheduler | None = None,
+            process_request: Callable | None = None,
+            queue_limits: QueueLimits | None = None):
         super().__init__(input_name=input_name, output_name=output_name, loop=loop)
         self._host = host
         self._port = port
         self._params = params
+        self._vad_scheduler = vad_scheduler
+        self._process_request = process_request
+        self._queue_limits = queue_limits
 
         self._callbacks = WebsocketServerCallbacks(
             on_client_connected=self._on_client_connected,
             on_client_disconnected=self._on_client_disconnected
         )
         self._input: CustomWebsocketServerInputTransport | None = None
-        self._output: WebsocketServerOutputTransport | None = None
+        self._output: CustomWebsocketServerOutputTransport | None = None
         self._websocket: websockets.WebSocketServerProtocol | None = None
 
         # Register supported handlers. The user will only be able to register
@@ -215,24 +438,171 @@ class CustomWebsocketServerTransport(BaseTransport):
     def input(self) -> FrameProcessor:
         if not self._input:
             self._input = CustomWebsocketServerInputTransport(
-                self._host, self._port, self._params, self._callbacks, name=self._input_name)
+                self._host, self._port, self._params, self._callbacks, self._process_request,
+                name=self._input_name, vad_scheduler=self._vad_scheduler, queue_limits=self._queue_limits)
         return self._input
 
     def output(self) -> FrameProcessor:
         if not self._output:
-            self._output = WebsocketServerOutputTransport(self._params, name=self._output_name)
+            self._output = CustomWebsocketServerOutputTransport(self._params, name=self._output_name)
         return self._output
 
+    def participant_id(self, websocket) -> str | None:
+        return self._input.participant_id(websocket) if self._input else None
+
     async def _on_client_connected(self, websocket):
         if self._output:
-            await self._output.set_client_connection(websocket)
+            self._output.participant_id = self.participant_id(websocket) or ""
+            await self._output.set_client_connection(websocket, self._input.wire_format(websocket))
             await self._call_event_handler("on_client_connected", websocket)
         else:
             logger.error("A WebsocketServerTransport output is missing in the pipeline")
 
     async def _on_client_disconnected(self, websocket):
-        if self._output:
+        if self._input and self._input._websocket not in (None, websocket):
+            # This connection was replaced by a newer one, keep sending output to the new client
+            await self._call_event_handler("on_client_disconnected", websocket)
+        elif self._output:
             await self._output.set_client_connection(None)
             await self._call_event_handler("on_client_disconnected", websocket)
         else:
             logger.error("A WebsocketServerTransport output is missing in the pipeline")
+
+
+class CustomWebsocketSessionInputTransport(CustomWebsocketServerInputTransport):
+    """
+    Input transport for a single connection accepted by CustomWebsocketSessionServer.
+    It does not run a websocket server of its own, the session server hands it the client.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Set once the pipeline has started this transport and it can take audio
+        self.started = asyncio.Event()
+
+    async def start(self, frame: StartFrame):
+        await CustomBaseInputTransport.start(self, frame)
+        self.started.set()
+
+    async def stop(self):
+        await CustomBaseInputTransport.stop(self)
+
+    async def handle_client(self, websocket: websockets.WebSocketServerProtocol, path: str):
+        await self._client_handler(websocket, path)
+
+
+class CustomWebsocketSessionTransport(CustomWebsocketServerTransport):
+    """Transport for one session of CustomWebsocketSessionServer (one client, one pipeline)."""
+
+    def input(self) -> CustomWebsocketSessionInputTransport:
+        if not self._input:
+            self._input = CustomWebsocketSessionInputTransport(
+                self._host, self._port, self._params, self._callbacks,
+                name=self._input_name, vad_scheduler=self._vad_scheduler, queue_limits=self._queue_limits)
+        return self._input
+
+
+class CustomWebsocketSessionServer:
+    """
+    Serves many simultaneous clients from one process and one port. Every accepted websocket
+    gets its own transport (input/output pair) and its own pipeline, built by `pipeline_factory`,
+    and the pipeline is torn down when the client disconnects. Connections beyond
+    `max_sessions` are refused with close code 1013 (try again later). `on_sessions_changed` is
+    called with the running sessions and `max_sessions` whenever a session starts or ends.
+    """
+
+    def __init__(
+            self,
+            pipeline_factory: Callable[[CustomWebsocketSessionTransport], Awaitable[PipelineTask]],
+            host: str = "localhost",
+            port: int = 8765,
+            params_factory: Callable[[], WebsocketServerParams | Awaitable[WebsocketServerParams]] = WebsocketServerParams,
+            max_sessions: int = 32,
+            vad_scheduler: VADBatchScheduler | None = None,
+            teardown_timeout: float = 5.0,
+            process_request: Callable | None = None,
+            queue_limits: QueueLimits | None = None,
+            on_sessions_changed: Callable[[int, int], None] | None = None):
+        if max_sessions < 1:
+            raise ValueError("Atleast one session is required.")
+
+        self._pipeline_factory = pipeline_factory
+        self._host = host
+        self._port = port
+        self._params_factory = params_factory
+        self._vad_scheduler = vad_scheduler
+        self._teardown_timeout = teardown_timeout
+        self._process_request = process_request
+        self._queue_limits = queue_limits
+        self._on_sessions_changed = on_sessions_changed
+        self.max_sessions = max_sessions
+
+        self._sessions: dict[websockets.WebSocketServerProtocol, PipelineTask] = {}
+        self._stop_server_event = asyncio.Event()
+
+    @property
+    def sessions(self) -> int:
+        return len(self._sessions)
+
+    def _report_sessions(self):
+        if self._on_sessions_changed is not None:
+            self._on_sessions_changed(len(self._sessions), self.max_sessions)
+
+    async def run(self):
+        logger.info(f"Starting websocket session server on {self._host}:{self._port} (max {self.max_sessions} sessions)")
+        self._report_sessions()
+        async with websockets.serve(self._session_handler, self._host, self._port,
+                                    process_request=self._process_request):
+            await self._stop_server_event.wait()
+
+    async def stop(self):
+        self._stop_server_event.set()
+
+    async def _session_handler(self, websocket: websockets.WebSocketServerProtocol, path: str):
+        if len(self._sessions) >= self.max_sessions:
+            logger.warning(f"Refusing {websocket.remote_address}, {self.max_sessions} sessions already running")
+            await websocket.close(1013, "Server is at capacity")
+            return
+
+        # The factory may be async (e.g. when it has to load a VAD model off the loop)
+        params = self._params_factory()
+        if inspect.isawaitable(params):
+            params = await params
+        transport = CustomWebsocketSessionTransport(params=params,
+                                                    vad_scheduler=self._vad_scheduler,
+                                                    queue_limits=self._queue_limits)
+        task = await self._pipeline_factory(transport)
+        self._sessions[websocket] = task
+        self._report_sessions()
+
+        # Each session runs its own pipeline, signals are handled by whoever owns the process
+        runner = PipelineRunner(handle_sigint=False)
+        run_task = asyncio.get_running_loop().create_task(runner.run(task))
+        input_transport = transport.input()
+        try:
+            # Only hand the client over once the pipeline is up (or stop if it failed to start)
+            started = asyncio.get_running_loop().create_task(input_transport.started.wait())
+            await asyncio.wait([started, run_task], return_when=asyncio.FIRST_COMPLETED)
+            started.cancel()
+            if input_transport.started.is_set():
+                await input_transport.handle_client(websocket, path)
+        finally:
+            await self._teardown(task, run_task)
+            del self._sessions[websocket]
+            self._report_sessions()
+            logger.info(f"Session for {websocket.remote_address} closed ({len(self._sessions)} running)")
+
+    async def _teardown(self, task: PipelineTask, run_task: asyncio.Task):
+        if not run_task.done():
+            # Let the pipeline finish what it is doing, cancel it if that takes too long
+            await task.queue_frame(EndFrame())
+            try:
+                await asyncio.wait_for(asyncio.shield(run_task), self._teardown_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Session pipeline did not end in time, cancelling it")
+                await task.cancel()
+                await run_task
+        elif not run_task.cancelled() and run_task.exception():
+            logger.error(f"Session pipeline failed: {run_task.exception()}")
+
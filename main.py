@@ -1,13 +1,16 @@
-from concurrent.futures import ThreadPoolExecutor
-from utils.pipe import call_pipecat
+from utils.pipe import call_pipecat, serve_pipecat
+from utils.supervisor import Supervisor
 from __init__ import asyncio, os
-import subprocess
-
-def run_http_server():
-    command = ["bash", "-c", "cd server && python3 -m http.server"]
-    subprocess.run(command)
 
 if __name__ == "__main__":
-    with ThreadPoolExecutor() as executor:
-        executor.submit(run_http_server)
-        asyncio.run(call_pipecat("PorcupineDemoId"))
\ No newline at end of file
+    # The web client in server/ is served on the websocket port (http://localhost:8765)
+    # PIPECAT_MAX_SESSIONS > 1 serves that many clients at once, each with its own pipeline
+    max_sessions = int(os.getenv("PIPECAT_MAX_SESSIONS", 1))
+    # PIPECAT_WORKERS > 1 runs that many worker processes (PIPECAT_MAX_SESSIONS each) behind a router
+    workers = int(os.getenv("PIPECAT_WORKERS", 1))
+    if workers > 1:
+        asyncio.run(Supervisor(workers, args=("PorcupineDemoId", max(max_sessions, 1))).run())
+    elif max_sessions > 1:
+        asyncio.run(serve_pipecat("PorcupineDemoId", max_sessions))
+    else:
+        asyncio.run(call_pipecat("PorcupineDemoId"))
@@ -0,0 +1,103 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import pytest
+
+from utils.audio_buffer import AudioRingBuffer
+
+
+def pcm(start: int, n: int) -> bytes:
+    # Distinct bytes so misplaced audio shows up in the comparisons
+    return bytes((start + i) % 256 for i in range(n))
+
+
+def read_all(buffer: AudioRingBuffer) -> list[bytes]:
+    frames = []
+    frame = buffer.read_frame()
+    while frame is not None:
+        frames.append(bytes(frame))
+        frame = buffer.read_frame()
+    return frames
+
+
+def test_frames_are_handed_out_once_in_order():
+    buffer = AudioRingBuffer(16, 4)
+    buffer.write(pcm(0, 6))
+    assert read_all(buffer) == [pcm(0, 4)]
+    assert buffer.unread == 2
+    buffer.write(pcm(6, 6))
+    assert read_all(buffer) == [pcm(4, 4), pcm(8, 4)]
+    assert buffer.read_frame() is None
+
+
+def test_wraps_around_without_growing():
+    buffer = AudioRingBuffer(16, 4)
+    written = b""
+    for i in range(10):
+        chunk = pcm(i * 5, 5)
+        written += chunk
+        buffer.write(chunk)
+        frames = read_all(buffer)
+        assert b"".join(frames) == written[buffer.read_pos - 4 * len(frames):buffer.read_pos]
+    assert buffer.retained == buffer.capacity == 16
+    assert buffer.history() == written[-16:]
+    assert buffer.dropped == 0
+
+
+def test_capacity_is_rounded_up_to_whole_frames():
+    assert AudioRingBuffer(10, 4).capacity == 12
+
+
+def test_reader_that_falls_behind_loses_the_oldest_audio():
+    buffer = AudioRingBuffer(8, 4)
+    buffer.write(pcm(0, 20))
+    assert buffer.dropped == 12
+    assert read_all(buffer) == [pcm(12, 4), pcm(16, 4)]
+
+
+def test_write_larger_than_the_buffer_keeps_the_tail():
+    buffer = AudioRingBuffer(8, 4)
+    buffer.write(pcm(0, 3))
+    buffer.write(pcm(3, 30))
+    assert buffer.write_pos == 33
+    assert buffer.history() == pcm(25, 8)
+
+
+def test_since_and_history():
+    buffer = AudioRingBuffer(8, 4)
+    buffer.write(pcm(0, 14))
+    assert buffer.since(8) == pcm(8, 6)
+    assert buffer.since(8, 10) == pcm(8, 2)
+    # Positions that were overwritten are clamped to the oldest retained audio
+    assert buffer.since(0) == pcm(6, 8)
+    assert buffer.history(3) == pcm(11, 3)
+    assert buffer.since(20) == b""
+
+
+def test_skip_keeps_the_most_recent_whole_frames():
+    buffer = AudioRingBuffer(32, 4)
+    buffer.write(pcm(0, 22))
+    # At least the last 7 bytes stay unread, from the frame boundary before them
+    assert buffer.skip(7) == 12
+    assert buffer.unread == 10
+    assert buffer.skip(100) == 0
+    assert buffer.skip(6) == 4
+    assert read_all(buffer) == [pcm(16, 4)]
+
+
+def test_clear_starts_over():
+    buffer = AudioRingBuffer(8, 4)
+    buffer.write(pcm(0, 10))
+    buffer.clear()
+    assert (buffer.write_pos, buffer.read_pos, buffer.retained, len(buffer)) == (0, 0, 0, 0)
+    buffer.write(pcm(50, 4))
+    assert read_all(buffer) == [pcm(50, 4)]
+
+
+@pytest.mark.parametrize("capacity, frame_bytes", [(8, 0), (2, 4)])
+def test_invalid_sizes(capacity, frame_bytes):
+    with pytest.raises(ValueError):
+        AudioRingBuffer(capacity, frame_bytes)
@@ -0,0 +1,84 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import struct
+
+import pytest
+
+from pipecat.frames.frames import AudioRawFrame, TextFrame
+
+from custom_classes import custom_serializer
+from custom_classes.custom_serializer import PCMStreamSerializer, UnsupportedCodecError
+
+MessageType = PCMStreamSerializer.MessageType
+Codec = PCMStreamSerializer.Codec
+
+
+def session_start(sample_rate: int, num_channels: int, codec: int) -> bytes:
+    return PCMStreamSerializer.message(MessageType.SESSION_START,
+                                       PCMStreamSerializer.SESSION_START.pack(sample_rate, num_channels, codec))
+
+
+def test_audio_message_layout():
+    audio = bytes(range(10))
+    data = PCMStreamSerializer().serialize(AudioRawFrame(audio=audio, sample_rate=16000, num_channels=1))
+    # 8 byte header (type, padding, big-endian length), the payload starts 2-byte aligned
+    assert data[:8] == bytes([MessageType.AUDIO, 0, 0, 0]) + struct.pack(">I", len(audio))
+    assert data[8:] == audio
+
+
+def test_round_trip():
+    serializer = PCMStreamSerializer(sample_rate=24000)
+    audio = bytes(range(64))
+    frame = serializer.deserialize(serializer.serialize(AudioRawFrame(audio=audio, sample_rate=24000, num_channels=1)))
+    assert isinstance(frame, AudioRawFrame)
+    assert (frame.audio, frame.sample_rate, frame.num_channels) == (audio, 24000, 1)
+
+
+def test_session_start_sets_the_format_of_following_audio():
+    serializer = PCMStreamSerializer()
+    assert serializer.deserialize(session_start(8000, 2, Codec.PCM16)) is None
+    frame = serializer.deserialize(PCMStreamSerializer.message(MessageType.AUDIO, bytes(4)))
+    assert (frame.sample_rate, frame.num_channels) == (8000, 2)
+
+
+def test_session_start_announces_the_output_format():
+    message = PCMStreamSerializer(sample_rate=16000, num_channels=1).session_start()
+    assert message == session_start(16000, 1, Codec.PCM16)
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"\x02\x00\x00",                                         # shorter than the header
+    "text",                                                  # not binary
+    PCMStreamSerializer.message(MessageType.AUDIO, bytes(8))[:-2],  # truncated payload
+    PCMStreamSerializer.message(9, bytes(2)),                # unknown type
+])
+def test_invalid_messages_are_ignored(data):
+    assert PCMStreamSerializer().deserialize(data) is None
+
+
+def test_only_audio_is_serialized():
+    assert PCMStreamSerializer().serialize(TextFrame("hi")) is None
+
+
+@pytest.mark.skipif(custom_serializer.opuslib is not None, reason="opuslib is installed")
+def test_opus_without_opuslib():
+    # Sending falls back to PCM, receiving Opus is refused
+    assert PCMStreamSerializer(codec=Codec.OPUS).codec == Codec.PCM16
+    with pytest.raises(UnsupportedCodecError):
+        PCMStreamSerializer().deserialize(session_start(16000, 1, Codec.OPUS))
+
+
+@pytest.mark.skipif(custom_serializer.opuslib is None, reason="requires opuslib")
+def test_opus_round_trip():
+    sender = PCMStreamSerializer(codec=Codec.OPUS)
+    receiver = PCMStreamSerializer()
+    receiver.deserialize(sender.session_start())
+    # Less than one Opus frame (20 ms) waits for more audio
+    assert sender.serialize(AudioRawFrame(audio=bytes(320), sample_rate=16000, num_channels=1)) is None
+    frame = receiver.deserialize(sender.serialize(AudioRawFrame(audio=bytes(640), sample_rate=16000, num_channels=1)))
+    assert len(frame.audio) == 640
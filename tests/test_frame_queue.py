@@ -0,0 +1,108 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+
+import pytest
+
+from pipecat.frames.frames import AudioRawFrame, TextFrame
+from pipecat.processors.frame_processor import FrameDirection
+
+from utils.frame_queue import BoundedFrameQueue, OverflowPolicy, QueueLimits
+
+SPEECH = b"\x01\x00"
+SILENCE = b"\x00\x00"
+
+
+def audio(speech: bool, n: int = 0) -> AudioRawFrame:
+    # The frame's index is kept in the audio so the test can tell which ones were dropped
+    return AudioRawFrame(audio=(SPEECH if speech else SILENCE) + bytes([n, 0]), sample_rate=16000, num_channels=1)
+
+
+def is_speech(frame: AudioRawFrame) -> bool:
+    return frame.audio[:2] == SPEECH
+
+
+def queue(policy: OverflowPolicy, max_audio_frames: int = 3, dropped: list | None = None) -> BoundedFrameQueue:
+    return BoundedFrameQueue(QueueLimits(max_audio_frames, policy), is_speech,
+                             dropped.append if dropped is not None else None)
+
+
+async def drain(q: BoundedFrameQueue) -> list:
+    return [await q.get() for _ in range(q.qsize())]
+
+
+def indexes(frames: list) -> list[int]:
+    return [f.audio[2] for f in frames if isinstance(f, AudioRawFrame)]
+
+
+def test_drop_oldest_silence_keeps_speech():
+    async def run():
+        dropped = []
+        q = queue(OverflowPolicy.DROP_OLDEST_SILENCE, dropped=dropped)
+        for n, speech in enumerate([True, False, True, False, True]):
+            await q.put(audio(speech, n))
+        assert q.audio_frames == 3
+        assert q.dropped == 2
+        assert indexes(dropped) == [1, 3]
+        assert indexes(await drain(q)) == [0, 2, 4]
+    asyncio.run(run())
+
+
+def test_drop_oldest_silence_drops_the_oldest_speech_when_all_is_speech():
+    async def run():
+        q = queue(OverflowPolicy.DROP_OLDEST_SILENCE)
+        for n in range(5):
+            await q.put(audio(True, n))
+        assert indexes(await drain(q)) == [2, 3, 4]
+    asyncio.run(run())
+
+
+def test_shed_non_speech_refuses_silence_while_full():
+    async def run():
+        dropped = []
+        q = queue(OverflowPolicy.SHED_NON_SPEECH, dropped=dropped)
+        for n, speech in enumerate([False, True, True, False, True]):
+            await q.put(audio(speech, n))
+        # The silent frame 3 is shed, speech frame 4 pushes out the oldest audio
+        assert indexes(dropped) == [3, 0]
+        assert indexes(await drain(q)) == [1, 2, 4]
+    asyncio.run(run())
+
+
+def test_backpressure_waits_for_room():
+    async def run():
+        q = queue(OverflowPolicy.BACKPRESSURE, max_audio_frames=2)
+        await q.put(audio(False, 0))
+        await q.put(audio(False, 1))
+        put = asyncio.create_task(q.put(audio(False, 2)))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+        assert indexes([await q.get()]) == [0]
+        await asyncio.wait_for(put, 1)
+        assert q.dropped == 0
+        assert indexes(await drain(q)) == [1, 2]
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("policy", list(OverflowPolicy))
+def test_other_frames_are_never_dropped_or_delayed(policy):
+    async def run():
+        q = queue(policy, max_audio_frames=1)
+        await q.put((audio(False, 0), FrameDirection.DOWNSTREAM))
+        # The audio limit is reached, other frames still go in right away and keep their order
+        for i in range(5):
+            await asyncio.wait_for(q.put((TextFrame(str(i)), FrameDirection.DOWNSTREAM)), 1)
+        assert q.qsize() == 6
+        items = await drain(q)
+        assert [frame.text for frame, _ in items[1:]] == ["0", "1", "2", "3", "4"]
+        assert q.empty()
+    asyncio.run(run())
+
+
+def test_needs_room_for_audio():
+    with pytest.raises(ValueError):
+        queue(OverflowPolicy.DROP_OLDEST_SILENCE, max_audio_frames=0)
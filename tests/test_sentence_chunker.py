@@ -0,0 +1,94 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+
+import pytest
+
+from utils.sentence_chunker import SentenceChunker, sentence_stream
+
+
+def chunk(text: str, token_chars: int = 3, max_chars: int = 200) -> list[str]:
+    # Feed the text in small tokens, like an LLM stream
+    chunker = SentenceChunker(max_chars)
+    chunks = []
+    for i in range(0, len(text), token_chars):
+        chunks += chunker.push(text[i:i + token_chars])
+    rest = chunker.flush()
+    return chunks + [rest] if rest else chunks
+
+
+def test_cuts_at_sentence_ends():
+    assert chunk("Hello there. How are you? Fine!") == ["Hello there. ", "How are you? ", "Fine!"]
+
+
+def test_cut_waits_for_the_next_token():
+    chunker = SentenceChunker()
+    assert chunker.push("It costs 3.") == []
+    assert chunker.push("5 dollars. ") == ["It costs 3.5 dollars. "]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Talk to Dr. Smith about it. Ok.", ["Talk to Dr. Smith about it. ", "Ok."]),
+    ("Bring snacks, e.g. chips. Ok.", ["Bring snacks, e.g. chips. ", "Ok."]),
+    ("J. R. R. Tolkien wrote it. Yes.", ["J. R. R. Tolkien wrote it. ", "Yes."]),
+    ("It costs 3.5 dollars. Cheap.", ["It costs 3.5 dollars. ", "Cheap."]),
+])
+def test_abbreviations_initials_and_decimals_do_not_end_a_sentence(text, expected):
+    assert chunk(text) == expected
+
+
+def test_closing_quotes_stay_with_their_sentence():
+    assert chunk('He said "Stop." Then left.') == ['He said "Stop." ', "Then left."]
+    assert chunk("(Really?) Yes.") == ["(Really?) ", "Yes."]
+
+
+def test_newline_ends_a_chunk():
+    assert chunk("Line one\nLine two") == ["Line one\n", "Line two"]
+
+
+def test_long_sentence_is_cut_at_a_clause_then_a_word():
+    chunks = chunk("first part, second part, " + "word " * 12, max_chars=20)
+    assert chunks[0] == "first part, "
+    # Cuts keep the space after them, the text before it fits in max_chars
+    assert all(len(c.rstrip()) <= 20 for c in chunks)
+
+
+def test_long_word_is_not_cut():
+    assert chunk("x" * 50, max_chars=10) == ["x" * 50]
+
+
+@pytest.mark.parametrize("token_chars", [1, 2, 3, 7, 1000])
+def test_joined_chunks_give_back_the_full_text(token_chars):
+    text = ('Dr. Who said "Run!" at 3.5 km/h.\nJ. Smith agreed; e.g. he ran too.  Twice? '
+            + "and then a long clause, " * 10 + "the end")
+    chunks = chunk(text, token_chars, max_chars=40)
+    assert "".join(chunks) == text
+    assert all(chunks)
+
+
+def test_flush_resets():
+    chunker = SentenceChunker()
+    chunker.push("No end")
+    assert chunker.flush() == "No end"
+    assert chunker.flush() == ""
+    assert chunker.push("Next. ") == ["Next. "]
+
+
+def test_max_chars_must_be_positive():
+    with pytest.raises(ValueError):
+        SentenceChunker(0)
+
+
+def test_sentence_stream():
+    async def tokens():
+        for token in ["One. T", "wo. Th", "ree"]:
+            yield token
+
+    async def collect():
+        return [c async for c in sentence_stream(tokens())]
+
+    assert asyncio.run(collect()) == ["One. ", "Two. ", "Three"]
@@ -0,0 +1,132 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+
+class AudioRingBuffer:
+    """
+    Fixed-capacity, preallocated ring buffer for 16-bit PCM audio.
+
+    Audio is written as it arrives and handed out one frame at a time through a read cursor,
+    so every frame is returned exactly once. Only the last `capacity` bytes are retained;
+    if the reader falls further behind than that, the oldest unread audio is dropped.
+    The retained history stays available (e.g. for pre-roll) until the buffer is cleared.
+    """
+    def __init__(self, capacity: int, frame_bytes: int = 1024):
+        if frame_bytes <= 0:
+            raise ValueError("Frame size must be a positive number of bytes.")
+        if capacity < frame_bytes:
+            raise ValueError("Capacity must hold at least one frame.")
+
+        # Round the capacity up to a whole number of frames so a frame never straddles
+        # the wrap point and can always be handed out as a single contiguous view
+        self.frame_bytes = frame_bytes
+        self.capacity = -(-capacity // frame_bytes) * frame_bytes
+        self._buffer = bytearray(self.capacity)
+
+        # Absolute positions (in bytes) since the last clear, the physical index is pos % capacity
+        self._write_pos = 0
+        self._read_pos = 0
+
+        # Number of unread bytes that were overwritten before they could be read
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self.retained
+
+    @property
+    def retained(self) -> int:
+        """Number of bytes of history currently held in the buffer."""
+        return min(self._write_pos, self.capacity)
+
+    @property
+    def unread(self) -> int:
+        """Number of bytes written but not yet handed out as frames."""
+        return self._write_pos - self._read_pos
+
+    @property
+    def write_pos(self) -> int:
+        return self._write_pos
+
+    @property
+    def read_pos(self) -> int:
+        return self._read_pos
+
+    def write(self, data: bytes | bytearray | memoryview) -> None:
+        view = memoryview(data)
+        n = len(view)
+
+        # Anything larger than the buffer would be overwritten immediately, only copy the tail
+        if n > self.capacity:
+            self._write_pos += n - self.capacity
+            view = view[n - self.capacity:]
+            n = self.capacity
+
+        start = self._write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self._buffer[start:start + first] = view[:first]
+        if first < n:
+            self._buffer[:n - first] = view[first:]
+        self._write_pos += n
+
+        # If the reader fell more than a full buffer behind, move it up to the oldest frame
+        # boundary that is still retained
+        oldest = self._write_pos - self.capacity
+        if self._read_pos < oldest:
+            aligned = -(-oldest // self.frame_bytes) * self.frame_bytes
+            self.dropped += aligned - self._read_pos
+            self._read_pos = aligned
+
+    def read_frame(self) -> memoryview | None:
+        """
+        Return the next unread frame as a view over the buffer storage, or None if a full frame
+        has not been written yet. The view is only valid until the buffer wraps around to it again.
+        """
+        if self._write_pos - self._read_pos < self.frame_bytes:
+            return None
+        start = self._read_pos % self.capacity
+        self._read_pos += self.frame_bytes
+        return memoryview(self._buffer)[start:start + self.frame_bytes]
+
+    def skip(self, keep: int) -> int:
+        """
+        Mark all but the last `keep` bytes (rounded up to whole frames) of unread audio as read,
+        so only the most recent audio is handed out. Returns the number of bytes skipped.
+        """
+        pos = self._write_pos - keep
+        if pos <= self._read_pos:
+            return 0
+        # Frames stay on the reader's grid, start at the frame boundary at or before `pos`
+        pos = self._read_pos + (pos - self._read_pos) // self.frame_bytes * self.frame_bytes
+        skipped = pos - self._read_pos
+        self._read_pos = pos
+        return skipped
+
+    def history(self, nbytes: int | None = None) -> bytes:
+        """Return a copy of the last `nbytes` of retained audio (all of it by default)."""
+        retained = self.retained
+        if nbytes is None or nbytes > retained:
+            nbytes = retained
+        return self.since(self._write_pos - nbytes)
+
+    def since(self, pos: int, end: int | None = None) -> bytes:
+        """
+        Return a copy of the retained audio from absolute position `pos` up to `end`
+        (the write head by default).
+        """
+        end = self._write_pos if end is None else min(end, self._write_pos)
+        pos = max(pos, self._write_pos - self.retained)
+        if pos >= end:
+            return b""
+        start = pos % self.capacity
+        stop = start + (end - pos)
+        if stop <= self.capacity:
+            return bytes(self._buffer[start:stop])
+        return bytes(self._buffer[start:]) + bytes(self._buffer[:stop - self.capacity])
+
+    def clear(self) -> None:
+        # The storage is kept (never resized) so views that are still held do not block this
+        self._write_pos = 0
+        self._read_pos = 0
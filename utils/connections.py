@@ -0,0 +1,199 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+import time
+
+from typing import Awaitable, Callable, Generic, TypeVar
+
+import aiohttp
+
+from utils.metrics import PipelineMetrics, metrics
+
+from loguru import logger
+
+T = TypeVar("T")
+
+
+class HTTPSessionManager:
+    """
+    One aiohttp.ClientSession for the whole process (TTS requests of every session go through
+    it), with a connector that keeps TCP/TLS connections alive between requests, so only the
+    first request to a host pays for DNS and the handshakes. `warm` opens those connections
+    ahead of time. The session is created on first use in the running event loop.
+    """
+    def __init__(self, limit: int = 100, keepalive_timeout: float = 60, ttl_dns_cache: int = 300):
+        self._limit = limit
+        self._keepalive_timeout = keepalive_timeout
+        self._ttl_dns_cache = ttl_dns_cache
+        self._session: aiohttp.ClientSession | None = None
+
+    def get(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._limit,
+                                             keepalive_timeout=self._keepalive_timeout,
+                                             ttl_dns_cache=self._ttl_dns_cache)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def warm(self, urls: list[str], timeout: float = 5.0):
+        """Request each URL once (HEAD) so a connection to its host is open in the pool, errors are ignored."""
+        session = self.get()
+
+        async def head(url: str):
+            try:
+                async with session.head(url, timeout=aiohttp.ClientTimeout(total=timeout)):
+                    pass
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.debug(f"Could not warm a connection to {url}: {e}")
+
+        await asyncio.gather(*(head(url) for url in urls))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class WarmConnectionPool(Generic[T]):
+    """
+    Keeps `size` connections to a streaming backend (e.g. STT websockets) open ahead of time and
+    leases them to sessions, so a session's first utterance does not wait for the handshakes.
+
+    `connect()` opens a connection, `close(connection)` closes it and `is_alive(connection)`
+    tells whether an idle one can still be used. A released connection is only kept for the
+    next lease once `drain(connection)` returns True, i.e. the backend confirmed that every
+    result for the previous session was delivered (late results must not reach the next one),
+    and only if it is alive and the pool is not full. Otherwise it is closed. Without `drain`
+    it is kept after `settle_secs`. Idle connections older than
+    `max_idle_secs` are replaced. Leases served from the pool are counted as
+    `{name}_pool_hits`, leases that had to connect as `{name}_pool_misses`.
+    """
+    def __init__(self,
+                 name: str,
+                 connect: Callable[[], Awaitable[T]],
+                 close: Callable[[T], Awaitable[None]],
+                 is_alive: Callable[[T], bool] = lambda connection: True,
+                 drain: Callable[[T], Awaitable[bool]] | None = None,
+                 size: int = 2,
+                 settle_secs: float = 1.0,
+                 max_idle_secs: float | None = None,
+                 registry: PipelineMetrics = metrics):
+        self.name = name
+        self.size = size
+        self._connect = connect
+        self._close = close
+        self._is_alive = is_alive
+        self._drain = drain
+        self._settle_secs = settle_secs
+        self._max_idle_secs = max_idle_secs
+        self._registry = registry
+
+        # (connection, idle since)
+        self._idle: list[tuple[T, float]] = []
+        self._connecting = 0
+        self._leased = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+
+        registry.set_gauge(f"{name}_pool_idle", lambda: len(self._idle))
+        registry.set_gauge(f"{name}_pool_leased", lambda: self._leased)
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def start(self):
+        """Start opening the idle connections in the background."""
+        self._fill()
+
+    async def lease(self) -> T:
+        while self._idle:
+            connection, since = self._idle.pop()
+            if self._usable(connection, since):
+                self._leased += 1
+                self._registry.increment(f"{self.name}_pool_hits")
+                self._fill()
+                return connection
+            self._spawn(self._discard(connection))
+
+        self._registry.increment(f"{self.name}_pool_misses")
+        self._fill()
+        connection = await self._connect()
+        self._leased += 1
+        return connection
+
+    async def release(self, connection: T, reusable: bool = True):
+        self._leased -= 1
+        if reusable and not self._closed:
+            self._spawn(self._settle(connection))
+        else:
+            await self._discard(connection)
+
+    async def close(self):
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._discard(connection) for connection, _ in idle))
+
+    def _usable(self, connection: T, since: float) -> bool:
+        if self._max_idle_secs is not None and time.monotonic() - since > self._max_idle_secs:
+            return False
+        return self._is_alive(connection)
+
+    def _spawn(self, coroutine: Awaitable):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _fill(self):
+        if self._closed:
+            return
+        for _ in range(self.size - len(self._idle) - self._connecting):
+            self._connecting += 1
+            self._spawn(self._open())
+
+    async def _open(self):
+        try:
+            connection = await self._connect()
+        except Exception as e:
+            logger.warning(f"Could not open a {self.name} connection: {e}")
+            return
+        finally:
+            self._connecting -= 1
+        await self._keep(connection)
+
+    async def _settle(self, connection: T):
+        try:
+            if self._drain is not None:
+                drained = await self._drain(connection)
+            else:
+                await asyncio.sleep(self._settle_secs)
+                drained = True
+        except asyncio.CancelledError:
+            await self._discard(connection)
+            raise
+        except Exception as e:
+            logger.debug(f"Could not drain a {self.name} connection: {e}")
+            drained = False
+        if drained and self._is_alive(connection):
+            await self._keep(connection)
+        else:
+            await self._discard(connection)
+            self._fill()
+
+    async def _keep(self, connection: T):
+        if self._closed or len(self._idle) >= self.size:
+            await self._discard(connection)
+        else:
+            self._idle.append((connection, time.monotonic()))
+
+    async def _discard(self, connection: T):
+        try:
+            await self._close(connection)
+        except Exception as e:
+            logger.debug(f"Error closing a {self.name} connection: {e}")
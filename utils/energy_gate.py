@@ -0,0 +1,81 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import math
+
+import numpy as np
+
+
+class EnergyGate:
+    """
+    Cheap per-frame speech/silence decision used in front of Porcupine.
+
+    A frame is let through when its RMS level is above `threshold_dbfs`, or when it is at most
+    12dB quieter but has a high zero-crossing rate (unvoiced sounds like the "h" in "hey" are
+    quiet but noisy). Once open, the gate stays open for `hangover_frames` more frames so the
+    tail of a word is not cut off. When it opens after skipping frames, the caller is told how
+    many of the skipped frames right before the onset to scan first (at most `rewind_frames`),
+    so the start of the keyword is never clipped.
+    """
+    def __init__(self,
+                 threshold_dbfs: float = -50.0,
+                 hangover_frames: int = 10,
+                 rewind_frames: int = 2,
+                 zcr_threshold: float = 0.3):
+        if threshold_dbfs > 0:
+            raise ValueError("Gate threshold must be at most 0 dBFS.")
+        if hangover_frames < 0 or rewind_frames < 0:
+            raise ValueError("Hangover and rewind must be zero or more frames.")
+
+        # RMS of 16-bit samples (full scale = 32768)
+        self.rms_threshold = 32768 * 10 ** (threshold_dbfs / 20)
+        self.hangover_frames = hangover_frames
+        self.rewind_frames = rewind_frames
+        self.zcr_threshold = zcr_threshold
+
+        self._hangover = 0
+        # Frames skipped since the last frame that was let through
+        self._skipped_run = 0
+
+        self.passed = 0
+        self.skipped = 0
+
+    def is_speech(self, frame: bytes | bytearray | memoryview) -> bool:
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        if not len(samples):
+            return False
+        rms = math.sqrt(float(np.dot(samples, samples)) / len(samples))
+        if rms >= self.rms_threshold:
+            return True
+        if rms < self.rms_threshold / 4:
+            return False
+        signs = np.signbit(samples)
+        zcr = np.count_nonzero(signs[1:] != signs[:-1]) / max(1, len(samples) - 1)
+        return zcr >= self.zcr_threshold
+
+    def admit(self, frame: bytes | bytearray | memoryview) -> int | None:
+        """
+        Return None if the frame can be skipped, otherwise the number of skipped frames right
+        before it that should be scanned first (0 unless the gate just opened).
+        """
+        if self.is_speech(frame):
+            self._hangover = self.hangover_frames
+        elif self._hangover > 0:
+            self._hangover -= 1
+        else:
+            self._skipped_run += 1
+            self.skipped += 1
+            return None
+
+        rewind = min(self._skipped_run, self.rewind_frames)
+        self._skipped_run = 0
+        self.passed += 1
+        return rewind
+
+    def reset(self):
+        """Forget the hangover and skipped frames, e.g. after the audio they refer to was cleared."""
+        self._hangover = 0
+        self._skipped_run = 0
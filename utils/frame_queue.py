@@ -0,0 +1,117 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable
+
+from pipecat.frames.frames import AudioRawFrame
+
+
+class OverflowPolicy(str, Enum):
+    # Drop the oldest queued silent audio (the oldest audio if all of it is speech)
+    DROP_OLDEST_SILENCE = "drop_oldest_silence"
+    # Stop queueing silent audio while full, speech still pushes out the oldest audio
+    SHED_NON_SPEECH = "shed_non_speech"
+    # Make the producer wait (the websocket stops being read, so the client is slowed down)
+    BACKPRESSURE = "backpressure"
+
+
+@dataclass
+class QueueLimits:
+    """How much audio an input transport queue may hold and what happens when it is full."""
+    max_audio_frames: int = 64
+    policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST_SILENCE
+
+
+class BoundedFrameQueue:
+    """
+    Drop-in for the asyncio.Queue of an input transport (frames, or (frame, direction) tuples)
+    that holds at most `limits.max_audio_frames` audio frames. Other frames (control, system,
+    participant and speech segment frames) are never dropped or delayed, so nothing that
+    pushes them can end up waiting on the audio.
+    `is_speech` classifies audio frames for the silence policies, `on_drop` is called for
+    every audio frame that is dropped.
+    """
+    def __init__(self,
+                 limits: QueueLimits,
+                 is_speech: Callable[[AudioRawFrame], bool],
+                 on_drop: Callable[[AudioRawFrame], None] | None = None):
+        if limits.max_audio_frames < 1:
+            raise ValueError("Queue must hold atleast one audio frame.")
+
+        self.limits = limits
+        self._is_speech = is_speech
+        self._on_drop = on_drop
+
+        # (item, is audio, is speech)
+        self._items: deque[tuple[Any, bool, bool]] = deque()
+        self._audio = 0
+        self._changed = asyncio.Condition()
+
+        self.dropped = 0
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def empty(self) -> bool:
+        return not self._items
+
+    @property
+    def audio_frames(self) -> int:
+        return self._audio
+
+    async def put(self, item: Any):
+        frame = item[0] if isinstance(item, tuple) else item
+        is_audio = isinstance(frame, AudioRawFrame)
+        speech = False
+
+        async with self._changed:
+            if is_audio:
+                policy = self.limits.policy
+                if policy == OverflowPolicy.BACKPRESSURE:
+                    await self._changed.wait_for(lambda: self._audio < self.limits.max_audio_frames)
+                else:
+                    speech = self._is_speech(frame)
+                    if self._audio >= self.limits.max_audio_frames:
+                        if policy == OverflowPolicy.SHED_NON_SPEECH and not speech:
+                            self._drop(frame)
+                            return
+                        self._drop_oldest(prefer_silence=policy == OverflowPolicy.DROP_OLDEST_SILENCE)
+                self._audio += 1
+            self._items.append((item, is_audio, speech))
+            self._changed.notify_all()
+
+    async def get(self) -> Any:
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._items)
+            item, is_audio, _ = self._items.popleft()
+            if is_audio:
+                self._audio -= 1
+            self._changed.notify_all()
+        return item
+
+    def _drop_oldest(self, prefer_silence: bool):
+        victim = None
+        for i, (_, is_audio, speech) in enumerate(self._items):
+            if is_audio and (not speech or not prefer_silence):
+                victim = i
+                break
+        if victim is None:
+            # Everything queued is speech, the oldest of it goes
+            victim = next(i for i, (_, is_audio, _) in enumerate(self._items) if is_audio)
+        item, _, _ = self._items[victim]
+        del self._items[victim]
+        self._audio -= 1
+        self._drop(item[0] if isinstance(item, tuple) else item)
+
+    def _drop(self, frame: AudioRawFrame):
+        self.dropped += 1
+        if self._on_drop is not None:
+            self._on_drop(frame)
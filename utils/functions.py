@@ -1,17 +1,40 @@
+from typing import AsyncIterator
+
 from __init__ import AddableDict, logger
+from utils.sentence_chunker import sentence_stream
 
 def process_questions():
     raise NotImplementedError("This function must be called asyncronously.")
 
+def parse_question(question: str | AddableDict | dict) -> tuple[str | None, list]:
+    if isinstance(question, dict) or isinstance(question, AddableDict):
+        return question.get("input", None), question.get("chat_history", [])
+    return question, []
+
+async def answer_tokens(quest: str, history: list, userId: str = None) -> AsyncIterator[str]:
+            # Add any steps to process the user input inlcuding history here,
+            # yield the answer as it is generated (e.g. the chunks of `llm.astream(...)`)
+            data = f"\nGot Input: {quest}\nUser ID: {userId}"
+            logger.debug(data)
+            yield data
+
 async def process_questions_async(question: str | AddableDict | dict, userId: str = None):
-            if isinstance(question, dict) or isinstance(question, AddableDict):
-                quest = question.get("input", None)
-                history = question.get("chat_history", [])
-            
+            quest, history = parse_question(question)
+
             if quest:
-                # Add any steps to process the user input inlcuding history here
-                data = f"\nGot Input: {quest}\nUser ID: {userId}"
-                logger.debug(data)
-                return data
+                return "".join([token async for token in answer_tokens(quest, history, userId)])
             logger.debug("No user input found.")
             return "Got no user input."
+
+async def stream_questions_async(questions: AsyncIterator[str | AddableDict | dict], userId: str = None):
+            # Streaming version for a RunnableGenerator: the answer is yielded one sentence at a time,
+            # so TTS starts speaking as soon as the first one is complete
+            async for question in questions:
+                quest, history = parse_question(question)
+
+                if not quest:
+                    logger.debug("No user input found.")
+                    yield "Got no user input."
+                    continue
+                async for sentence in sentence_stream(answer_tokens(quest, history, userId)):
+                    yield sentence
@@ -0,0 +1,144 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import json
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+
+from __init__ import BaseChatMessageHistory, logger
+
+
+# langchain_community's ChatMessageHistory is this class, imported from langchain_core to keep
+# langchain_community (slow to import) off the startup path
+class WindowedChatMessageHistory(InMemoryChatMessageHistory):
+    """
+    Chat history that only keeps the most recent messages, so the prompt built from it
+    stays bounded. Oldest messages are dropped once there are more than `max_messages`
+    or their estimated token count goes over `max_tokens`.
+    """
+    max_messages: Optional[int] = 20
+    max_tokens: Optional[int] = None
+
+    def add_message(self, message: BaseMessage) -> None:
+        super().add_message(message)
+        self.trim()
+
+    def trim(self) -> None:
+        if self.max_messages is not None and len(self.messages) > self.max_messages:
+            del self.messages[:len(self.messages) - self.max_messages]
+        if self.max_tokens is not None:
+            tokens = sum(estimate_tokens(message) for message in self.messages)
+            # Always keep the latest message, even if it is over the cap on its own
+            while tokens > self.max_tokens and len(self.messages) > 1:
+                tokens -= estimate_tokens(self.messages.pop(0))
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    # Rough estimate (about 4 characters per token), good enough to bound the prompt size
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    return len(content) // 4 + 1
+
+
+class SessionHistoryStore:
+    """
+    Backend for `get_session_history` that keeps at most `max_sessions` histories in memory
+    and evicts the least recently used ones, as well as any idle for longer than `ttl` seconds.
+    With `sqlite_path`, evicted histories are written to a local SQLite file and loaded back
+    when the session comes back, otherwise they are dropped.
+    """
+    def __init__(self,
+                 max_sessions: int = 256,
+                 ttl: float | None = 1800.0,
+                 max_messages: int | None = 20,
+                 max_tokens: int | None = None,
+                 sqlite_path: str | None = None):
+        if max_sessions < 1:
+            raise ValueError("Atleast one session has to fit in memory.")
+
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+
+        # session id -> (history, last access time), least recently used first
+        self._sessions: OrderedDict[str, tuple[WindowedChatMessageHistory, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db: sqlite3.Connection | None = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS session_history "
+                             "(session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, updated REAL NOT NULL)")
+            self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+
+            entry = self._sessions.pop(session_id, None)
+            history = entry[0] if entry else self._load(session_id)
+            self._sessions[session_id] = (history, now)
+
+            while len(self._sessions) > self.max_sessions:
+                self._evict(*self._sessions.popitem(last=False))
+        return history
+
+    def evict_expired(self):
+        with self._lock:
+            self._evict_expired(time.monotonic())
+
+    def _evict_expired(self, now: float):
+        if self.ttl is None:
+            return
+        # Entries are ordered by last access, so only the front can have expired
+        while self._sessions:
+            session_id, (history, last_access) = next(iter(self._sessions.items()))
+            if now - last_access < self.ttl:
+                break
+            self._evict(session_id, self._sessions.pop(session_id))
+
+    def _evict(self, session_id: str, entry: tuple[WindowedChatMessageHistory, float]):
+        history, _ = entry
+        if self._db is not None and history.messages:
+            self._db.execute("INSERT OR REPLACE INTO session_history VALUES (?, ?, ?)",
+                             (session_id, json.dumps(messages_to_dict(history.messages)), time.time()))
+            self._db.commit()
+            logger.debug(f"Spilled chat history of {session_id} to disk")
+
+    def _load(self, session_id: str) -> WindowedChatMessageHistory:
+        history = WindowedChatMessageHistory(max_messages=self.max_messages, max_tokens=self.max_tokens)
+        if self._db is None:
+            return history
+
+        row = self._db.execute("SELECT messages FROM session_history WHERE session_id = ?", (session_id,)).fetchone()
+        if row:
+            # Back in memory, the row is written again if the session gets evicted again
+            history.messages = messages_from_dict(json.loads(row[0]))
+            history.trim()
+            self._db.execute("DELETE FROM session_history WHERE session_id = ?", (session_id,))
+            self._db.commit()
+            logger.debug(f"Restored chat history of {session_id} from disk")
+        return history
+
+    def close(self):
+        """Spill every in-memory history (if a SQLite file is configured) and close the file."""
+        with self._lock:
+            while self._sessions:
+                self._evict(*self._sessions.popitem(last=False))
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,222 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+import time
+
+from collections import OrderedDict, deque
+from typing import Callable
+
+from loguru import logger
+
+
+class LatencyHistogram:
+    """
+    Keeps the most recent `window` samples (in seconds) to report percentiles, plus the
+    running count and sum of every sample recorded.
+    """
+    def __init__(self, window: int = 1024):
+        self._samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def record(self, value: float):
+        self._samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self) -> dict[str, float]:
+        ordered = sorted(self._samples)
+        if not ordered:
+            return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+        def pick(q: float) -> float:
+            return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+        return {"count": self.count, "p50": pick(50), "p95": pick(95), "p99": pick(99), "max": ordered[-1]}
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task that sleeps for `interval` seconds.
+    Anything that blocks the loop (e.g. synchronous inference inside a coroutine) shows up as lag.
+    """
+    def __init__(self, interval: float = 0.01, window: int = 4096):
+        self.interval = interval
+        self.lag = LatencyHistogram(window)
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag.record(max(0.0, time.perf_counter() - start - self.interval))
+
+
+class PipelineMetrics:
+    """
+    Per-participant latency histograms, counters and gauges for the voice pipeline.
+    Processors record into the process-wide `metrics` instance below, which can be
+    rendered in the Prometheus text format (see `serve_metrics`). At most `max_participants`
+    participants keep their own series, recording for another one forgets the least recently
+    active participant (participant ids come from clients, they must not grow the series forever).
+    """
+    def __init__(self, window: int = 1024, max_participants: int = 1000):
+        self._window = window
+        self._max_participants = max_participants
+        self._participants: OrderedDict[str, None] = OrderedDict()
+        self._histograms: dict[tuple[str, str], LatencyHistogram] = {}
+        self._counters: dict[tuple[str, str], float] = {}
+        self._gauges: dict[tuple[str, str], float | Callable[[], float]] = {}
+        # Time of the last occurrence of an event (e.g. "wake") per participant, and the
+        # event time each stage was last measured against so only the first frame counts
+        self._marks: dict[tuple[str, str], float] = {}
+        self._observed: dict[tuple[str, str], float] = {}
+
+    def _touch(self, participant_id: str):
+        if not participant_id:
+            return
+        if participant_id in self._participants:
+            self._participants.move_to_end(participant_id)
+            return
+        self._participants[participant_id] = None
+        while len(self._participants) > self._max_participants:
+            self.forget(next(iter(self._participants)))
+
+    def observe(self, stage: str, participant_id: str, seconds: float) -> LatencyHistogram:
+        self._touch(participant_id)
+        # Every sample also goes into the aggregate for all participants (participant ""),
+        # which is kept when a participant's own series are forgotten
+        for key in {(stage, participant_id), (stage, "")}:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram(self._window)
+            histogram.record(seconds)
+        return self._histograms[(stage, participant_id)]
+
+    def mark(self, event: str, participant_id: str, at: float | None = None):
+        self._touch(participant_id)
+        self._marks[(event, participant_id)] = time.perf_counter() if at is None else at
+
+    def last_mark(self, event: str, participant_id: str) -> float | None:
+        return self._marks.get((event, participant_id))
+
+    def observe_since(self, stage: str, event: str, participant_id: str) -> float | None:
+        """
+        Record the time since `event` for `participant_id` under `stage`, once per occurrence of the event.
+        Returns the latency or None if there is nothing (new) to measure.
+        """
+        marked = self._marks.get((event, participant_id))
+        if marked is None or self._observed.get((stage, participant_id)) == marked:
+            return None
+        self._observed[(stage, participant_id)] = marked
+        latency = time.perf_counter() - marked
+        self.observe(stage, participant_id, latency)
+        return latency
+
+    def increment(self, name: str, participant_id: str = "", value: float = 1):
+        self._touch(participant_id)
+        for key in {(name, participant_id), (name, "")}:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float | Callable[[], float], participant_id: str = ""):
+        """Set a gauge to a value, or to a callable that is read whenever the metrics are rendered."""
+        self._touch(participant_id)
+        self._gauges[(name, participant_id)] = value
+
+    def forget(self, participant_id: str):
+        """Drop everything recorded for a participant (e.g. once it disconnected), the aggregates stay."""
+        if not participant_id:
+            return
+        self._participants.pop(participant_id, None)
+        for store in (self._histograms, self._counters, self._gauges, self._marks, self._observed):
+            for key in [key for key in store if key[1] == participant_id]:
+                del store[key]
+
+    def histogram(self, stage: str, participant_id: str) -> LatencyHistogram | None:
+        return self._histograms.get((stage, participant_id))
+
+    def counter(self, name: str, participant_id: str = "") -> float:
+        return self._counters.get((name, participant_id), 0)
+
+    def render_prometheus(self, prefix: str = "pipecat") -> str:
+        lines = [f"# TYPE {prefix}_stage_latency_seconds summary"]
+        for (stage, participant_id), histogram in sorted(self._histograms.items()):
+            labels = f'stage="{_label(stage)}",participant="{_label(participant_id)}"'
+            summary = histogram.summary()
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'{prefix}_stage_latency_seconds{{{labels},quantile="{quantile}"}} {summary[key]:.6f}')
+            lines.append(f"{prefix}_stage_latency_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"{prefix}_stage_latency_seconds_count{{{labels}}} {histogram.count}")
+
+        for name in sorted({name for name, _ in self._counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for (counter, participant_id), value in sorted(self._counters.items()):
+                if counter == name:
+                    lines.append(f'{prefix}_{name}_total{{participant="{_label(participant_id)}"}} {value:g}')
+
+        for name in sorted({name for name, _ in self._gauges}):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for (gauge, participant_id), value in sorted(self._gauges.items(), key=lambda item: item[0]):
+                if gauge == name:
+                    value = value() if callable(value) else value
+                    lines.append(f'{prefix}_{name}{{participant="{_label(participant_id)}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+
+def _label(value: str) -> str:
+    # Label values are quoted, backslashes, quotes and newlines have to be escaped (text format 0.0.4)
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared by every processor and transport in the process
+metrics = PipelineMetrics()
+
+
+async def serve_metrics(host: str = "localhost", port: int = 9464, registry: PipelineMetrics = metrics):
+    """Serve `registry` in the Prometheus text format on http://host:port/metrics until cancelled."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+            if path.split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", registry.render_prometheus().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\n"
+                         f"Content-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
@@ -1,78 +1,336 @@
 
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from typing import Callable
+from urllib.parse import urlparse
+
 from __init__ import *
-from utils.functions import process_questions_async, process_questions
+from utils.functions import process_questions_async, process_questions, stream_questions_async
+from utils.history_store import SessionHistoryStore
+from utils.startup import VADAnalyzerReserve, startup
+from utils.static_files import StaticFiles
+from utils.connections import HTTPSessionManager, WarmConnectionPool
+from utils.frame_queue import OverflowPolicy, QueueLimits
+from utils.tts_cache import TTSAudioCache
+from utils.wake_tuning import WakeTuner
 
 
 logger.remove(0)
 logger.add(sys.stderr, level="DEBUG")
-message_store = {}
+
+# Chat histories are bounded per session (window / token cap) and across sessions (LRU / TTL),
+# evicted sessions are spilled to HISTORY_SQLITE_PATH if set so they can resume later
+message_store = SessionHistoryStore(
+    max_sessions=int(os.getenv("HISTORY_MAX_SESSIONS", 256)),
+    ttl=float(os.getenv("HISTORY_TTL_SECS", 1800)),
+    max_messages=int(os.getenv("HISTORY_MAX_MESSAGES", 20)),
+    max_tokens=int(os.getenv("HISTORY_MAX_TOKENS")) if os.getenv("HISTORY_MAX_TOKENS") else None,
+    sqlite_path=os.getenv("HISTORY_SQLITE_PATH"))
+
+# Porcupine handles shared by every pipeline in the process (one is leased per connected participant)
+porcupine_pool: PorcupinePool | None = None
+# Worker threads for Porcupine inference (PORCUPINE_WORKERS=0 keeps it on the event loop)
+porcupine_executor: ThreadPoolExecutor | None = None
+# VAD analysis batched across every transport in the process (VAD_BATCH_MAX_SIZE=0 disables it)
+vad_scheduler: VADBatchScheduler | None = None
+# HTTP connections (TTS) kept alive and shared by every pipeline in the process
+http_sessions = HTTPSessionManager()
+# Deepgram live connections opened ahead of time, leased to sessions (STT_POOL_SIZE=0 disables it)
+stt_pool: WarmConnectionPool | None = None
+# Silero analyzers loaded ahead of time for the next connections
+vad_reserve = VADAnalyzerReserve(int(os.getenv("VAD_PREWARM", 1)))
+# Web client, served from memory on the websocket port
+static_files = StaticFiles(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+# Synthesized greetings and other short phrases, in memory and in TTS_CACHE_DIR if set
+tts_cache = TTSAudioCache(max_bytes=int(float(os.getenv("TTS_CACHE_MAX_MB", 32)) * 1024 * 1024),
+                          directory=os.getenv("TTS_CACHE_DIR"),
+                          max_disk_bytes=int(float(os.getenv("TTS_CACHE_DISK_MAX_MB", 512)) * 1024 * 1024))
+
+GREETINGS = ["Hey.", "Hello."]
+
+# Seconds the pipeline stays awake after the wake word, adapted per participant from their
+# wake stats (false wakes, repeats, how long they talk) unless WAKE_ADAPTIVE=0
+WAKE_KEEPALIVE_SECS = float(os.getenv("WAKE_KEEPALIVE_SECS", 20))
+wake_tuner = (WakeTuner(base_keepalive=WAKE_KEEPALIVE_SECS,
+                        min_keepalive=min(WAKE_KEEPALIVE_SECS, float(os.getenv("WAKE_MIN_KEEPALIVE_SECS", 8))),
+                        max_keepalive=max(WAKE_KEEPALIVE_SECS, float(os.getenv("WAKE_MAX_KEEPALIVE_SECS", 60))))
+              if os.getenv("WAKE_ADAPTIVE", "1") != "0" else None)
+
+
+def http_handler(has_capacity: Callable[[], bool] = lambda: True):
+    # Plain HTTP requests on the websocket port: /ready for health checks, everything else is the web client
+    async def process_request(path: str, request_headers):
+        if urlparse(path).path == "/ready":
+            ready = startup.ready.is_set() and has_capacity()
+            return (HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE,
+                    [("Content-Type", "text/plain"), ("Cache-Control", "no-store")],
+                    b"ready\n" if ready else b"startup failed\n" if startup.failed.is_set() else b"not ready\n")
+        return await static_files.process_request(path, request_headers)
+    return process_request
 
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in message_store:
-        message_store[session_id] = ChatMessageHistory()
-    return message_store[session_id]
+    return message_store.get(session_id)
 
 
-# async def call_pipecat(room_url: str, token):
-async def call_pipecat(user_id: str):
-    async with aiohttp.ClientSession() as session:
-        transport = CustomWebsocketServerTransport(
-            params=WebsocketServerParams(
-                audio_out_enabled=True,
-                add_wav_header=True,
-                vad_enabled=True,
-                vad_analyzer=SileroVADAnalyzer(),
-                vad_audio_passthrough=True
-            )
-        )
-        
-
-        tts = ElevenLabsTTSService(
-            aiohttp_session=session,
-            api_key=os.getenv("ELEVENLABS_API_KEY"),
-            voice_id=os.getenv("ELEVENLABS_VOICE_ID"),
-        )
-                
+def profile_neighbours() -> list[float]:
+    # Sensitivity offsets next to the default one (the tuner moves one step at a time)
+    if wake_tuner is None:
+        return []
+    neighbours = [wake_tuner.default_profile - 1, wake_tuner.default_profile + 1]
+    return [wake_tuner.profiles[i] for i in neighbours if 0 <= i < len(wake_tuner.profiles)]
+
+
+def get_porcupine_pool(max_sessions: int = 1) -> PorcupinePool:
+    global porcupine_pool
+    if porcupine_pool is None:
+        # Keyword files for this platform (and keywords.json) from KEYWORD_DIR
+        registry = KeywordRegistry(os.getenv("KEYWORD_DIR", "keyword_files"))
+        # One handle per session, plus room for the preloaded sensitivity profile handles
+        size = int(os.getenv("PORCUPINE_POOL_SIZE", max_sessions + len(profile_neighbours())))
+        porcupine_pool = PorcupinePool(size, registry=registry)
+    return porcupine_pool
+
+
+def get_porcupine_executor() -> ThreadPoolExecutor | None:
+    global porcupine_executor
+    workers = int(os.getenv("PORCUPINE_WORKERS", 0))
+    if porcupine_executor is None and workers > 0:
+        porcupine_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="porcupine")
+    return porcupine_executor
+
+
+def get_stt_pool() -> WarmConnectionPool | None:
+    global stt_pool
+    size = int(os.getenv("STT_POOL_SIZE", 2))
+    if stt_pool is None and size > 0:
+        from __init__ import deepgram_connection_pool
+        stt_pool = deepgram_connection_pool(os.getenv("DEEPGRAM_API_KEY"), size=size)
+    return stt_pool
+
+
+def get_vad_scheduler() -> VADBatchScheduler | None:
+    global vad_scheduler
+    max_batch_size = int(os.getenv("VAD_BATCH_MAX_SIZE", 32))
+    if vad_scheduler is None and max_batch_size > 0:
+        vad_scheduler = VADBatchScheduler(max_batch_size=max_batch_size,
+                                          max_wait=float(os.getenv("VAD_BATCH_MAX_WAIT_MS", 5)) / 1000)
+        metrics.set_gauge("vad_queue_depth", lambda: vad_scheduler.queue_depth)
+    return vad_scheduler
+
+
+def queue_limits() -> QueueLimits | None:
+    # Audio queued per session before and after VAD (INPUT_QUEUE_MAX_FRAMES=0 leaves it unbounded)
+    max_frames = int(os.getenv("INPUT_QUEUE_MAX_FRAMES", 64))
+    if max_frames <= 0:
+        return None
+    return QueueLimits(max_frames, OverflowPolicy(os.getenv("INPUT_QUEUE_POLICY", OverflowPolicy.DROP_OLDEST_SILENCE.value)))
+
+
+def tts_service(session: aiohttp.ClientSession):
+    from __init__ import CachedElevenLabsTTSService
+
+    return CachedElevenLabsTTSService(
+        cache=tts_cache,
+        aiohttp_session=session,
+        api_key=os.getenv("ELEVENLABS_API_KEY"),
+        voice_id=os.getenv("ELEVENLABS_VOICE_ID"),
+        # The chain already hands over whole sentences (or the whole answer), speak each one right away
+        aggregate_sentences=False,
+    )
+
+
+async def prerender_phrases(session: aiohttp.ClientSession):
+    # Greetings and TTS_PRERENDER_PHRASES ("|" separated) are synthesized before the port opens,
+    # with TTS_CACHE_DIR set only the first start makes requests for them
+    if os.getenv("TTS_PRERENDER", "1") == "0":
+        return
+    phrases = GREETINGS + [p for p in os.getenv("TTS_PRERENDER_PHRASES", "").split("|") if p.strip()]
+    try:
+        await asyncio.wait_for(tts_service(session).prerender(phrases), float(os.getenv("TTS_PRERENDER_TIMEOUT_SECS", 15)))
+    except asyncio.TimeoutError:
+        logger.warning("Prerendering the TTS phrases timed out, the rest are synthesized on first use")
+
+
+async def transport_params() -> WebsocketServerParams:
+    # Built per transport, the VAD analyzer keeps state for the one client it listens to
+    return WebsocketServerParams(
+        audio_out_enabled=True,
+        add_wav_header=True,
+        vad_enabled=True,
+        vad_analyzer=await vad_reserve.take(),
+        vad_audio_passthrough=True
+    )
+
+
+async def build_pipeline_task(transport: CustomWebsocketServerTransport,
+                              user_id: str,
+                              session: aiohttp.ClientSession) -> PipelineTask:
+    # Service modules are imported on first use (prewarmed before the port opens, see utils/startup.py)
+    from __init__ import (
+        DeepgramSTTService,
+        PooledDeepgramSTTService,
+        LangchainProcessor,
+        LLMAssistantResponseAggregator,
+        LLMUserResponseAggregator,
+        RunnableGenerator,
+        RunnableLambda,
+        RunnableWithMessageHistory)
+
+    tts = tts_service(session)
+            
+    pool = get_stt_pool()
+    if pool is not None:
+        stt = PooledDeepgramSTTService(pool, api_key=os.getenv("DEEPGRAM_API_KEY"))
+    else:
         stt = DeepgramSTTService(api_key=os.getenv("DEEPGRAM_API_KEY"))
 
 
+    if os.getenv("LLM_STREAMING", "1") == "0":
         chain = RunnableLambda(func=lambda x: process_questions(x),
                                afunc=lambda x: process_questions_async(x, user_id))
-        
-        history_chain = RunnableWithMessageHistory(
-            chain,
-            get_session_history,
-            history_messages_key="chat_history",
-            input_messages_key="input",)
-        lc = LangchainProcessor(history_chain)
-
-        tma_in = LLMUserResponseAggregator()
-        tma_out = LLMAssistantResponseAggregator()
-        pico_wake_word = CustomWakeCheckFilter(20, user_id, keyword_path_mac="keyword_files/hey_pipe_mac.ppn")
-
-
-        pipeline = Pipeline(
-            [
-                transport.input(),      # Transport user input
-                pico_wake_word,         # Porcupine wake word
-                stt,                    # STT
-                tma_in,                 # User responses
-                lc,                     # Langchain
-                tts,                    # TTS
-                transport.output(),     # Transport bot output
-                tma_out,                # Assistant spoken responses
-            ]
-        )
-
-        task = PipelineTask(pipeline, PipelineParams(allow_interruptions=True))
-
-        @transport.event_handler("on_client_connected")
-        async def on_client_connected(transport, client):
-            lc.set_participant_id(user_id)
-            await tts.say(random.choice(["Hey.", "Hello."]))
-
-        runner = PipelineRunner()
-
-        await runner.run(task)
+    else:
+        # LangchainProcessor streams the chain, every sentence becomes a TextFrame for TTS
+        async def answer(questions):
+            async for sentence in stream_questions_async(questions, user_id):
+                yield sentence
+
+        chain = RunnableGenerator(answer)
+    
+    history_chain = RunnableWithMessageHistory(
+        chain,
+        get_session_history,
+        history_messages_key="chat_history",
+        input_messages_key="input",)
+    lc = LangchainProcessor(history_chain)
+
+    tma_in = LLMUserResponseAggregator()
+    tma_out = LLMAssistantResponseAggregator()
+    pico_wake_word = CustomWakeCheckFilter(WAKE_KEEPALIVE_SECS, user_id,
+                                           pool=get_porcupine_pool(),
+                                           executor=get_porcupine_executor(),
+                                           pre_roll_secs=float(os.getenv("WAKE_PRE_ROLL_SECS", 0)),
+                                           scan_pre_roll_secs=float(os.getenv("WAKE_SCAN_PRE_ROLL_SECS", 0.5)),
+                                           energy_gate_dbfs=float(os.getenv("WAKE_ENERGY_GATE_DBFS"))
+                                           if os.getenv("WAKE_ENERGY_GATE_DBFS") else None,
+                                           tuner=wake_tuner)
+
+
+    pipeline = Pipeline(
+        [
+            transport.input(),      # Transport user input
+            pico_wake_word,         # Porcupine wake word
+            stt,                    # STT
+            LatencyProbe("wake_to_transcript", (TranscriptionFrame,)),
+            tma_in,                 # User responses
+            lc,                     # Langchain
+            LatencyProbe("wake_to_llm_response", (TextFrame,)),
+            tts,                    # TTS
+            transport.output(),     # Transport bot output
+            tma_out,                # Assistant spoken responses
+        ]
+    )
+
+    task = PipelineTask(pipeline, PipelineParams(allow_interruptions=True))
+
+    @transport.event_handler("on_client_connected")
+    async def on_client_connected(transport, client):
+        lc.set_participant_id(transport.participant_id(client) or user_id)
+        await tts.say(random.choice(GREETINGS))
+
+    return task
+
+
+# async def call_pipecat(room_url: str, token):
+def start_metrics_server():
+    # METRICS_PORT exposes the latency histograms and counters in the Prometheus text format
+    if os.getenv("METRICS_PORT"):
+        asyncio.get_running_loop().create_task(serve_metrics(os.getenv("METRICS_HOST", "localhost"),
+                                                             int(os.getenv("METRICS_PORT"))))
+
+
+async def prewarm(max_sessions: int = 1):
+    # STARTUP_PREWARM=0 skips it, services and models are then loaded by the first connection
+    if os.getenv("STARTUP_PREWARM", "1") == "0":
+        startup.ready.set()
+        return
+    pool = get_porcupine_pool(max_sessions)
+    # Handles for the sensitivity profiles next to the default one
+    profiles = [pool.default_keyword_set.adjusted(offset) for offset in profile_neighbours()]
+    await startup.prewarm(pool, max_sessions, vad_reserve, profiles)
+
+    # Batching only works with Silero analyzers, refuse to start rather than fall back silently
+    scheduler = get_vad_scheduler()
+    if scheduler is not None and vad_reserve.peek() is not None:
+        scheduler.check(vad_reserve.peek())
+
+
+@asynccontextmanager
+async def backend_connections():
+    # The HTTP session, its connections to HTTP_WARM_URLS and the STT pool are opened once and
+    # reused by every pipeline, so sessions don't pay for the handshakes on their first utterance
+    global stt_pool
+    session = http_sessions.get()
+    warm_urls = [url for url in os.getenv("HTTP_WARM_URLS", "https://api.elevenlabs.io").split(",") if url]
+    pool = get_stt_pool()
+    if pool is not None:
+        pool.start()
+    try:
+        await http_sessions.warm(warm_urls)
+        await prerender_phrases(session)
+        yield session
+    finally:
+        if stt_pool is not None:
+            await stt_pool.close()
+            stt_pool = None
+        await http_sessions.close()
+
+
+async def call_pipecat(user_id: str):
+    start_metrics_server()
+    await prewarm()
+    try:
+        async with backend_connections() as session:
+            transport = CustomWebsocketServerTransport(params=await transport_params(),
+                                                       vad_scheduler=get_vad_scheduler(),
+                                                       process_request=http_handler(),
+                                                       queue_limits=queue_limits())
+            task = await build_pipeline_task(transport, user_id, session)
+
+            runner = PipelineRunner()
+
+            await runner.run(task)
+    finally:
+        # Spills the histories still in memory to HISTORY_SQLITE_PATH (if set) and closes the file
+        message_store.close()
+
+
+# Serve many clients from one process, each connection gets its own pipeline
+async def serve_pipecat(user_id: str,
+                        max_sessions: int = 32,
+                        host: str = "localhost",
+                        port: int = 8765,
+                        on_sessions_changed: Callable[[int, int], None] | None = None):
+    start_metrics_server()
+    # Every session leases a Porcupine handle, don't admit more sessions than the pool can serve
+    pool = get_porcupine_pool(max_sessions)
+    if pool.size < max_sessions:
+        logger.warning(f"Porcupine pool has {pool.size} handles, serving at most {pool.size} sessions instead of {max_sessions}")
+        max_sessions = pool.size
+    await prewarm(max_sessions)
+    try:
+        async with backend_connections() as session:
+            server = CustomWebsocketSessionServer(
+                lambda transport: build_pipeline_task(transport, user_id, session),
+                host=host,
+                port=port,
+                params_factory=transport_params,
+                max_sessions=max_sessions,
+                vad_scheduler=get_vad_scheduler(),
+                process_request=http_handler(lambda: server.sessions < server.max_sessions and pool.available > 0),
+                queue_limits=queue_limits(),
+                on_sessions_changed=on_sessions_changed)
 
+            await server.run()
+    finally:
+        message_store.close()
@@ -0,0 +1,104 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+from typing import AsyncIterable, AsyncIterator
+
+SENTENCE_END = ".!?"
+CLAUSE_END = ",;:"
+# Closing quotes and brackets that can follow the end of a sentence ("Really?" she said.)
+CLOSING = "\"')]”’"
+# Words whose trailing period does not end a sentence
+ABBREVIATIONS = frozenset({"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "approx"})
+
+
+class SentenceChunker:
+    """
+    Cuts a stream of LLM tokens into sentence sized chunks, so TTS can start on the first
+    sentence while the rest is still being generated.
+
+    A sentence ends at `.`, `!` or `?` (plus closing quotes) followed by whitespace, or at a
+    newline. The whitespace is needed to tell "3.5" or "e.g." apart from the end of a sentence,
+    so a chunk is only cut once the token after it arrives (or on `flush`). Sentences longer
+    than `max_chars` are cut at the last clause (`,` `;` `:`) or word boundary instead.
+    Chunks are slices of the input with the whitespace kept, joined they give back the full
+    text (that is what ends up in the chat history).
+    """
+    def __init__(self, max_chars: int = 200):
+        if max_chars < 1:
+            raise ValueError("max_chars must be atleast 1.")
+
+        self.max_chars = max_chars
+        self._text = ""
+        # Characters of `_text` already checked for a boundary
+        self._scanned = 0
+
+    def push(self, token: str) -> list[str]:
+        """Add a token, return the chunks it completed."""
+        self._text += token
+        chunks = []
+
+        i = self._scanned
+        while i < len(self._text):
+            char = self._text[i]
+            if char == "\n" or (char.isspace() and self._ends_sentence(i)):
+                chunks.append(self._text[:i + 1])
+                self._text = self._text[i + 1:]
+                i = 0
+                continue
+            i += 1
+
+        while len(self._text) > self.max_chars:
+            cut = self._long_sentence_cut()
+            if cut is None:
+                break
+            chunks.append(self._text[:cut])
+            self._text = self._text[cut:]
+
+        self._scanned = len(self._text)
+        return chunks
+
+    def flush(self) -> str:
+        """Return whatever is left at the end of the stream."""
+        text = self._text
+        self._text = ""
+        self._scanned = 0
+        return text
+
+    def _ends_sentence(self, i: int) -> bool:
+        # `i` is whitespace, look at what came before it
+        j = i - 1
+        while j >= 0 and self._text[j] in CLOSING:
+            j -= 1
+        if j < 0 or self._text[j] not in SENTENCE_END:
+            return False
+        if self._text[j] != ".":
+            return True
+
+        words = self._text[:j].split()
+        if not words:
+            return True
+        word = words[-1].lstrip("\"'([“‘").lower()
+        # Abbreviations and initials (J. Smith)
+        return word not in ABBREVIATIONS and not (len(word) == 1 and word.isalpha())
+
+    def _long_sentence_cut(self) -> int | None:
+        head = self._text[:self.max_chars + 1]
+        clause = max(head.rfind(mark + " ") for mark in CLAUSE_END)
+        if clause > 0:
+            return clause + 2
+        space = head.rfind(" ")
+        return space + 1 if space > 0 else None
+
+
+async def sentence_stream(tokens: AsyncIterable[str], max_chars: int = 200) -> AsyncIterator[str]:
+    """Re-chunk an async stream of tokens into sentences (see SentenceChunker)."""
+    chunker = SentenceChunker(max_chars)
+    async for token in tokens:
+        for chunk in chunker.push(token):
+            yield chunk
+    rest = chunker.flush()
+    if rest:
+        yield rest
@@ -0,0 +1,141 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+import threading
+import time
+
+import __init__ as deps
+from __init__ import PorcupinePool, logger, metrics
+
+
+class VADAnalyzerReserve:
+    """
+    Silero analyzers created ahead of time (loading the model takes a while), so a new
+    connection takes a ready one instead of loading the model while the client waits.
+    Analyzers keep per-client state, so each one is handed out once and the reserve is topped
+    back up to `size` in the background.
+    """
+    def __init__(self, size: int = 1):
+        self.size = size
+        self._analyzers = []
+        self._lock = threading.Lock()
+        self._filling = False
+
+    def __len__(self) -> int:
+        return len(self._analyzers)
+
+    def fill(self):
+        """Create analyzers until the reserve is full (blocking, run it on an executor)."""
+        with self._lock:
+            if self._filling:
+                return
+            self._filling = True
+        try:
+            while len(self._analyzers) < self.size:
+                analyzer = deps.SileroVADAnalyzer()
+                with self._lock:
+                    self._analyzers.append(analyzer)
+        finally:
+            with self._lock:
+                self._filling = False
+
+    def peek(self):
+        """An analyzer from the reserve without taking it, None while the reserve is empty."""
+        with self._lock:
+            return self._analyzers[-1] if self._analyzers else None
+
+    async def take(self):
+        """Hand out an analyzer, loading one on an executor if the reserve ran dry, and top the reserve back up."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            analyzer = self._analyzers.pop() if self._analyzers else None
+        if analyzer is None:
+            # Loading the model blocks for a while, keep the other sessions on the loop running
+            analyzer = await loop.run_in_executor(None, deps.SileroVADAnalyzer)
+
+        loop.run_in_executor(None, self.fill).add_done_callback(self._filled)
+        return analyzer
+
+    @staticmethod
+    def _filled(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Refilling the Silero analyzer reserve failed: {future.exception()}")
+
+
+class Startup:
+    """
+    Prewarms the process before the websocket port opens: imports the service modules that
+    `__init__.py` defers, creates Porcupine handles and loads Silero analyzers, all in the
+    background and concurrently. `ready` is set once it is done, unless one of the
+    `CRITICAL_STEPS` failed (then `failed` is set instead and the process never reports ready),
+    and `timings` / `report()` break down where the startup time went.
+    """
+    # Without these no session can work, the Silero reserve is only a head start (take() loads on demand)
+    CRITICAL_STEPS = ("service imports", "porcupine handles")
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.failed = threading.Event()
+        # Seconds per prewarm step, plus "prewarm" for the whole (concurrent) run
+        self.timings: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        metrics.set_gauge("ready", lambda: float(self.ready.is_set()))
+
+    async def prewarm(self,
+                      porcupine_pool: PorcupinePool | None = None,
+                      porcupine_handles: int | None = None,
+                      vad_reserve: VADAnalyzerReserve | None = None,
+                      porcupine_profiles: list | None = None):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+
+        steps = {"service imports": self._import_services}
+        if porcupine_pool is not None:
+            def porcupine_handles_step():
+                # The default keywords first (one handle per session), then one per sensitivity profile
+                # in the room that is left
+                porcupine_pool.prefill(porcupine_handles)
+                porcupine_pool.preload(porcupine_profiles or [])
+            steps["porcupine handles"] = porcupine_handles_step
+        if vad_reserve is not None:
+            steps["silero analyzers"] = vad_reserve.fill
+
+        await asyncio.gather(*(loop.run_in_executor(None, self._timed, name, step) for name, step in steps.items()))
+
+        self.timings["prewarm"] = time.perf_counter() - start
+        logger.info(self.report())
+        critical = [name for name in self.CRITICAL_STEPS if name in self.errors]
+        if critical:
+            self.failed.set()
+            logger.error(f"Startup failed ({', '.join(critical)}), not reporting ready")
+        else:
+            self.ready.set()
+
+    def _timed(self, name: str, step):
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            # Recorded here, prewarm() decides whether the process can still serve sessions
+            self.errors[name] = str(e)
+            logger.error(f"Prewarming {name} failed: {e}")
+        self.timings[name] = time.perf_counter() - start
+
+    @staticmethod
+    def _import_services():
+        for name in deps.LAZY_IMPORTS:
+            getattr(deps, name)
+
+    def report(self) -> str:
+        lines = ["Startup breakdown:"]
+        lines += [f"  import {module}: {secs * 1000:.0f}ms" for module, secs in deps.import_times.items()]
+        lines += [f"  {name}: {secs * 1000:.0f}ms" + (" (failed)" if name in self.errors else "")
+                  for name, secs in self.timings.items()]
+        return "\n".join(lines)
+
+
+startup = Startup()
@@ -0,0 +1,130 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from urllib.parse import unquote, urlparse
+
+from loguru import logger
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+
+@dataclass
+class StaticAsset:
+    body: bytes
+    content_type: str
+    etag: str
+    cache_control: str
+    # Content-Encoding -> compressed body, only kept when smaller than the original
+    encoded: dict[str, bytes] = field(default_factory=dict)
+
+
+class StaticFiles:
+    """
+    Serves the files of a directory from memory, on the websocket server's port through its
+    `process_request` hook, so the page and the audio share one port and one event loop.
+
+    Files are read once (restart or call `load()` to pick up changes) along with their gzip
+    and brotli variants: `<file>.gz` / `<file>.br` next to the file if they exist, otherwise
+    compressed here (brotli needs `pip install brotli`). Responses carry an ETag, so browsers
+    revalidate with a 304 instead of downloading again, and a Cache-Control header (HTML is
+    always revalidated, other assets are cached for `max_age` seconds).
+    """
+    ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+    def __init__(self, directory: str, index: str = "index.html", max_age: int = 3600):
+        self.directory = directory
+        self.index = index
+        self.max_age = max_age
+        self._assets: dict[str, StaticAsset] = {}
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    def load(self):
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith((".gz", ".br")):
+                    continue
+                path = os.path.join(root, name)
+                url = "/" + os.path.relpath(path, self.directory).replace(os.sep, "/")
+                assets[url] = self._load_asset(path)
+        self._assets = assets
+        logger.debug(f"Loaded {len(assets)} static files from {self.directory}")
+
+    def _load_asset(self, path: str) -> StaticAsset:
+        with open(path, "rb") as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        cache_control = "no-cache" if content_type.startswith("text/html") else f"public, max-age={self.max_age}"
+        asset = StaticAsset(body, content_type, f'"{hashlib.sha1(body).hexdigest()}"', cache_control)
+
+        for encoding, suffix in self.ENCODINGS:
+            if os.path.exists(path + suffix):
+                with open(path + suffix, "rb") as f:
+                    encoded = f.read()
+            elif encoding == "gzip":
+                encoded = gzip.compress(body, 9, mtime=0)
+            elif brotli is not None:
+                encoded = brotli.compress(body)
+            else:
+                continue
+            if len(encoded) < len(body):
+                asset.encoded[encoding] = encoded
+        return asset
+
+    async def process_request(self, path: str, request_headers) -> tuple[HTTPStatus, list, bytes] | None:
+        """
+        `process_request` hook for `websockets.serve`: answers plain HTTP requests with the
+        static files and returns None for websocket upgrades so the handshake goes on. A coroutine,
+        websockets deprecates synchronous hooks.
+        """
+        if request_headers.get("Upgrade", "").lower() == "websocket":
+            return None
+
+        url = unquote(urlparse(path).path)
+        if url.endswith("/"):
+            url += self.index
+        # Only preloaded files can be served, so paths can not escape the directory
+        asset = self._assets.get(url)
+        if asset is None:
+            return HTTPStatus.NOT_FOUND, [("Content-Type", "text/plain")], b"Not Found\n"
+
+        headers = [("ETag", asset.etag), ("Cache-Control", asset.cache_control), ("Vary", "Accept-Encoding")]
+        if asset.etag in request_headers.get("If-None-Match", ""):
+            return HTTPStatus.NOT_MODIFIED, headers, b""
+
+        body = asset.body
+        accepted = self._accepted_encodings(request_headers.get("Accept-Encoding", ""))
+        for encoding, _ in self.ENCODINGS:
+            if encoding in accepted and encoding in asset.encoded:
+                body = asset.encoded[encoding]
+                headers.append(("Content-Encoding", encoding))
+                break
+        headers.append(("Content-Type", asset.content_type))
+        return HTTPStatus.OK, headers, body
+
+    @staticmethod
+    def _accepted_encodings(header: str) -> set[str]:
+        accepted = set()
+        for item in header.split(","):
+            encoding, _, params = item.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0"):
+                accepted.add(encoding.strip().lower())
+        return accepted
@@ -0,0 +1,251 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+import multiprocessing
+import os
+
+from collections import OrderedDict
+from typing import Callable
+from urllib.parse import parse_qs, urlparse
+
+from loguru import logger
+
+
+class WorkerLoad:
+    """
+    Running sessions and session capacity of every worker, in memory shared with the worker
+    processes. Each worker reports its own slot whenever a session starts or ends, the router
+    reads all of them to place new connections.
+    """
+    def __init__(self, workers: int, context=multiprocessing):
+        self._sessions = context.RawArray("i", workers)
+        self._capacity = context.RawArray("i", workers)
+
+    def report(self, index: int, sessions: int, capacity: int):
+        self._sessions[index] = sessions
+        self._capacity[index] = capacity
+
+    def sessions(self, index: int) -> int:
+        return self._sessions[index]
+
+    def has_room(self, index: int) -> bool:
+        # A worker that has not reported yet (still starting) is taken to have room
+        return self._capacity[index] == 0 or self._sessions[index] < self._capacity[index]
+
+
+def serve_worker(index: int, host: str, port: int, load: WorkerLoad, user_id: str, max_sessions: int):
+    """Default worker: the session server (websocket pipelines and the web client) on a private port."""
+    from utils.pipe import serve_pipecat
+
+    # Every worker has its own metrics, served on METRICS_PORT + 1 + index
+    if os.getenv("METRICS_PORT"):
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + 1 + index)
+    asyncio.run(serve_pipecat(user_id, max_sessions, host, port,
+                              on_sessions_changed=lambda sessions, capacity: load.report(index, sessions, capacity)))
+
+
+class SessionRouter:
+    """
+    TCP front on the public port that hands every connection to one of the workers and relays
+    bytes both ways, so a websocket session stays on the worker it started on. New connections
+    go to the least loaded live worker that has room for another session, by the session counts
+    the workers report in `load` (or the router's own open connections when they are higher,
+    which covers sessions still being set up). A participant reconnecting (`?participant_id=` /
+    `?user_id=` in the request) goes back to the worker it used last, where its chat history is,
+    as long as that worker has room. Only when every worker is full does a connection go to a
+    full one, which refuses it with 1013.
+    """
+    def __init__(self,
+                 host: str,
+                 port: int,
+                 backends: list[tuple[str, int]],
+                 load: WorkerLoad | None = None,
+                 affinity_size: int = 10000,
+                 header_timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.backends = backends
+        self.connections = [0] * len(backends)
+        self.alive = [False] * len(backends)
+        self.load = load
+        self._affinity_size = affinity_size
+        self._header_timeout = header_timeout
+        self._affinity: OrderedDict[str, int] = OrderedDict()
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Routing {self.host}:{self.port} to {len(self.backends)} workers")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _load(self, index: int) -> int:
+        if self.load is None:
+            return self.connections[index]
+        return max(self.load.sessions(index), self.connections[index])
+
+    def pick(self, participant_id: str | None) -> int | None:
+        live = [i for i, alive in enumerate(self.alive) if alive]
+        if not live:
+            return None
+        candidates = [i for i in live if self.load is None or self.load.has_room(i)] or live
+
+        if participant_id:
+            index = self._affinity.get(participant_id)
+            if index in candidates:
+                self._affinity.move_to_end(participant_id)
+                return index
+
+        index = min(candidates, key=self._load)
+        if participant_id:
+            self._affinity[participant_id] = index
+            while len(self._affinity) > self._affinity_size:
+                self._affinity.popitem(last=False)
+        return index
+
+    @staticmethod
+    def _participant_id(request_line: bytes) -> str | None:
+        parts = request_line.split(b" ")
+        if len(parts) < 2:
+            return None
+        query = parse_qs(urlparse(parts[1].decode("latin-1")).query)
+        for key in ("participant_id", "user_id"):
+            if query.get(key):
+                return query[key][0]
+        return None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        backend_writer = None
+        index = None
+        try:
+            # Only the request line is read here, the rest is relayed untouched
+            request_line = await asyncio.wait_for(reader.readuntil(b"\r\n"), self._header_timeout)
+            index = self.pick(self._participant_id(request_line))
+            if index is None:
+                writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                return
+
+            self.connections[index] += 1
+            backend_reader, backend_writer = await asyncio.open_connection(*self.backends[index])
+            backend_writer.write(request_line)
+            await asyncio.gather(self._relay(reader, backend_writer), self._relay(backend_reader, writer))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            pass
+        except OSError as e:
+            logger.warning(f"Could not reach worker {index}: {e}")
+        finally:
+            if index is not None and backend_writer is not None:
+                self.connections[index] -= 1
+            for w in (writer, backend_writer):
+                if w is not None:
+                    w.close()
+
+    @staticmethod
+    async def _relay(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+            if writer.can_write_eof():
+                writer.write_eof()
+        except (ConnectionError, OSError):
+            writer.close()
+
+
+class Supervisor:
+    """
+    Runs `workers` worker processes, each with its own event loop, pipelines and Porcupine/Silero
+    handles on a private port (`worker_base_port` + index), behind a SessionRouter on the public
+    port, so the CPU heavy work spreads over the cores. Workers that exit are restarted.
+
+    `target(index, host, port, load, *args)` runs a worker and reports its sessions to the
+    router with `load.report(index, sessions, capacity)`, it has to be a module level function
+    (workers are started with the spawn method, a fork would inherit the supervisor's loop and
+    the native libraries' threads).
+    """
+    def __init__(self,
+                 workers: int,
+                 target: Callable = serve_worker,
+                 args: tuple = (),
+                 host: str = "localhost",
+                 port: int = 8765,
+                 worker_base_port: int | None = None,
+                 restart_delay: float = 1.0):
+        if workers < 1:
+            raise ValueError("Atleast one worker is required.")
+
+        self.workers = workers
+        self._target = target
+        self._args = args
+        self._host = host
+        self._restart_delay = restart_delay
+        base_port = worker_base_port or port + 1
+        self._ports = [base_port + i for i in range(workers)]
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: list[multiprocessing.Process | None] = [None] * workers
+        self.load = WorkerLoad(workers, self._context)
+        self.router = SessionRouter(host, port, [("127.0.0.1", p) for p in self._ports], self.load)
+        self._stop_event = asyncio.Event()
+
+    def _spawn(self, index: int):
+        # A restarted worker starts with no sessions, whatever its predecessor last reported
+        self.load.report(index, 0, 0)
+        process = self._context.Process(target=self._target,
+                                        args=(index, "127.0.0.1", self._ports[index], self.load, *self._args),
+                                        name=f"pipecat-worker-{index}",
+                                        daemon=True)
+        process.start()
+        self._processes[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid}) on port {self._ports[index]}")
+
+    async def _wait_listening(self, index: int):
+        # The router only sends connections to a worker once its port is open (after its prewarm)
+        while not self._stop_event.is_set() and self._processes[index].is_alive():
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self._ports[index])
+                writer.close()
+                self.router.alive[index] = True
+                return
+            except OSError:
+                await asyncio.sleep(0.1)
+
+    async def run(self):
+        await self.router.start()
+        try:
+            for index in range(self.workers):
+                self._spawn(index)
+            waiting = {index: asyncio.get_running_loop().create_task(self._wait_listening(index))
+                       for index in range(self.workers)}
+
+            while not self._stop_event.is_set():
+                for index, process in enumerate(self._processes):
+                    if process.is_alive() or not waiting[index].done():
+                        continue
+                    self.router.alive[index] = False
+                    logger.warning(f"Worker {index} exited with code {process.exitcode}, restarting it")
+                    await asyncio.sleep(self._restart_delay)
+                    self._spawn(index)
+                    waiting[index] = asyncio.get_running_loop().create_task(self._wait_listening(index))
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), 0.5)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.router.stop()
+            for process in self._processes:
+                if process is not None and process.is_alive():
+                    process.terminate()
+            for process in self._processes:
+                if process is not None:
+                    process.join(5)
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,154 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+import asyncio
+import hashlib
+import os
+import threading
+
+from collections import OrderedDict
+
+from utils.metrics import PipelineMetrics, metrics
+
+from loguru import logger
+
+
+class TTSAudioCache:
+    """
+    Content-addressed cache of synthesized audio: the key is a hash of the text (whitespace
+    normalized), the voice, the model and the audio format, so the same phrase said by the
+    same voice is only synthesized once.
+
+    Audio is kept in memory up to `max_bytes` (least recently used first out) and, if
+    `directory` is set, on disk up to `max_disk_bytes` (one file per key, so it survives
+    restarts and is shared by worker processes). Disk reads and writes run in the default
+    executor. Hits, disk hits and misses are counted as `tts_cache_hits`,
+    `tts_cache_disk_hits` and `tts_cache_misses`.
+    """
+    def __init__(self,
+                 max_bytes: int = 32 * 1024 * 1024,
+                 directory: str | None = None,
+                 max_disk_bytes: int = 512 * 1024 * 1024,
+                 registry: PipelineMetrics = metrics):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._registry = registry
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        # Files on disk and their sizes, oldest use first
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_disk_index()
+        registry.set_gauge("tts_cache_bytes", lambda: self._memory_bytes)
+
+    @staticmethod
+    def key(text: str, voice_id: str, model: str, audio_format: str) -> str:
+        text = " ".join(text.split())
+        return hashlib.sha256("\0".join((text, voice_id or "", model, audio_format)).encode()).hexdigest()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._memory or key in self._disk
+
+    async def get(self, key: str) -> bytes | None:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self._registry.increment("tts_cache_hits")
+            return audio
+
+        if key in self._disk:
+            audio = await asyncio.get_running_loop().run_in_executor(None, self._read_disk, key)
+            if audio is not None:
+                self._remember(key, audio)
+                self._registry.increment("tts_cache_hits")
+                self._registry.increment("tts_cache_disk_hits")
+                return audio
+
+        self._registry.increment("tts_cache_misses")
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        if not audio:
+            return
+        self._remember(key, audio)
+        if self.directory and key not in self._disk:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_disk, key, audio)
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".pcm")
+
+    def _load_disk_index(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".pcm"):
+                    stat = os.stat(os.path.join(root, name))
+                    files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self._disk_bytes += size
+        logger.debug(f"TTS cache has {len(self._disk)} phrases ({self._disk_bytes / 1e6:.1f}MB) in {self.directory}")
+
+    def _read_disk(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+            # The modification time orders the files for eviction after a restart
+            os.utime(self._path(key))
+        except OSError:
+            with self._disk_lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        with self._disk_lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return audio
+
+    def _write_disk(self, key: str, audio: bytes):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name and renamed, so readers never see a partial file
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(audio)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write {path} to the TTS cache: {e}")
+            return
+
+        with self._disk_lock:
+            self._disk_bytes += len(audio) - self._disk.pop(key, 0)
+            self._disk[key] = len(audio)
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                evicted, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                try:
+                    os.remove(self._path(evicted))
+                except OSError:
+                    pass
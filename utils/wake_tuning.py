@@ -0,0 +1,168 @@
+#
+# Copyright (c) 2024, Ayman Sah
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+from collections import deque
+
+# Sensitivity offsets applied to every keyword of a participant's set, strictest first
+SENSITIVITY_PROFILES = (-0.2, -0.1, 0.0, 0.1, 0.2)
+
+
+def recent_rate(values: deque[bool], count: int) -> float:
+    """Share of True among the last `count` values."""
+    recent = list(values)[-count:] if count > 0 else []
+    return sum(recent) / len(recent) if recent else 0.0
+
+
+class WakeStats:
+    """
+    Recent wake word history of one participant, in fixed-size rings (the last `history`
+    wakes): when each wake happened, how much the participant said in the keepalive window
+    after it and when they stopped, whether the window was an immediate cancel (next to no
+    speech after the wake, most likely a false wake) and whether the wake was a repeat: the
+    participant said the keyword again right after a window ended (the window was too short)
+    or right after a keyword length utterance that did not wake the filter (a missed wake).
+    """
+    __slots__ = ("repeat_secs", "min_speech_secs", "keyword_secs",
+                 "detections", "speech", "speech_end", "cancelled", "rewoken", "missed", "near_misses",
+                 "wakes", "windows_since_change", "_wake_time", "_window_speech", "_window_speech_end",
+                 "_last_window_end")
+
+    def __init__(self,
+                 history: int = 32,
+                 repeat_secs: float = 5.0,
+                 min_speech_secs: float = 0.5,
+                 keyword_secs: tuple[float, float] = (0.3, 1.5)):
+        self.repeat_secs = repeat_secs
+        self.min_speech_secs = min_speech_secs
+        self.keyword_secs = keyword_secs
+
+        self.detections: deque[float] = deque(maxlen=history)
+        self.speech: deque[float] = deque(maxlen=history)
+        self.speech_end: deque[float] = deque(maxlen=history)
+        self.cancelled: deque[bool] = deque(maxlen=history)
+        self.rewoken: deque[bool] = deque(maxlen=history)
+        self.missed: deque[bool] = deque(maxlen=history)
+        self.near_misses: deque[float] = deque(maxlen=8)
+        self.wakes = 0
+        self.windows_since_change = 0
+
+        self._wake_time: float | None = None
+        self._window_speech = 0.0
+        self._window_speech_end = 0.0
+        self._last_window_end: float | None = None
+
+    @property
+    def awake(self) -> bool:
+        return self._wake_time is not None
+
+    def on_wake(self, now: float):
+        self.rewoken.append(self._last_window_end is not None and now - self._last_window_end <= self.repeat_secs)
+        self.missed.append(any(now - t <= self.repeat_secs for t in self.near_misses))
+        self.detections.append(now)
+        self.wakes += 1
+        self._wake_time = now
+        self._window_speech = 0.0
+        self._window_speech_end = 0.0
+
+    def on_speech(self, start: float, end: float):
+        """A speech segment (or the part of one so far) from `start` to `end`."""
+        if self._wake_time is not None:
+            start = max(start, self._wake_time)
+            if end > start:
+                self._window_speech += end - start
+                self._window_speech_end = end - self._wake_time
+        elif self.keyword_secs[0] <= end - start <= self.keyword_secs[1]:
+            self.near_misses.append(end)
+
+    def on_window_end(self, now: float) -> bool:
+        """Close the keepalive window of the last wake, returns whether it was an immediate cancel."""
+        if self._wake_time is None:
+            return False
+        cancelled = self._window_speech < self.min_speech_secs
+        self.speech.append(self._window_speech)
+        self.speech_end.append(self._window_speech_end)
+        self.cancelled.append(cancelled)
+        self.windows_since_change += 1
+        self._wake_time = None
+        self._last_window_end = now
+        return cancelled
+
+    @property
+    def false_wake_rate(self) -> float:
+        return recent_rate(self.cancelled, len(self.cancelled))
+
+    @property
+    def rewake_rate(self) -> float:
+        return recent_rate(self.rewoken, len(self.rewoken))
+
+    @property
+    def missed_rate(self) -> float:
+        return recent_rate(self.missed, len(self.missed))
+
+
+class WakeTuner:
+    """
+    Picks a participant's keepalive window and sensitivity profile from their WakeStats.
+
+    The window follows how long the participant keeps talking after a wake: the 90th
+    percentile of where their speech ended in past windows (windows that were cancels are
+    ignored) plus `margin_secs`, stretched by the share of wakes that came right after a
+    window ended, within
+    [`min_keepalive`, `max_keepalive`]. Until `min_windows` windows were seen it stays at
+    `base_keepalive`.
+
+    The profile (an index into `profiles`, sensitivity offsets from strictest to most lenient)
+    moves one step stricter when more than `false_wake_rate` of the recent windows were
+    cancels, and one step more lenient when more than `missed_rate` of the wakes followed a
+    missed wake without many cancels. After a change it waits for `min_windows` new windows.
+    """
+    def __init__(self,
+                 base_keepalive: float = 20.0,
+                 min_keepalive: float = 8.0,
+                 max_keepalive: float = 60.0,
+                 margin_secs: float = 2.0,
+                 profiles: tuple[float, ...] = SENSITIVITY_PROFILES,
+                 min_windows: int = 5,
+                 false_wake_rate: float = 0.4,
+                 missed_rate: float = 0.3):
+        if not min_keepalive <= base_keepalive <= max_keepalive:
+            raise ValueError("Base keepalive must be between the minimum and maximum keepalive.")
+        if 0.0 not in profiles:
+            raise ValueError("Profiles must include the configured sensitivities (offset 0).")
+
+        self.base_keepalive = base_keepalive
+        self.min_keepalive = min_keepalive
+        self.max_keepalive = max_keepalive
+        self.margin_secs = margin_secs
+        self.profiles = tuple(sorted(profiles))
+        self.default_profile = self.profiles.index(0.0)
+        self.min_windows = min_windows
+        self.false_wake_rate = false_wake_rate
+        self.missed_rate = missed_rate
+
+    def keepalive(self, stats: WakeStats) -> float:
+        ends = sorted(end for end, cancelled in zip(stats.speech_end, stats.cancelled) if not cancelled)
+        if len(ends) < self.min_windows:
+            return self.base_keepalive
+        p90 = ends[min(len(ends) - 1, int(0.9 * len(ends)))]
+        window = (p90 + self.margin_secs) * (1 + stats.rewake_rate)
+        return min(self.max_keepalive, max(self.min_keepalive, window))
+
+    def profile(self, stats: WakeStats, current: int) -> int:
+        # Only the windows since the last change count, the new profile is judged on its own
+        windows = stats.windows_since_change
+        if windows < self.min_windows:
+            return current
+        false_wakes = recent_rate(stats.cancelled, windows)
+        missed = recent_rate(stats.missed, windows)
+        if false_wakes > self.false_wake_rate and current > 0:
+            current -= 1
+        elif missed > self.missed_rate and false_wakes <= self.false_wake_rate / 2 and current < len(self.profiles) - 1:
+            current += 1
+        else:
+            return current
+        stats.windows_since_change = 0
+        return current